@@ -1,6 +1,5 @@
-# Apply time setting to all nodes
-for node in ll.Objects:
-    set_node_times(node)
+# Set absoluteTime for all nodes in a single post-order pass from tips to root
+set_node_times(ll, strain_to_decimal_year, verbose=True)
 
 # Check how many nodes are using default values
 nodes_using_2020 = 0
@@ -38,37 +37,8 @@ if nodes_using_2010 > 0:
     print(f"\n⚠️  {nodes_using_2010} internal nodes couldn't calculate times from children!")
 
 print(f"Total nodes# Set absoluteTime for all nodes based on tree structure")
-def set_node_times(node):
-    if node.branchType == 'leaf':
-        if hasattr(node, 'name') and node.name:
-            decimal_year = strain_to_decimal_year.get(node.name, None)
-            if decimal_year is not None:
-                node.absoluteTime = decimal_year
-                node.time_source = 'metadata'
-            else:
-                node.absoluteTime = 2020
-                node.time_source = 'default_2020'
-        else:
-            node.absoluteTime = 2020
-            node.time_source = 'default_2020_no_name'
-    else:
-        if hasattr(node, 'children') and node.children:
-            for child in node.children:
-                set_node_times(child)
-            child_times = [child.absoluteTime for child in node.children if hasattr(child, 'absoluteTime')]
-            if child_times:
-                node.absoluteTime = min(child_times) - (node.length if hasattr(node, 'length') else 0.1)
-                node.time_source = 'calculated'
-            else:
-                node.absoluteTime = 2010
-                node.time_source = 'default_2010'
-        else:
-            node.absoluteTime = 2010
-            node.time_source = 'default_2010_no_children'
-
-# Apply time setting to all nodes
-for node in ll.Objects:
-    set_node_times(node)
+# Set absoluteTime for all nodes in a single post-order pass from tips to root
+set_node_times(ll, strain_to_decimal_year, verbose=True)
 
 # Analyze time source statistics
 time_source_counts = {}
@@ -114,13 +84,18 @@ for node in ll.Objects:
 fig, ax = plt.subplots(figsize=(20, 10), facecolor='w')
 
 # Get tree dimensions and set up layout
-import baltic as bt
 import pandas as pd
 import matplotlib.pyplot as plt
 from matplotlib import gridspec
 import numpy as np
 import matplotlib as mpl
 
+from wnv_trees.collapse import collapse_clades, draw_wedges
+from wnv_trees.dating import set_node_times
+from wnv_trees.metadata import load_metadata
+from wnv_trees.render import draw_branches, draw_tip_classes
+from wnv_trees.tree_cache import load_tree
+
 # UNMC Color Palette - Most distinct colors
 UNMC_COLORS = {
     'green_2': '#A1B426',      # Bright Green
@@ -130,6 +105,10 @@ UNMC_COLORS = {
     'grey': '#CCCCCC'          # Light grey
 }
 
+# Level of detail: draw every background clade of at least this many tips with
+# no UNMC sample as one labelled wedge (None draws every branch)
+COLLAPSE_MIN_TIPS = None
+
 # Define your UNMC samples to highlight
 UNMC_SAMPLES = {
     'UNMC0008', 'UNMC0009', 'UNMC0014', 'UNMC0020', 'UNMC0185', 'UNMC0270',
@@ -139,27 +118,6 @@ UNMC_SAMPLES = {
     'UNMC0707', 'UNMC0282', 'UNMC0699', 'UNMC0678', 'UNMC0706'
 }
 
-# Regional groupings (combining all NE_ regions into Midwest)
-def get_broad_region(region):
-    if pd.isna(region):
-        return 'Other'
-
-    region_str = str(region)
-
-    # Group NE_ regions as Midwest (since they're Nebraska samples)
-    if region_str.startswith('NE_'):
-        return 'Midwest'
-    elif region_str == 'Northeast':
-        return 'Northeast'
-    elif region_str == 'West':
-        return 'West'
-    elif region_str == 'Midwest':
-        return 'Midwest'
-    elif region_str == 'South':
-        return 'South'
-    else:
-        return 'Other'
-
 # Color assignments - More distinct colors to avoid green confusion
 REGION_COLORS = {
     'Northeast': UNMC_COLORS['green_2'],    # 1524 samples - Bright Green
@@ -169,16 +127,15 @@ REGION_COLORS = {
     'Other': UNMC_COLORS['grey']            # Any remaining - Grey
 }
 
-# Load your tree using baltic's loadNewick function
-ll = bt.loadNewick('/content/tree_2025.nwk')
+# Load your tree with baltic's loadNewick, via the on-disk parsed-tree cache
+ll = load_tree('/content/tree_2025.nwk')
 
-# Load your metadata
-metadata = pd.read_csv('/content/updated_metadata.tsv', sep='\t')
+# Load the columns we use, with year/decimal_year/broad_region derived and cached
+metadata = load_metadata('/content/updated_metadata.tsv')
 print("Metadata shape:", metadata.shape)
 print("Metadata columns:", metadata.columns.tolist())
 
-# Add broad region groupings
-metadata['broad_region'] = metadata['Region'].apply(get_broad_region)
+# Broad region groupings (all NE_ regions count as Midwest)
 print("\nBroad region distribution:")
 print(metadata['broad_region'].value_counts())
 
@@ -186,89 +143,30 @@ print(metadata['broad_region'].value_counts())
 unmc_metadata = metadata[metadata['strain'].isin(UNMC_SAMPLES)]
 print(f"\nUNMC samples found in metadata: {len(unmc_metadata)}")
 print("UNMC samples by broad region:")
-print(unmc_metadata['broad_region'].value_counts())
+print(unmc_metadata['broad_region'].cat.remove_unused_categories().value_counts())
 
 # Create strain-to-metadata mappings
 strain_to_region = dict(zip(metadata['strain'], metadata['Region']))
 strain_to_broad_region = dict(zip(metadata['strain'], metadata['broad_region']))
 strain_to_date = dict(zip(metadata['strain'], metadata['date']))
 
-# Convert dates to decimal years for time axis
-def extract_year(date_str):
-    if pd.isna(date_str):
-        return None
-    import re
-    year_match = re.search(r'^(\d{4})', str(date_str))
-    if year_match:
-        return int(year_match.group(1))
-    return None
-
-def date_to_decimal_year(date_str):
-    if pd.isna(date_str):
-        return None
-    try:
-        parts = str(date_str).split('-')
-        if len(parts) >= 3:
-            year = int(parts[0])
-            month = int(parts[1]) if parts[1] != 'XX' else 6
-            day = int(parts[2]) if parts[2] != 'XX' else 15
-
-            from datetime import datetime
-            date_obj = datetime(year, month, day)
-            year_start = datetime(year, 1, 1)
-            year_end = datetime(year + 1, 1, 1)
-            year_fraction = (date_obj - year_start).total_seconds() / (year_end - year_start).total_seconds()
-            return year + year_fraction
-        else:
-            return int(parts[0])
-    except:
-        return extract_year(date_str)
-
-metadata['decimal_year'] = metadata['date'].apply(date_to_decimal_year)
+# Decimal years for the time axis
 strain_to_decimal_year = dict(zip(metadata['strain'], metadata['decimal_year']))
 
-# Set absoluteTime for all nodes based on tree structure
-def set_node_times(node):
-    if node.branchType == 'leaf':
-        if hasattr(node, 'name') and node.name:
-            decimal_year = strain_to_decimal_year.get(node.name, None)
-            if decimal_year is not None:
-                node.absoluteTime = decimal_year
-            else:
-                node.absoluteTime = 2020
-    else:
-        if hasattr(node, 'children') and node.children:
-            for child in node.children:
-                set_node_times(child)
-            child_times = [child.absoluteTime for child in node.children if hasattr(child, 'absoluteTime')]
-            if child_times:
-                node.absoluteTime = min(child_times) - (node.length if hasattr(node, 'length') else 0.1)
-            else:
-                node.absoluteTime = 2010
+# Set absoluteTime for all nodes in a single post-order pass from tips to root
+set_node_times(ll, strain_to_decimal_year, verbose=True)
 
-# Apply time setting to all nodes
-for node in ll.Objects:
-    set_node_times(node)
+# Collapse background clades into wedges labelled with tip count and years
+visible = None
+if COLLAPSE_MIN_TIPS:
+    collapsed, visible = collapse_clades(ll, lambda k: k.name in UNMC_SAMPLES, COLLAPSE_MIN_TIPS)
+    wedges = draw_wedges(ax, collapsed, x_attr=lambda k: k.absoluteTime, label=True,
+                         span_format='{:.0f}-{:.0f}')
+    print(f"Collapsed {len(wedges)} background clades ({sum(w['tips'] for w in wedges)} tips) into wedges")
 
 # Draw ALL branches in grey (boss's preference - much cleaner!)
-for node in ll.Objects:
-    if hasattr(node, 'parent') and node.parent:
-        x = node.absoluteTime
-        y = node.y
-        x_parent = node.parent.absoluteTime
-        y_parent = node.parent.y
-
-        # ALL branches are grey for simplicity
-        branch_color = '#CCCCCC'
-
-        # Draw horizontal branch
-        ax.plot([x_parent, x], [y, y], color=branch_color, linewidth=1.5, zorder=10, alpha=0.7)
-
-        # Draw vertical connector
-        if hasattr(node.parent, 'children') and len(node.parent.children) > 1:
-            sibling_ys = [child.y for child in node.parent.children]
-            ax.plot([x_parent, x_parent], [min(sibling_ys), max(sibling_ys)],
-                   color='#CCCCCC', linewidth=1.5, zorder=9, alpha=0.7)
+draw_branches(ax, ll, x_attr=lambda k: k.absoluteTime, colour='#CCCCCC',
+              width=1.5, alpha=0.7, zorder=10, nodes=visible)
 
 # Debug: Print some sample data to see what's happening
 print("Debug info:")
@@ -285,27 +183,19 @@ print(f"Total leaf nodes: {len([n for n in ll.Objects if n.branchType == 'leaf']
 print(f"Strain mapping examples: {list(strain_to_broad_region.items())[:5]}")
 print(f"Region colors: {REGION_COLORS}")
 
-# Plot tip points with explicit color debugging
-for node in ll.Objects:
-    if hasattr(node, 'branchType') and node.branchType == 'leaf':
-        strain = getattr(node, 'name', None)
-        if strain:
-            broad_region = strain_to_broad_region.get(strain, 'Other')
-            is_unmc = strain in UNMC_SAMPLES
-
-            if is_unmc:
-                # UNMC samples: larger nodes with black circles, special red color
-                ax.scatter(node.absoluteTime, node.y, s=120, c='#AD122A',
-                          zorder=20005, edgecolors='black', linewidth=2, alpha=1.0)
-            else:
-                # Regular samples: smaller nodes, colored by region
-                color = REGION_COLORS.get(broad_region, UNMC_COLORS['grey'])
-                ax.scatter(node.absoluteTime, node.y, s=40, c=color,
-                          zorder=20001, alpha=0.8, edgecolors='none')
-        else:
-            # No name - plot as grey
-            ax.scatter(node.absoluteTime, node.y, s=40, c=UNMC_COLORS['grey'],
-                      zorder=20001, alpha=0.8, edgecolors='none')
+# Plot tip points with one scatter collection per style class
+draw_tip_classes(ax, ll,
+                 classify=lambda k: 'unmc' if k.name in UNMC_SAMPLES else 'regional',
+                 styles={
+                     # UNMC samples: larger nodes with black circles, special red color
+                     'unmc': {'colour': '#AD122A', 'size': 120, 'edgecolor': 'black',
+                              'linewidth': 2, 'alpha': 1.0, 'zorder': 20005},
+                     # Regular samples: smaller nodes, colored by region (grey if no name)
+                     'regional': {'colour': lambda k: REGION_COLORS.get(strain_to_broad_region.get(k.name, 'Other'),
+                                                                        UNMC_COLORS['grey']),
+                                  'size': 40, 'alpha': 0.8, 'zorder': 20001},
+                 },
+                 x_attr=lambda k: k.absoluteTime, nodes=visible)
 
 # Customize the plot
 ax.set_ylim(-10, ll.ySpan + 10)
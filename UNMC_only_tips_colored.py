@@ -1,9 +1,12 @@
 # Required imports
-import baltic as bt
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 
+from wnv_trees.metadata import load_metadata
+from wnv_trees.render import draw_branches, draw_tip_classes
+from wnv_trees.tree_cache import load_tree
+
 # Color scheme as specified by your boss
 UNMC_BLUE = '#002957'  # All nodes
 UNMC_RED = '#AD122A'   # 29 specific UNMC samples
@@ -22,8 +25,8 @@ print(f"🎯 Highlighting {len(HIGHLIGHTED_SAMPLES)} specific UNMC samples")
 
 # Load your data
 print("📁 Loading data...")
-metadata = pd.read_csv('/content/updated_metadata.tsv', sep='\t')
-tree = bt.loadNewick('/content/tree_NE_2025.nwk')
+metadata = load_metadata('/content/updated_metadata.tsv')
+tree = load_tree('/content/tree_NE_2025.nwk')
 print(f"✅ Loaded {len(metadata)} metadata rows and {len(tree.Objects)} tree nodes")
 
 # Let Baltic handle the tree layout - don't calculate divergence manually!
@@ -53,58 +56,33 @@ fig, ax = plt.subplots(figsize=(20, 14), facecolor='white')
 # Use Baltic's built-in coordinates for proper tree structure
 # Baltic automatically calculates x and y coordinates for proper tree display
 
-# Draw all branches using Baltic's coordinates
-branch_count = 0
-for node in tree.Objects:
-    if hasattr(node, 'parent') and node.parent:
-        # Use Baltic's x and y coordinates directly
-        x = node.x
-        y = node.y
-        x_parent = node.parent.x
-        y_parent = node.parent.y
-
-        # Horizontal branch (from parent to node)
-        ax.plot([x_parent, x], [y, y], color='#AAAAAA', linewidth=2, zorder=10, alpha=0.8)
-
-        # Vertical connector for internal nodes (connect siblings)
-        if hasattr(node.parent, 'children') and len(node.parent.children) > 1:
-            sibling_ys = [child.y for child in node.parent.children if hasattr(child, 'y')]
-            if len(sibling_ys) > 1:
-                ax.plot([x_parent, x_parent], [min(sibling_ys), max(sibling_ys)],
-                       color='#AAAAAA', linewidth=2, zorder=9, alpha=0.8)
-        branch_count += 1
+# Draw all branches using Baltic's coordinates, batched into line collections
+draw_branches(ax, tree, colour='#AAAAAA', width=2, alpha=0.8, zorder=10)
+branch_count = len(tree.Objects) - 1
 
 print(f"🌳 Drew {branch_count} branches")
 
-# Plot sample points using Baltic's coordinates
-highlighted_count = 0
-unmc_count = 0
-other_count = 0
-
-for node in tree.Objects:
-    if hasattr(node, 'branchType') and node.branchType == 'leaf':
-        strain = getattr(node, 'name', None)
-        if strain:
-            if strain in HIGHLIGHTED_SAMPLES:
-                # 29 highlighted samples: red with black edge
-                ax.scatter(node.x, node.y, s=140, c=UNMC_RED,
-                          zorder=20005, edgecolors='black', linewidth=2.5, alpha=1.0)
-                highlighted_count += 1
-            elif 'UNMC' in str(strain):
-                # Other UNMC samples: blue
-                ax.scatter(node.x, node.y, s=80, c=UNMC_BLUE,
-                          zorder=20002, alpha=0.9, edgecolors='none')
-                unmc_count += 1
-            else:
-                # Non-UNMC samples (reference sequences): blue
-                ax.scatter(node.x, node.y, s=80, c=UNMC_BLUE,
-                          zorder=20001, alpha=0.9, edgecolors='none')
-                other_count += 1
-        else:
-            # No name - plot as blue
-            ax.scatter(node.x, node.y, s=80, c=UNMC_BLUE,
-                      zorder=20001, alpha=0.9, edgecolors='none')
-            other_count += 1
+# Plot sample points using Baltic's coordinates, one scatter collection per style class
+def classify_tip(node):
+    strain = getattr(node, 'name', None)
+    if strain in HIGHLIGHTED_SAMPLES:
+        return 'highlighted'
+    elif strain and 'UNMC' in str(strain):
+        return 'unmc'
+    return 'other'
+
+tip_counts = draw_tip_classes(ax, tree, classify_tip, styles={
+    # 29 highlighted samples: red with black edge
+    'highlighted': {'colour': UNMC_RED, 'size': 140, 'edgecolor': 'black',
+                    'linewidth': 2.5, 'alpha': 1.0, 'zorder': 20005},
+    # Other UNMC samples: blue
+    'unmc': {'colour': UNMC_BLUE, 'size': 80, 'alpha': 0.9, 'zorder': 20002},
+    # Non-UNMC samples (reference sequences) and unnamed tips: blue
+    'other': {'colour': UNMC_BLUE, 'size': 80, 'alpha': 0.9, 'zorder': 20001},
+})
+highlighted_count = tip_counts['highlighted']
+unmc_count = tip_counts['unmc']
+other_count = tip_counts['other']
 
 # Set plot dimensions using Baltic's coordinate system
 ax.set_ylim(-5, tree.ySpan + 5)
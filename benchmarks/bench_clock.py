@@ -0,0 +1,99 @@
+"""Time the strict-clock dating and check it against a tree with known node times.
+
+Simulates a synthetic tree (see `benchmarks.synthetic`), turns its branch
+durations into divergence with a fixed clock rate and Poisson mutation noise,
+and writes it with metadata whose dates are partly month- or year-only. Then
+dates it with `wnv_trees.clock` and reports the wall time, the recovered rate
+and root date, and the error of the node times against the truth. For
+comparison it also reports the same errors for `set_array_times` run on the
+branch lengths rescaled to years by the fitted rate. Run from the repository
+root:
+
+    python -m benchmarks.bench_clock --tips 100000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import metadata_rows, random_tree, strain_names, to_newick
+from wnv_trees.clock import set_array_clock_times
+from wnv_trees.dating import set_array_times
+from wnv_trees.metadata import load_metadata
+from wnv_trees.newick import load_array_tree
+
+
+def simulate(n, rate, sites, outdir, seed):
+    """Write a divergence tree and its metadata; returns both paths and the true node times."""
+    rng = np.random.default_rng(seed)
+    names = strain_names(n)
+    parent, times, tip_times = random_tree(n, seed)
+    duration = np.zeros(len(parent))
+    duration[:-1] = times[:-1] - times[parent[:-1]]
+    length = rng.poisson(duration * rate * sites) / sites
+    # Parents are numbered after their children, so fill divergence from the root down
+    divergence = np.zeros(len(parent))
+    for node in range(len(parent) - 2, -1, -1):
+        divergence[node] = divergence[parent[node]] + length[node]
+
+    tree_path = os.path.join(outdir, f'clock_{n}.nwk')
+    metadata_path = os.path.join(outdir, f'clock_{n}.tsv')
+    with open(tree_path, 'w') as handle:
+        handle.write(to_newick(parent, divergence, names) + '\n')
+    with open(metadata_path, 'w') as handle:
+        handle.write('strain\tRegion\tdate\n')
+        for row in metadata_rows(names, tip_times, seed):
+            handle.write('\t'.join(row) + '\n')
+
+    # True times in the pre-order a loaded ArrayTree uses (children in index order)
+    children = [[] for _ in range(len(parent))]
+    for node in range(len(parent) - 1):
+        children[parent[node]].append(node)
+    order = []
+    stack = [len(parent) - 1]
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        stack.extend(reversed(children[node]))
+    return tree_path, metadata_path, times[order]
+
+
+def errors(estimate, truth, internal):
+    error = np.abs(estimate - truth)
+    return f"median {np.median(error[internal]):.3f}, 95% {np.quantile(error[internal], 0.95):.3f} years"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tips', type=int, default=100000)
+    parser.add_argument('--rate', type=float, default=5e-4, help='Substitutions per site per year')
+    parser.add_argument('--sites', type=int, default=10000, help='Alignment length for the mutation noise')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        tree_path, metadata_path, truth = simulate(args.tips, args.rate, args.sites, scratch, args.seed)
+        atree = load_array_tree(tree_path)
+        metadata = load_metadata(metadata_path, use_cache=False)
+
+    start = time.perf_counter()
+    fit = set_array_clock_times(atree, metadata)
+    elapsed = time.perf_counter() - start
+    internal = ~atree.is_leaf
+    converged = '' if fit['converged'] else ', not converged'
+    print(f"{len(atree)} nodes dated in {elapsed:.3f}s ({fit['iterations']} iterations{converged})")
+    print(f"rate {fit['rate']:.4g} (true {args.rate:.4g}), root {fit['root_time']:.2f} "
+          f"(true {truth[0]:.2f}), root-to-tip R^2 {fit['regression']['r2']:.3f}")
+    print(f"clock internal node error:     {errors(atree.time, truth, internal)}")
+
+    # The heuristic needs branch lengths in years
+    atree.length = atree.length / fit['rate']
+    decimal_year = dict(zip(metadata['strain'], metadata['decimal_year']))
+    set_array_times(atree, decimal_year)
+    print(f"heuristic internal node error: {errors(atree.time, truth, internal)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Compare DistanceIndex nearest-relative queries with a scan over every tip.
+
+For each query tip, finds the k nearest tips outside an excluded set (a
+random share of the tips, standing in for the Nebraska samples) two ways.
+The naive way computes the distance to every allowed tip and sorts. The
+other is `DistanceIndex.nearest_many`. Checks that the distances agree and
+times a pairwise distance matrix of the queries. Run from the repository
+root:
+
+    python -m benchmarks.bench_distances --tips 100000 --queries 1000 -k 5
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import write_dataset
+from wnv_trees.distances import DistanceIndex
+from wnv_trees.lca import LCAIndex
+from wnv_trees.newick import load_array_tree
+
+
+def clock(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def naive_nearest(distances, tips, allowed, queries, k):
+    # Distance to every allowed tip through the batch MRCA query, then the k smallest
+    candidates = tips[allowed]
+    rows = []
+    for query in queries:
+        others = candidates[candidates != query]
+        row = np.sort(distances.distance_many(np.full(len(others), query), others))[:k]
+        rows.append(np.pad(row, (0, k - len(row)), constant_values=np.nan))
+    return np.array(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tree', default=None, help='Newick file (default: a synthetic tree)')
+    parser.add_argument('--tips', type=int, default=100000, help='Size of the synthetic tree')
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('-k', type=int, default=5, help='Neighbours per query')
+    parser.add_argument('--excluded', type=float, default=0.05,
+                        help='Share of tips that may not be neighbours')
+    parser.add_argument('--naive-queries', type=int, default=100, help='Queries to time the naive scan on')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        path = args.tree or write_dataset(args.tips, scratch, args.seed)[0]
+        atree = load_array_tree(path)
+    distances, build_time = clock(lambda: DistanceIndex(LCAIndex(atree)))
+    tips = atree.tips
+    print(f"{len(atree)} nodes ({len(tips)} tips): LCA and distance index built in {build_time:.3f}s")
+
+    rng = np.random.default_rng(args.seed)
+    allowed = rng.random(len(tips)) >= args.excluded
+    queries = rng.choice(tips, min(args.queries, len(tips)), replace=False)
+    _, table_time = clock(lambda: distances.candidates(allowed))
+    (_, found), index_time = clock(lambda: distances.nearest_many(queries, args.k, allowed))
+    sample = queries[:args.naive_queries]
+    naive, naive_time = clock(lambda: naive_nearest(distances, tips, allowed, sample, args.k))
+    _, matrix_time = clock(lambda: distances.matrix(queries))
+
+    print(f"\n{'query':<26} {'queries':>8} {'seconds':>9} {'us/query':>10}")
+    rows = [
+        (f'{args.k} nearest, index', len(queries), index_time),
+        (f'{args.k} nearest, full scan', len(sample), naive_time),
+    ]
+    for name, count, seconds in rows:
+        print(f"{name:<26} {count:>8} {seconds:9.3f} {seconds / count * 1e6:10.1f}")
+    print(f"candidate table built in {table_time:.3f}s; "
+          f"{len(queries)} x {len(queries)} distance matrix in {matrix_time:.3f}s")
+    agree = np.allclose(found[:len(sample)], naive, equal_nan=True)
+    print(f"\nIndex and full scan agree: {agree}")
+
+
+if __name__ == '__main__':
+    main()
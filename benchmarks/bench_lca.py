@@ -0,0 +1,108 @@
+"""Compare LCAIndex MRCA queries with walking parent pointers.
+
+Answers random pairwise and set (k tips) MRCA queries three ways: naive
+parent walking in Python (the approach of baltic's `commonAncestor`), the
+index one query at a time, and the index's batch API. Checks that all three
+agree. With --baltic the set queries are also timed with
+`tree.commonAncestor` on the baltic tree. Run from the repository root:
+
+    python -m benchmarks.bench_lca --tips 100000 --queries 10000
+    python -m benchmarks.bench_lca --tree tree_2025.nwk --baltic
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import write_dataset
+from wnv_trees.lca import LCAIndex
+from wnv_trees.newick import load_array_tree
+
+
+def naive_mrca(parent, u, v):
+    ancestors = set()
+    while u >= 0:
+        ancestors.add(u)
+        u = parent[u]
+    while v not in ancestors:
+        v = parent[v]
+    return v
+
+
+def naive_mrca_set(parent, nodes):
+    # Intersect every node's path to the root and take the deepest shared node
+    shared = None
+    for node in nodes:
+        path = []
+        while node >= 0:
+            path.append(node)
+            node = parent[node]
+        shared = set(path) if shared is None else shared & set(path)
+    return max(shared)
+
+
+def clock(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tree', default=None, help='Newick file (default: a synthetic tree)')
+    parser.add_argument('--tips', type=int, default=100000, help='Size of the synthetic tree')
+    parser.add_argument('--queries', type=int, default=10000)
+    parser.add_argument('--set-size', type=int, default=29, help='Tips per set query (29 UNMC samples)')
+    parser.add_argument('--baltic', action='store_true', help='Also time baltic commonAncestor')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        path = args.tree or write_dataset(args.tips, scratch, args.seed)[0]
+        atree, load_time = clock(lambda: load_array_tree(path))
+        index, build_time = clock(lambda: LCAIndex(atree))
+        baltic_tree = None
+        if args.baltic:
+            import baltic as bt
+            baltic_tree = bt.loadNewick(path)
+            objects = LCAIndex.from_tree(baltic_tree).objects
+    print(f"{len(atree)} nodes ({len(index.tips)} tips, max depth {index.depth.max()}): "
+          f"loaded in {load_time:.3f}s, index built in {build_time:.3f}s")
+
+    rng = np.random.default_rng(args.seed)
+    parent = atree.parent.tolist()
+    tips = index.tips.tip_nodes
+    u = rng.choice(tips, args.queries)
+    v = rng.choice(tips, args.queries)
+    sets = [rng.choice(tips, args.set_size, replace=False) for _ in range(max(1, args.queries // 10))]
+
+    naive, naive_time = clock(lambda: [naive_mrca(parent, a, b) for a, b in zip(u.tolist(), v.tolist())])
+    single, single_time = clock(lambda: [index.mrca(a, b) for a, b in zip(u, v)])
+    batch, batch_time = clock(lambda: index.mrca_many(u, v))
+    naive_sets, naive_set_time = clock(lambda: [naive_mrca_set(parent, nodes.tolist()) for nodes in sets])
+    single_sets, single_set_time = clock(lambda: [index.mrca_set(nodes) for nodes in sets])
+    batch_sets, batch_set_time = clock(lambda: index.mrca_sets(sets))
+
+    print(f"\n{'query':<28} {'queries':>8} {'seconds':>9} {'us/query':>9}")
+    rows = [
+        ('pairwise, parent walking', len(u), naive_time),
+        ('pairwise, index', len(u), single_time),
+        ('pairwise, index batch', len(u), batch_time),
+        (f'{args.set_size}-tip set, parent walking', len(sets), naive_set_time),
+        (f'{args.set_size}-tip set, index', len(sets), single_set_time),
+        (f'{args.set_size}-tip set, index batch', len(sets), batch_set_time),
+    ]
+    if baltic_tree is not None:
+        _, baltic_time = clock(lambda: [baltic_tree.commonAncestor([objects[i] for i in nodes])
+                                        for nodes in sets])
+        rows.append((f'{args.set_size}-tip set, commonAncestor', len(sets), baltic_time))
+    for name, count, seconds in rows:
+        print(f"{name:<28} {count:>8} {seconds:9.3f} {seconds / count * 1e6:9.2f}")
+
+    agree = naive == single == batch.tolist() and naive_sets == single_sets == batch_sets.tolist()
+    print(f"\nAll methods agree: {agree}")
+
+
+if __name__ == '__main__':
+    main()
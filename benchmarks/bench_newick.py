@@ -0,0 +1,77 @@
+"""Compare bt.loadNewick with the streaming read_newick parser.
+
+Checks that both give the same tip names, topology (the tip set under every
+node) and branch lengths, and reports time and peak traced memory for each.
+Run from the repository root:
+
+    python -m benchmarks.bench_newick tree_2025.nwk --mmap
+"""
+import argparse
+import time
+import tracemalloc
+
+import baltic as bt
+import numpy as np
+
+from wnv_trees.newick import load_array_tree
+
+
+def measure(load):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = load()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def baltic_clades(tree):
+    """Map each clade's tip set to its branch length; tips map as one-element sets."""
+    clades = {}
+    for k in tree.Objects:
+        tips = frozenset([k.name]) if k.branchType == 'leaf' else frozenset(k.leaves)
+        clades[tips] = k.length
+    return clades
+
+
+def array_clades(atree):
+    tips = [frozenset([name]) if leaf else set() for name, leaf in zip(atree.names, atree.is_leaf)]
+    for i in range(len(atree) - 1, 0, -1):
+        tips[atree.parent[i]] |= tips[i]
+    return {frozenset(t): atree.length[i] for i, t in enumerate(tips)}
+
+
+def same_clades(expected, found):
+    if expected.keys() != found.keys():
+        return False
+    for tips, length in expected.items():
+        # baltic gives the root a length of 0 when the file has none
+        if not np.isclose(length or 0.0, np.nan_to_num(found[tips])):
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('tree')
+    parser.add_argument('--mmap', action='store_true', help='Tokenize from a memory map')
+    parser.add_argument('--chunk-size', type=int, default=1 << 20)
+    args = parser.parse_args()
+
+    tree, baltic_time, baltic_peak = measure(lambda: bt.loadNewick(args.tree))
+    atree, stream_time, stream_peak = measure(
+        lambda: load_array_tree(args.tree, chunk_size=args.chunk_size, use_mmap=args.mmap))
+
+    print(f"{'parser':<14} {'seconds':>8} {'peak MB':>9}")
+    print(f"{'bt.loadNewick':<14} {baltic_time:8.3f} {baltic_peak / 1e6:9.1f}")
+    print(f"{'read_newick':<14} {stream_time:8.3f} {stream_peak / 1e6:9.1f}")
+
+    names_match = sorted(k.name for k in tree.Objects if k.branchType == 'leaf') == \
+        sorted(atree.names[atree.tips].tolist())
+    print(f"\nTip names match: {names_match}")
+    print(f"Topology and branch lengths match: {same_clades(baltic_clades(tree), array_clades(atree))}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Time every stage of the figure pipeline on synthetic data of several sizes.
+
+For each tip count a synthetic tree and metadata table are generated (see
+`benchmarks.synthetic`) and each stage is timed on its own, without the
+on-disk caches: loading the tree with baltic and with the streaming parser,
+reading the metadata, parsing its dates, annotating strains, dating the
+tree, laying it out, and drawing and saving each figure. Results are written
+to JSON so runs on different machines or commits can be compared. Run from
+the repository root:
+
+    python -m benchmarks.bench_pipeline --tips 1000 10000 100000 --output bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import pandas as pd
+
+from benchmarks.synthetic import write_dataset
+from wnv_trees.batch import render_figure
+from wnv_trees.dates import parse_dates
+from wnv_trees.layout import layout_baltic
+from wnv_trees.newick import load_array_tree
+from wnv_trees.pipeline import Pipeline
+
+
+def timed(timings, name, function):
+    start = time.perf_counter()
+    result = function()
+    timings[name] = time.perf_counter() - start
+    return result
+
+
+def run(n, workdir, figures, formats, dpi, seed=0):
+    """Generate a dataset of `n` tips and return {stage: seconds} for it."""
+    timings = {}
+    tree_path, metadata_path = timed(timings, 'generate', lambda: write_dataset(n, workdir, seed))
+
+    timed(timings, 'load tree (streaming)', lambda: load_array_tree(tree_path))
+    columns = ['strain', 'Region', 'date']
+    raw = timed(timings, 'read metadata', lambda: pd.read_csv(
+        metadata_path, sep='\t', usecols=columns, dtype={'strain': str, 'Region': 'category', 'date': str}))
+    timed(timings, 'parse dates', lambda: parse_dates(raw['date']))
+
+    # The pipeline's own stages time loading (with dates and regions),
+    # annotating, loading the tree with baltic and dating it
+    pipeline = Pipeline(tree_path, metadata_path, divergence_tree_path=tree_path, use_cache=False)
+    pipeline.tree
+    for stage in ('load metadata', 'annotate', 'load tree', 'date tree'):
+        timings[stage] = pipeline.timings[stage]
+
+    # In file order this reproduces the layout loadNewick already gave the tree
+    timed(timings, 'layout', lambda: layout_baltic(pipeline.tree))
+
+    outdir = os.path.join(workdir, f'figures_{n}')
+    os.makedirs(outdir, exist_ok=True)
+    for name in figures:
+        _, figure_timings = render_figure(pipeline, name, outdir, formats, dpi)
+        timings.update(figure_timings)
+    return timings
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tips', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--figures', default='ne2023,unmc-regions',
+                        help='Comma-separated figure names to draw and save')
+    parser.add_argument('--format', default='png', help='Comma-separated output formats')
+    parser.add_argument('--dpi', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', default=None,
+                        help='Where to write the synthetic data and figures (default: a temporary directory)')
+    parser.add_argument('--output', default='bench_pipeline.json', help='JSON file to write results to')
+    args = parser.parse_args()
+
+    figures = [name.strip() for name in args.figures.split(',') if name.strip()]
+    formats = [fmt.strip() for fmt in args.format.split(',') if fmt.strip()]
+    results = {
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'matplotlib': matplotlib.__version__,
+        'dpi': args.dpi,
+        'formats': formats,
+        'seed': args.seed,
+        'runs': {},
+    }
+
+    with tempfile.TemporaryDirectory() as scratch:
+        workdir = args.workdir or scratch
+        for n in args.tips:
+            timings = run(n, workdir, figures, formats, args.dpi, args.seed)
+            results['runs'][str(n)] = timings
+            print(f"\n{n} tips")
+            for stage, seconds in timings.items():
+                print(f"  {stage:<28} {seconds:9.3f}s")
+
+    with open(args.output, 'w') as handle:
+        json.dump(results, handle, indent=2)
+    print(f"\nWrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
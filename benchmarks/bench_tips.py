@@ -0,0 +1,78 @@
+"""Compare per-tip ax.scatter calls with the batched draw_tips renderer.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_tips --tips 1000 5000 20000
+"""
+import argparse
+import io
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+
+from wnv_trees.render import draw_tips
+
+REGION_PALETTE = ['#A1B426', '#F26721', '#002957', '#129DBF', '#CCCCCC']
+
+
+def make_tips(n, seed=0):
+    """Random tip coordinates with ~1% highlighted and regional colours for the rest."""
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(1999, 2025, n)
+    y = np.arange(n, dtype=float)
+    highlighted = rng.random(n) < 0.01
+    colours = np.array(REGION_PALETTE)[rng.integers(0, len(REGION_PALETTE), n)]
+    colours[highlighted] = '#AD122A'
+    return x, y, colours, highlighted
+
+
+def per_tip(ax, x, y, colours, highlighted):
+    # The loop the scripts used before draw_tips
+    for i in range(len(x)):
+        if highlighted[i]:
+            ax.scatter(x[i], y[i], s=120, c=colours[i], zorder=20005,
+                       edgecolors='black', linewidth=2, alpha=1.0)
+        else:
+            ax.scatter(x[i], y[i], s=40, c=colours[i], zorder=20001,
+                       alpha=0.8, edgecolors='none')
+
+
+def batched(ax, x, y, colours, highlighted):
+    draw_tips(ax, x, y, colours,
+              sizes=np.where(highlighted, 120, 40),
+              edgecolors=np.where(highlighted, 'black', 'none'),
+              linewidths=np.where(highlighted, 2.0, 0.0),
+              alphas=np.where(highlighted, 1.0, 0.8),
+              zorders=np.where(highlighted, 20005, 20001))
+
+
+def run(method, n):
+    x, y, colours, highlighted = make_tips(n)
+    fig, ax = plt.subplots(figsize=(20, 10))
+    start = time.perf_counter()
+    method(ax, x, y, colours, highlighted)
+    drawn = time.perf_counter()
+    fig.savefig(io.BytesIO(), format='png', dpi=100)
+    saved = time.perf_counter()
+    collections = len(ax.collections)
+    plt.close(fig)
+    return drawn - start, saved - drawn, collections
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tips', type=int, nargs='+', default=[1000, 5000])
+    args = parser.parse_args()
+
+    print(f"{'tips':>8} {'method':>9} {'draw (s)':>9} {'save (s)':>9} {'artists':>8}")
+    for n in args.tips:
+        for name, method in [('per-tip', per_tip), ('batched', batched)]:
+            draw_time, save_time, collections = run(method, n)
+            print(f"{n:>8} {name:>9} {draw_time:>9.3f} {save_time:>9.3f} {collections:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""Synthetic time-calibrated trees and matching metadata for benchmarking.
+
+The real inputs (`tree_2025.nwk`, `updated_metadata.tsv`) only exist in the
+Colab session, so the benchmarks generate stand-ins of any size: a random
+binary tree whose branch lengths are in years, and a metadata TSV with a
+`strain`, `Region` (including the NE_* regions) and `date` for every tip,
+with the same mix of full, `YYYY-MM-XX`, `YYYY-XX-XX` and missing dates.
+The first tips are named after the UNMC samples so the highlight figures
+have something to highlight. Write a pair of files with:
+
+    python -m benchmarks.synthetic 10000 --outdir synthetic
+"""
+import argparse
+import os
+
+import numpy as np
+
+from wnv_trees.figures import UNMC_SAMPLES
+
+REGIONS = ['Northeast', 'West', 'Midwest', 'South', 'NE_Central', 'NE_West', 'NE_East', 'Canada']
+REGION_WEIGHTS = [0.25, 0.2, 0.2, 0.2, 0.04, 0.04, 0.04, 0.03]
+FIRST_YEAR = 1999
+LAST_YEAR = 2025
+
+
+def strain_names(n):
+    """Tip names: the UNMC sample names first, then numbered strains."""
+    unmc = sorted(UNMC_SAMPLES)[:n]
+    return unmc + [f'WNV/USA/{i:06d}' for i in range(len(unmc), n)]
+
+
+def random_tree(n, seed=0):
+    """A random binary tree with `n` dated tips.
+
+    Returns (parent, time, tip_times): `parent` and `time` cover the tips
+    (indices 0..n-1) and then the internal nodes in the order they were
+    created, the root last. Lineages are joined at random, each parent some
+    exponentially distributed time before the older of its two children.
+    """
+    rng = np.random.default_rng(seed)
+    # Sampling leans towards recent years, as the real data does
+    tip_times = LAST_YEAR - rng.exponential(6.0, n) % (LAST_YEAR - FIRST_YEAR)
+    parent = np.full(2 * n - 1, -1, dtype=np.int64)
+    time = np.empty(2 * n - 1)
+    time[:n] = tip_times
+
+    active = list(range(n))
+    for node in range(n, 2 * n - 1):
+        joined = []
+        for _ in range(2):
+            i = int(rng.integers(len(active)))
+            active[i], active[-1] = active[-1], active[i]
+            joined.append(active.pop())
+        parent[joined] = node
+        time[node] = min(time[joined]) - rng.exponential(0.5)
+        active.append(node)
+    return parent, time, tip_times
+
+
+def to_newick(parent, time, names):
+    """Write a tree from `random_tree` as Newick with branch lengths in years."""
+    n_nodes = len(parent)
+    children = [[] for _ in range(n_nodes)]
+    for node in range(n_nodes - 1):
+        children[parent[node]].append(node)
+
+    root = n_nodes - 1
+    parts = []
+    # Items are node indices to open, or strings to write out as they are
+    stack = [root]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            parts.append(item)
+            continue
+        length = '' if item == root else f':{time[item] - time[parent[item]]:.6f}'
+        if item < len(names):
+            parts.append(names[item] + length)
+            continue
+        parts.append('(')
+        stack.append(')' + length)
+        for i, child in enumerate(reversed(children[item])):
+            if i:
+                stack.append(',')
+            stack.append(child)
+    return ''.join(parts) + ';'
+
+
+def metadata_rows(names, tip_times, seed=0):
+    """Metadata rows (strain, Region, date) for the tips of a synthetic tree.
+
+    Dates agree with the tip times; 55% are full dates, 20% `YYYY-MM-XX`,
+    20% `YYYY-XX-XX` and 5% missing.
+    """
+    rng = np.random.default_rng(seed + 1)
+    regions = rng.choice(REGIONS, size=len(names), p=REGION_WEIGHTS)
+    precision = rng.choice(['day', 'month', 'year', 'missing'], size=len(names), p=[0.55, 0.2, 0.2, 0.05])
+    rows = []
+    for name, region, decimal_year, kind in zip(names, regions, tip_times, precision):
+        year = int(decimal_year)
+        day_of_year = int((decimal_year - year) * 365)
+        month = min(12, day_of_year // 31 + 1)
+        day = min(28, day_of_year % 31 + 1)
+        if kind == 'day':
+            date = f'{year}-{month:02d}-{day:02d}'
+        elif kind == 'month':
+            date = f'{year}-{month:02d}-XX'
+        elif kind == 'year':
+            date = f'{year}-XX-XX'
+        else:
+            date = ''
+        rows.append((name, region, date))
+    return rows
+
+
+def write_dataset(n, outdir, seed=0):
+    """Write `tree_<n>.nwk` and `metadata_<n>.tsv` to `outdir`; returns both paths."""
+    os.makedirs(outdir, exist_ok=True)
+    names = strain_names(n)
+    parent, time, tip_times = random_tree(n, seed)
+    tree_path = os.path.join(outdir, f'tree_{n}.nwk')
+    metadata_path = os.path.join(outdir, f'metadata_{n}.tsv')
+    with open(tree_path, 'w') as handle:
+        handle.write(to_newick(parent, time, names) + '\n')
+    with open(metadata_path, 'w') as handle:
+        handle.write('strain\tRegion\tdate\n')
+        for row in metadata_rows(names, tip_times, seed):
+            handle.write('\t'.join(row) + '\n')
+    return tree_path, metadata_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('tips', type=int, nargs='+')
+    parser.add_argument('--outdir', default='synthetic')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    for n in args.tips:
+        for path in write_dataset(n, args.outdir, args.seed):
+            print(f"Wrote {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,21 @@
-import baltic as bt
 import pandas as pd
 import matplotlib.pyplot as plt
 from matplotlib import gridspec
 import numpy as np
 import matplotlib as mpl
 
-# Load your tree using baltic's loadNewick function
-ll = bt.loadNewick('/content/tree_2025.nwk')
+from wnv_trees.clades import bubble_sizes, clade_counts, majority, pure_clades
+from wnv_trees.dating import set_node_times
+from wnv_trees.layout import layout_baltic
+from wnv_trees.lca import LCAIndex
+from wnv_trees.metadata import load_metadata
+from wnv_trees.tree_cache import load_tree
 
-# Load your metadata
-metadata = pd.read_csv('/content/updated_metadata.tsv', sep='\t')
+# Load your tree with baltic's loadNewick, via the on-disk parsed-tree cache
+ll = load_tree('/content/tree_2025.nwk')
+
+# Load the columns we use, with year/decimal_year/broad_region derived and cached
+metadata = load_metadata('/content/updated_metadata.tsv')
 print("Metadata shape:", metadata.shape)
 print("Metadata columns:", metadata.columns.tolist())
 print("\nRegion value counts:")
@@ -19,24 +25,13 @@ print(metadata['Region'].value_counts())
 ne_regions = ['NE_Central', 'NE_West', 'NE_East']
 ne_metadata = metadata[metadata['Region'].isin(ne_regions)]
 
-# Extract year from date column and filter for 2023
-def extract_year(date_str):
-    if pd.isna(date_str):
-        return None
-    # For YYYY-XX-XX format, just take the first 4 characters
-    import re
-    year_match = re.search(r'^(\d{4})', str(date_str))
-    if year_match:
-        return int(year_match.group(1))
-    return None
-
-metadata['year'] = metadata['date'].apply(extract_year)
+# Filter for 2023 using the year column derived by load_metadata
 ne_2023 = metadata[(metadata['Region'].isin(ne_regions)) & (metadata['year'] == 2023)]
 
 print(f"\nFiltered to {len(ne_2023)} Nebraska 2023 samples")
 if len(ne_2023) > 0:
     print("NE 2023 Region breakdown:")
-    print(ne_2023['Region'].value_counts())
+    print(ne_2023['Region'].cat.remove_unused_categories().value_counts())
 
 # Create strain-to-metadata mapping
 strain_to_region = dict(zip(metadata['strain'], metadata['Region']))
@@ -46,61 +41,11 @@ strain_to_date = dict(zip(metadata['strain'], metadata['date']))
 # Create a mapping for Nebraska 2023 samples
 ne_2023_strains = set(ne_2023['strain'])
 
-# Convert dates to decimal years for time axis
-def date_to_decimal_year(date_str):
-    if pd.isna(date_str):
-        return None
-    try:
-        # Parse YYYY-XX-XX format
-        parts = str(date_str).split('-')
-        if len(parts) >= 3:
-            year = int(parts[0])
-            month = int(parts[1]) if parts[1] != 'XX' else 6  # Default to mid-year if XX
-            day = int(parts[2]) if parts[2] != 'XX' else 15    # Default to mid-month if XX
-
-            # Convert to decimal year
-            from datetime import datetime
-            date_obj = datetime(year, month, day)
-            year_start = datetime(year, 1, 1)
-            year_end = datetime(year + 1, 1, 1)
-            year_fraction = (date_obj - year_start).total_seconds() / (year_end - year_start).total_seconds()
-            return year + year_fraction
-        else:
-            return int(parts[0])  # Just return year if only year provided
-    except:
-        return extract_year(date_str)  # Fallback to year extraction
-
-# Add decimal years to metadata
-metadata['decimal_year'] = metadata['date'].apply(date_to_decimal_year)
+# Decimal years for the time axis
 strain_to_decimal_year = dict(zip(metadata['strain'], metadata['decimal_year']))
 
-# First, set absoluteTime for all nodes based on tree structure
-# We'll use a recursive approach to set times from tips to root
-def set_node_times(node):
-    if node.branchType == 'leaf':
-        # For tips, use the date from metadata
-        if hasattr(node, 'name') and node.name:
-            decimal_year = strain_to_decimal_year.get(node.name, None)
-            if decimal_year is not None:
-                node.absoluteTime = decimal_year
-            else:
-                node.absoluteTime = 2020  # Default
-    else:
-        # For internal nodes, set time based on children
-        if hasattr(node, 'children') and node.children:
-            # First, ensure all children have times set
-            for child in node.children:
-                set_node_times(child)
-            # Set node time as the average of children times minus branch length
-            child_times = [child.absoluteTime for child in node.children if hasattr(child, 'absoluteTime')]
-            if child_times:
-                node.absoluteTime = min(child_times) - (node.length if hasattr(node, 'length') else 0.1)
-            else:
-                node.absoluteTime = 2010  # Default for internal nodes
-
-# Apply time setting to all nodes
-for node in ll.Objects:
-    set_node_times(node)
+# Set absoluteTime for all nodes in a single post-order pass from tips to root
+set_node_times(ll, strain_to_decimal_year, verbose=True)
 
 # Add traits to tree nodes for coloring
 for node in ll.Objects:
@@ -165,11 +110,7 @@ tip_color_func = lambda k: k.traits['highlight_color'] if (k.is_leaf() and k.tra
 
 # Compress the tree vertically BEFORE plotting
 y_compression_factor = 0.6
-ll.drawTree()  # Set up coordinates first
-for node in ll.Objects:
-    if hasattr(node, 'y'):
-        node.y = node.y * y_compression_factor
-ll.ySpan = ll.ySpan * y_compression_factor
+layout_baltic(ll, compression=y_compression_factor)  # Set up compressed coordinates in one pass
 
 # Use Baltic's plotTree method with branch coloring
 ll.plotTree(ax, x_attr=x_attr, colour=branch_color_func, width=2)
@@ -178,6 +119,21 @@ ll.plotTree(ax, x_attr=x_attr, colour=branch_color_func, width=2)
 ll.plotPoints(ax, x_attr=x_attr, size=lambda k: 100 if k.traits.get('is_ne_2023', False) else 30,
               colour=tip_color_func, zorder=100)
 
+# Per-clade NE 2023 counts by region for every node, in one pass over the tree
+index = LCAIndex.from_tree(ll)
+tip_names = index.atree.names[index.atree.tips]
+ne_counts = clade_counts(index.atree, [strain_to_region[name] if name in ne_2023_strains else None
+                                       for name in tip_names], ne_regions)
+
+# A bubble on every clade made only of NE 2023 samples, sized by its tips
+bubble_nodes = pure_clades(index.atree, ne_counts)
+ne_majority = majority(ne_counts)['category']
+bubble_colors = {'NE_Central': '#FCB614', 'NE_West': '#005E63', 'NE_East': '#AD122A'}
+ax.scatter([index.node(i).absoluteTime for i in bubble_nodes], [index.node(i).y for i in bubble_nodes],
+           s=bubble_sizes(ne_counts, bubble_nodes, scale=60),
+           c=[bubble_colors[r] for r in ne_majority[bubble_nodes]],
+           alpha=0.35, linewidths=0, zorder=90)
+
 # Customize the plot
 ax.set_ylim(-10, ll.ySpan + 10)
 ax.set_xlim(1993, 2025)
@@ -197,6 +153,7 @@ legend_elements = [
     plt.scatter([], [], c='#005E63', s=150, edgecolors='black', linewidth=1, label='NE_West (2023)'),
     plt.scatter([], [], c='#AD122A', s=150, edgecolors='black', linewidth=1, label='NE_East (2023)'),
     plt.scatter([], [], c='#BBBBBB', s=75, edgecolors='black', linewidth=0.5, label='Other samples'),
+    plt.scatter([], [], c='#BBBBBB', s=300, alpha=0.35, label='NE 2023 clade (area by tips)'),
 ]
 
 ax.legend(handles=legend_elements, loc='upper left', fontsize=16,
@@ -218,15 +175,15 @@ print(f"\nNebraska 2023 samples in tree: {len(ne_2023_in_tree)}")
 if len(ne_2023_in_tree) > 0:
     print("Sample names:", list(ne_2023_in_tree)[:10], "..." if len(ne_2023_in_tree) > 10 else "")
 
-# Count by region in tree
-ne_2023_regions_in_tree = {}
-for strain in ne_2023_in_tree:
-    region = strain_to_region.get(strain, 'unknown')
-    ne_2023_regions_in_tree[region] = ne_2023_regions_in_tree.get(region, 0) + 1
-
+# Count by region in tree: the root's row of the per-clade counts
 print(f"Nebraska 2023 samples by region in tree:")
-for region, count in ne_2023_regions_in_tree.items():
+for region, count in zip(ne_counts['categories'], ne_counts['counts'][0]):
     print(f"  {region}: {count}")
 
+print(f"\nNebraska 2023 clades of 2+ samples: {len(bubble_nodes)}")
+for i in bubble_nodes[np.argsort(-ne_counts['tips'][bubble_nodes], kind='stable')][:10]:
+    print(f"  {ne_counts['tips'][i]} tips, majority {ne_majority[i]}, "
+          f"TMRCA {index.node(i).absoluteTime:.2f}")
+
 # Optional: Save the figure
 # plt.savefig('phylogenetic_tree_nebraska_2023_highlighted.png', dpi=300, bbox_inches='tight')
@@ -1,50 +1,19 @@
-import baltic as bt
 import pandas as pd
 import matplotlib.pyplot as plt
 from matplotlib import gridspec
 import numpy as np
-from datetime import datetime
 
-# Load your tree using baltic's loadNewick function
-ll = bt.loadNewick('/content/tree_2025.nwk')
+from wnv_trees.metadata import load_metadata
+from wnv_trees.tree_cache import load_tree
 
-# Load your metadata
-metadata = pd.read_csv('/content/updated_metadata.tsv', sep='\t')
+# Load your tree with baltic's loadNewick, via the on-disk parsed-tree cache
+ll = load_tree('/content/tree_2025.nwk')
+
+# Load the columns we use, with the year column derived and cached
+metadata = load_metadata('/content/updated_metadata.tsv')
 print("Metadata shape:", metadata.shape)
 print("Metadata columns:", metadata.columns.tolist())
 
-# Extract year from date column
-def extract_year(date_str):
-    """Extract year from date string, handling various formats"""
-    if pd.isna(date_str) or date_str == '':
-        return None
-
-    date_str = str(date_str)
-
-    # Handle YYYY-XX-XX format
-    if 'XX' in date_str:
-        year = date_str.split('-')[0]
-        try:
-            return int(year)
-        except:
-            return None
-
-    # Handle other date formats
-    for fmt in ['%Y-%m-%d', '%Y/%m/%d', '%Y', '%m/%d/%Y']:
-        try:
-            return datetime.strptime(date_str, fmt).year
-        except:
-            continue
-
-    # Try to extract just the year if it's a 4-digit number
-    if len(date_str) >= 4 and date_str[:4].isdigit():
-        return int(date_str[:4])
-
-    return None
-
-# Apply year extraction
-metadata['year'] = metadata['date'].apply(extract_year)
-
 # Remove rows without valid years
 metadata_with_years = metadata.dropna(subset=['year'])
 print(f"\nRows with valid years: {len(metadata_with_years)} out of {len(metadata)}")
@@ -1,15 +1,20 @@
-import baltic as bt
 import pandas as pd
 import matplotlib.pyplot as plt
 from matplotlib import gridspec
 import numpy as np
 import matplotlib as mpl
 
-# Load your tree using baltic's loadNewick function
-ll = bt.loadNewick('/content/tree_2025.nwk')
+from wnv_trees.dating import set_node_times
+from wnv_trees.layout import layout_baltic
+from wnv_trees.metadata import load_metadata
+from wnv_trees.render import draw_branches, draw_tip_classes
+from wnv_trees.tree_cache import load_tree
 
-# Load your metadata
-metadata = pd.read_csv('/content/updated_metadata.tsv', sep='\t')
+# Load your tree with baltic's loadNewick, via the on-disk parsed-tree cache
+ll = load_tree('/content/tree_2025.nwk')
+
+# Load the columns we use, with year/decimal_year/broad_region derived and cached
+metadata = load_metadata('/content/updated_metadata.tsv')
 print("Metadata shape:", metadata.shape)
 print("Metadata columns:", metadata.columns.tolist())
 print("\nRegion value counts:")
@@ -19,24 +24,13 @@ print(metadata['Region'].value_counts())
 ne_regions = ['NE_Central', 'NE_West', 'NE_East']
 ne_metadata = metadata[metadata['Region'].isin(ne_regions)]
 
-# Extract year from date column and filter for 2023
-def extract_year(date_str):
-    if pd.isna(date_str):
-        return None
-    # For YYYY-XX-XX format, just take the first 4 characters
-    import re
-    year_match = re.search(r'^(\d{4})', str(date_str))
-    if year_match:
-        return int(year_match.group(1))
-    return None
-
-metadata['year'] = metadata['date'].apply(extract_year)
+# Filter for 2023 using the year column derived by load_metadata
 ne_2023 = metadata[(metadata['Region'].isin(ne_regions)) & (metadata['year'] == 2023)]
 
 print(f"\nFiltered to {len(ne_2023)} Nebraska 2023 samples")
 if len(ne_2023) > 0:
     print("NE 2023 Region breakdown:")
-    print(ne_2023['Region'].value_counts())
+    print(ne_2023['Region'].cat.remove_unused_categories().value_counts())
 
 # Create strain-to-metadata mapping
 strain_to_region = dict(zip(metadata['strain'], metadata['Region']))
@@ -46,61 +40,11 @@ strain_to_date = dict(zip(metadata['strain'], metadata['date']))
 # Create a mapping for Nebraska 2023 samples
 ne_2023_strains = set(ne_2023['strain'])
 
-# Convert dates to decimal years for time axis
-def date_to_decimal_year(date_str):
-    if pd.isna(date_str):
-        return None
-    try:
-        # Parse YYYY-XX-XX format
-        parts = str(date_str).split('-')
-        if len(parts) >= 3:
-            year = int(parts[0])
-            month = int(parts[1]) if parts[1] != 'XX' else 6  # Default to mid-year if XX
-            day = int(parts[2]) if parts[2] != 'XX' else 15    # Default to mid-month if XX
-
-            # Convert to decimal year
-            from datetime import datetime
-            date_obj = datetime(year, month, day)
-            year_start = datetime(year, 1, 1)
-            year_end = datetime(year + 1, 1, 1)
-            year_fraction = (date_obj - year_start).total_seconds() / (year_end - year_start).total_seconds()
-            return year + year_fraction
-        else:
-            return int(parts[0])  # Just return year if only year provided
-    except:
-        return extract_year(date_str)  # Fallback to year extraction
-
-# Add decimal years to metadata
-metadata['decimal_year'] = metadata['date'].apply(date_to_decimal_year)
+# Decimal years for the time axis
 strain_to_decimal_year = dict(zip(metadata['strain'], metadata['decimal_year']))
 
-# First, set absoluteTime for all nodes based on tree structure
-# We'll use a recursive approach to set times from tips to root
-def set_node_times(node):
-    if node.branchType == 'leaf':
-        # For tips, use the date from metadata
-        if hasattr(node, 'name') and node.name:
-            decimal_year = strain_to_decimal_year.get(node.name, None)
-            if decimal_year is not None:
-                node.absoluteTime = decimal_year
-            else:
-                node.absoluteTime = 2020  # Default
-    else:
-        # For internal nodes, set time based on children
-        if hasattr(node, 'children') and node.children:
-            # First, ensure all children have times set
-            for child in node.children:
-                set_node_times(child)
-            # Set node time as the average of children times minus branch length
-            child_times = [child.absoluteTime for child in node.children if hasattr(child, 'absoluteTime')]
-            if child_times:
-                node.absoluteTime = min(child_times) - (node.length if hasattr(node, 'length') else 0.1)
-            else:
-                node.absoluteTime = 2010  # Default for internal nodes
-
-# Apply time setting to all nodes
-for node in ll.Objects:
-    set_node_times(node)
+# Set absoluteTime for all nodes in a single post-order pass from tips to root
+set_node_times(ll, strain_to_decimal_year, verbose=True)
 
 # Add traits to tree nodes for coloring
 for node in ll.Objects:
@@ -144,17 +88,10 @@ L = len(list(filter(lambda k: k.branchType == 'leaf', ll.Objects)))
 # Define attribute functions
 x_attr = lambda k: k.absoluteTime  # Use absolute time (years)
 
-# Set up tree layout
-ll.drawTree()  # This sets up the y coordinates
-
-# MODIFIED: Compress the y-coordinates to make the tree more compact
+# Set up tree layout with the vectorized layout engine
+# MODIFIED: Compress the y-coordinates (and ySpan) to make the tree more compact
 y_compression_factor = 0.6  # Adjust this value to compress more (smaller) or less (larger)
-for node in ll.Objects:
-    if hasattr(node, 'y'):
-        node.y = node.y * y_compression_factor
-
-# Update ySpan after compression
-ll.ySpan = ll.ySpan * y_compression_factor
+layout_baltic(ll, compression=y_compression_factor)
 
 # Function to determine branch color - only color tip branches
 def get_branch_color(node):
@@ -168,39 +105,21 @@ def get_branch_color(node):
         # For internal nodes, use neutral grey
         return '#CCCCCC'
 
-# Draw branches manually with proper coloring
-for node in ll.Objects:
-    if hasattr(node, 'parent') and node.parent:
-        x = node.absoluteTime
-        y = node.y
-        x_parent = node.parent.absoluteTime
-        y_parent = node.parent.y
-
-        # Get color for this branch
-        branch_color = get_branch_color(node)
-
-        # Draw horizontal branch (from parent's x to node's x, at node's y)
-        ax.plot([x_parent, x], [y, y], color=branch_color, linewidth=2, zorder=10, alpha=0.8)
-
-        # Draw vertical connector at parent's x position
-        if hasattr(node.parent, 'children') and len(node.parent.children) > 1:
-            # Get y-coordinates of all siblings
-            sibling_ys = [child.y for child in node.parent.children]
-            # Draw vertical line from min to max y at parent's x position
-            ax.plot([x_parent, x_parent], [min(sibling_ys), max(sibling_ys)],
-                   color=get_branch_color(node.parent), linewidth=2, zorder=9, alpha=0.8)
-
-# Plot all tip points
-for node in ll.Objects:
-    if hasattr(node, 'branchType') and node.branchType == 'leaf':
-        if hasattr(node, 'traits') and node.traits.get('is_ne_2023', False):
-            # Nebraska 2023 samples - larger and colored
-            ax.scatter(node.absoluteTime, node.y, s=100, c=node.traits['highlight_color'],
-                      zorder=20003, edgecolors='black', linewidth=1, alpha=1.0)
-        else:
-            # Other samples - smaller and grey
-            ax.scatter(node.absoluteTime, node.y, s=30, c='#BBBBBB',
-                      zorder=20001, alpha=0.6)
+# Draw all branches as batched line collections, one connector per parent
+draw_branches(ax, ll, x_attr=lambda k: k.absoluteTime, colour=get_branch_color,
+              width=2, alpha=0.8, zorder=10)
+
+# Plot all tip points with one scatter collection per style class
+draw_tip_classes(ax, ll,
+                 classify=lambda k: 'ne_2023' if k.traits.get('is_ne_2023', False) else 'other',
+                 styles={
+                     # Nebraska 2023 samples - larger and colored
+                     'ne_2023': {'colour': lambda k: k.traits['highlight_color'], 'size': 100,
+                                 'edgecolor': 'black', 'linewidth': 1, 'alpha': 1.0, 'zorder': 20003},
+                     # Other samples - smaller and grey
+                     'other': {'colour': '#BBBBBB', 'size': 30, 'alpha': 0.6, 'zorder': 20001},
+                 },
+                 x_attr=lambda k: k.absoluteTime)
 
 # Customize the plot
 ax.set_ylim(-10, ll.ySpan + 10)
@@ -0,0 +1,5 @@
+"""Shared helpers for the West Nile virus Baltic tree figures.
+
+The standalone scripts in the repository root import from this package so the
+tree dating, rendering and metadata handling live in one place.
+"""
@@ -0,0 +1,5 @@
+import sys
+
+from wnv_trees.cli import main
+
+sys.exit(main())
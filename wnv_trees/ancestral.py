@@ -0,0 +1,293 @@
+"""Ancestral state reconstruction of discrete traits such as Region.
+
+The figures colour only tip branches and leave every internal branch grey,
+because the tree carries no Region for its internal nodes. This module
+infers one, working on an `ArrayTree` with the trait as integer codes:
+
+- `fitch`: Fitch parsimony. Each node's candidate states are a bitmask in
+  one uint64, so up to 64 states are handled with bitwise AND/OR. One
+  bottom-up pass intersects (or, when the children share no state, unites)
+  the children's sets. One top-down pass then keeps the parent's state
+  wherever a node allows it.
+- `mk`: marginal reconstruction under the equal-rates Mk model. The
+  per-node conditional likelihoods are an (nodes x states) array. For equal
+  rates, a branch's transition matrix times a vector is
+  `e * L + (1 - e) / k * sum(L)`, so one bottom-up and one top-down pass
+  give every node's posterior state probabilities. Without a rate, the
+  rate is fitted by maximum likelihood with a golden-section search over
+  bottom-up passes.
+
+Tips without a value are unknown (every state allowed), and they are
+reconstructed along with the internal nodes. `reconstruct_tree` runs this
+over a baltic tree and `state_colours` turns its result into a colour
+function for `draw_branches`. `set_ancestral_traits` instead writes the
+states into the nodes' `traits`, for `branch_colours`.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+from wnv_trees.arraytree import ArrayTree
+from wnv_trees.traits import join_tips
+
+METHODS = ('fitch', 'mk')
+MAX_FITCH_STATES = 64
+
+
+def _node_codes(atree, tip_codes):
+    codes = np.full(len(atree), -1, dtype=np.int64)
+    codes[atree.tips] = tip_codes
+    return codes
+
+
+def _lowest_state(sets):
+    # Index of the lowest set bit of each (non-zero) uint64
+    lowest = sets & (~sets + np.uint64(1))
+    return np.log2(lowest.astype(float)).astype(np.int64)
+
+
+def fitch(atree, tip_codes, n_states):
+    """Fitch parsimony reconstruction of integer-coded tip states.
+
+    `tip_codes` are aligned with `atree.tips`, -1 for unknown. Returns a
+    dict with 'states' (a code for every node), 'sets' (the bottom-up
+    candidate sets as uint64 bitmasks), 'ambiguous' (nodes whose set held
+    more than one state) and 'changes' (the parsimony score).
+    """
+    if n_states > MAX_FITCH_STATES:
+        raise ValueError(f'Fitch bitsets hold at most {MAX_FITCH_STATES} states, not {n_states}')
+    n = len(atree)
+    parent = atree.parent
+    full = np.uint64((1 << n_states) - 1) if n_states < 64 else ~np.uint64(0)
+    codes = _node_codes(atree, tip_codes)
+    sets = np.full(n, full, dtype=np.uint64)
+    known = codes >= 0
+    sets[known] = np.left_shift(np.uint64(1), codes[known].astype(np.uint64))
+
+    changes = 0
+    inter = np.full(n, full, dtype=np.uint64)
+    union = np.zeros(n, dtype=np.uint64)
+    for level in reversed(atree.levels()[1:]):
+        np.bitwise_and.at(inter, parent[level], sets[level])
+        np.bitwise_or.at(union, parent[level], sets[level])
+        # Children share a depth, so this level completes its parents
+        parents = np.unique(parent[level])
+        empty = inter[parents] == 0
+        sets[parents] = np.where(empty, union[parents], inter[parents])
+        changes += int(empty.sum())
+
+    states = np.zeros(n, dtype=np.int64)
+    levels = atree.levels()
+    states[levels[0]] = _lowest_state(sets[levels[0]])
+    for level in levels[1:]:
+        inherited = np.left_shift(np.uint64(1), states[parent[level]].astype(np.uint64))
+        keep = (sets[level] & inherited) != 0
+        states[level] = np.where(keep, states[parent[level]], _lowest_state(sets[level]))
+    return {
+        'states': states,
+        'sets': sets,
+        'ambiguous': (sets & (sets - np.uint64(1))) != 0,
+        'changes': changes,
+    }
+
+
+def _transition(values, lengths, rate, k):
+    # Equal-rates Mk transition matrix applied to each row of `values`
+    e = np.exp(-k / (k - 1) * rate * lengths)[:, None]
+    return e * values + (1 - e) / k * values.sum(axis=1, keepdims=True)
+
+
+def _prepare(atree, tip_codes, n_states, min_length):
+    codes = _node_codes(atree, tip_codes)
+    likelihood = np.ones((len(atree), n_states))
+    known = np.flatnonzero(codes >= 0)
+    likelihood[known] = 0.0
+    likelihood[known, codes[known]] = 1.0
+    # Zero-length branches would make a child's message vanish where its state is impossible
+    lengths = np.maximum(np.nan_to_num(atree.length), min_length)
+    return likelihood, lengths
+
+
+def _upward(atree, likelihood, lengths, rate, k):
+    # Fills `likelihood` (rows rescaled to a maximum of 1) and returns the
+    # child-to-parent messages and the log-likelihood
+    parent = atree.parent
+    internal = ~atree.is_leaf
+    messages = np.empty_like(likelihood)
+    log_scale = 0.0
+    for level in reversed(atree.levels()[1:]):
+        nodes = level[internal[level]]
+        if len(nodes):
+            scale = likelihood[nodes].max(axis=1, keepdims=True)
+            likelihood[nodes] /= scale
+            log_scale += np.log(scale).sum()
+        messages[level] = _transition(likelihood[level], lengths[level], rate, k)
+        np.multiply.at(likelihood, parent[level], messages[level])
+    root = atree.levels()[0]
+    scale = likelihood[root].max(axis=1, keepdims=True)
+    likelihood[root] /= scale
+    log_scale += np.log(scale).sum()
+    return messages, float(log_scale + np.log(likelihood[root].mean(axis=1)).sum())
+
+
+def mk_log_likelihood(atree, tip_codes, n_states, rate, min_length=1e-6):
+    """Log-likelihood of the tip states under the equal-rates Mk model with `rate`."""
+    likelihood, lengths = _prepare(atree, tip_codes, n_states, min_length)
+    return _upward(atree, likelihood, lengths, rate, n_states)[1]
+
+
+def fit_mk_rate(atree, tip_codes, n_states, initial=None, span=1e3, iterations=20, min_length=1e-6):
+    """Maximum-likelihood Mk rate, by golden-section search on its logarithm.
+
+    The search covers `initial / span` to `initial * span`. By default,
+    `initial` is the Fitch changes per unit of total branch length.
+    """
+    if initial is None:
+        total = np.nansum(atree.length[atree.parent >= 0])
+        changes = fitch(atree, tip_codes, n_states)['changes'] if n_states <= MAX_FITCH_STATES else 1
+        initial = max(changes, 1) / max(total, 1e-12)
+    score = lambda log_rate: mk_log_likelihood(atree, tip_codes, n_states, math.exp(log_rate), min_length)
+    low, high = math.log(initial / span), math.log(initial * span)
+    golden = (math.sqrt(5) - 1) / 2
+    a, b = high - golden * (high - low), low + golden * (high - low)
+    score_a, score_b = score(a), score(b)
+    for _ in range(iterations):
+        if score_a > score_b:
+            high, b, score_b = b, a, score_a
+            a = high - golden * (high - low)
+            score_a = score(a)
+        else:
+            low, a, score_a = a, b, score_b
+            b = low + golden * (high - low)
+            score_b = score(b)
+    return math.exp((low + high) / 2)
+
+
+def mk(atree, tip_codes, n_states, rate=None, min_length=1e-6):
+    """Marginal ancestral states under the equal-rates Mk model.
+
+    `atree.length` are the branch lengths the `rate` applies to (years on
+    a time tree); `rate=None` fits it with `fit_mk_rate`. Returns a dict
+    with 'states' (the most probable code at every node), 'posterior'
+    ((nodes x states) probabilities), 'confidence' (the posterior of the
+    chosen state), 'rate' and 'log_likelihood'.
+    """
+    k = n_states
+    n = len(atree)
+    if k < 2:
+        states = np.zeros(n, dtype=np.int64)
+        return {'states': states, 'posterior': np.ones((n, max(k, 1))), 'confidence': np.ones(n),
+                'rate': 0.0 if rate is None else rate, 'log_likelihood': 0.0}
+    if rate is None:
+        rate = fit_mk_rate(atree, tip_codes, k, min_length=min_length)
+    likelihood, lengths = _prepare(atree, tip_codes, k, min_length)
+    messages, log_likelihood = _upward(atree, likelihood, lengths, rate, k)
+
+    # Top-down: `outside` is the probability of everything outside a clade,
+    # given each state at its root; the root's is the uniform prior
+    parent = atree.parent
+    levels = atree.levels()
+    outside = np.empty_like(likelihood)
+    outside[levels[0]] = 1.0 / k
+    for level in levels[1:]:
+        up = parent[level]
+        # The parent's likelihood without this child's message, times the parent's outside
+        rest = outside[up] * likelihood[up] / messages[level]
+        rest /= rest.max(axis=1, keepdims=True)
+        outside[level] = _transition(rest, lengths[level], rate, k)
+    posterior = outside
+    posterior *= likelihood
+    posterior /= posterior.sum(axis=1, keepdims=True)
+    states = posterior.argmax(axis=1)
+    return {
+        'states': states,
+        'posterior': posterior,
+        'confidence': posterior[np.arange(n), states],
+        'rate': float(rate),
+        'log_likelihood': log_likelihood,
+    }
+
+
+def reconstruct(atree, tip_values, method='fitch', categories=None, rate=None):
+    """Reconstruct a trait for every node of `atree` from its tips' values.
+
+    `tip_values` are aligned with `atree.tips`, with None/NaN for unknown.
+    `categories` fixes the states (default: the sorted distinct values).
+    Returns the `fitch` or `mk` result plus 'categories' and 'values' (the
+    state of every node as an object array).
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {', '.join(METHODS)}")
+    tip_values = np.asarray(tip_values, dtype=object)
+    if categories is None:
+        codes, categories = pd.factorize(tip_values, sort=True)
+    else:
+        codes = pd.Index(list(categories)).get_indexer(tip_values)
+    categories = list(categories)
+    if method == 'fitch':
+        result = fitch(atree, codes, len(categories))
+    else:
+        result = mk(atree, codes, len(categories), rate=rate)
+    result['categories'] = categories
+    # No categories at all leaves every node None
+    result['values'] = np.array(categories + [None], dtype=object)[result['states'] if categories else -1]
+    return result
+
+
+def _preorder(tree):
+    # The pre-order walk ArrayTree.from_baltic numbers the nodes by
+    order = []
+    stack = [tree.root]
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        if node.branchType != 'leaf':
+            stack.extend(reversed(node.children))
+    return order
+
+
+def reconstruct_tree(tree, metadata, column, method='fitch', key='strain', rate=None):
+    """Reconstruct metadata `column` over a baltic tree without changing its nodes.
+
+    Categorical columns keep their categories as the states. Returns the
+    `reconstruct` result plus 'nodes', the baltic nodes in the order of
+    its arrays, so `values[i]` is the state of `nodes[i]`.
+    """
+    atree = ArrayTree.from_baltic(tree)
+    table = join_tips(atree.names[atree.tips], metadata, key=key, columns=[column])
+    dtype = metadata[column].dtype
+    categories = list(dtype.categories) if isinstance(dtype, pd.CategoricalDtype) else None
+    result = reconstruct(atree, table[column], method=method, categories=categories, rate=rate)
+    result['nodes'] = _preorder(tree)
+    return result
+
+
+def set_ancestral_traits(tree, metadata, column, method='fitch', key='strain', rate=None):
+    """Reconstruct metadata `column` over a baltic tree and store it in every node's traits.
+
+    Each node gets `traits[column]` (its tips the metadata value when known,
+    otherwise the reconstructed state). With 'mk' it also gets
+    `traits[column + '_confidence']`. Returns the `reconstruct_tree` result.
+    """
+    result = reconstruct_tree(tree, metadata, column, method=method, key=key, rate=rate)
+    confidence = result.get('confidence')
+    for i, node in enumerate(result['nodes']):
+        node.traits[column] = result['values'][i]
+        if confidence is not None:
+            node.traits[f'{column}_confidence'] = float(confidence[i])
+    return result
+
+
+def branch_colours(column, colours, default='#CCCCCC'):
+    """A `draw_branches` colour function: each branch by its node's `traits[column]`."""
+    return lambda k: colours.get(k.traits.get(column), default)
+
+
+def state_colours(result, colours, default='#CCCCCC'):
+    """A `draw_branches` colour function: each branch by its node's state in `result`.
+
+    `result` is from `reconstruct_tree`; the nodes' traits are not read.
+    """
+    by_node = {id(node): colours.get(value, default) for node, value in zip(result['nodes'], result['values'])}
+    return lambda k: by_node.get(id(k), default)
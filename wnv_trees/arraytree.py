@@ -0,0 +1,258 @@
+"""Struct-of-arrays form of a baltic tree.
+
+A baltic tree keeps every node as a Python object with its own attribute and
+`traits` dicts, which dominates memory once trees reach hundreds of
+thousands of nodes. `ArrayTree` holds the same tree as a handful of numpy
+arrays indexed by node: parent, first child and next sibling for topology,
+branch length, height, time, x and y, and each trait as an integer code
+column with a list of categories.
+
+Nodes are stored in pre-order following each node's children, so a node's
+parent always comes before it and reversing the order gives a post-order.
+Work that has to visit parents after children is done one depth level at a
+time, with every level handled by numpy.
+"""
+import numpy as np
+
+from wnv_trees.tree_cache import arrays_to_tree, pack_strings, tree_to_arrays, unpack_strings
+
+
+def _missing(value):
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+
+class ArrayTree:
+    """A tree as parallel numpy arrays, convertible to and from baltic objects.
+
+    Attributes, all of length `n` and indexed by node in pre-order:
+    `parent`, `first_child` and `next_sibling` (int32, -1 for none),
+    `is_leaf` (bool), `names` (object, '' for internal nodes) and the float
+    arrays `length`, `height`, `time`, `x` and `y` (NaN when unset).
+    `traits` maps a trait name to a `(codes, categories)` pair, with code -1
+    for nodes that don't have the trait.
+    """
+
+    def __init__(self, parent, length, names, is_leaf=None):
+        self.parent = np.asarray(parent, dtype=np.int32)
+        n = len(self.parent)
+        self.length = np.asarray(length, dtype=float)
+        self.names = np.asarray(names, dtype=object)
+        if is_leaf is None:
+            is_leaf = np.ones(n, dtype=bool)
+            is_leaf[self.parent[self.parent >= 0]] = False
+        self.is_leaf = np.asarray(is_leaf, dtype=bool)
+        self.height = np.full(n, np.nan)
+        self.time = np.full(n, np.nan)
+        self.x = np.full(n, np.nan)
+        self.y = np.full(n, np.nan)
+        self.traits = {}
+        self.first_child, self.next_sibling = self._siblings()
+        self._levels = None
+
+    def __len__(self):
+        return len(self.parent)
+
+    @property
+    def tips(self):
+        """Indices of the tips, in drawing order."""
+        return np.flatnonzero(self.is_leaf)
+
+    def _siblings(self):
+        n = len(self.parent)
+        first_child = np.full(n, -1, dtype=np.int32)
+        next_sibling = np.full(n, -1, dtype=np.int32)
+        children = np.flatnonzero(self.parent >= 0)
+        if len(children):
+            # Pre-order keeps each parent's children in ascending index order
+            by_parent = children[np.argsort(self.parent[children], kind='stable')]
+            parents = self.parent[by_parent]
+            starts = np.r_[True, parents[1:] != parents[:-1]]
+            first_child[parents[starts]] = by_parent[starts]
+            same = parents[1:] == parents[:-1]
+            next_sibling[by_parent[:-1][same]] = by_parent[1:][same]
+        return first_child, next_sibling
+
+    def children(self, i):
+        """Indices of node `i`'s children, in order."""
+        out = []
+        child = self.first_child[i]
+        while child >= 0:
+            out.append(int(child))
+            child = self.next_sibling[child]
+        return out
+
+    def depth(self):
+        """Number of ancestors of every node, by pointer jumping (O(n log depth))."""
+        rank = (self.parent >= 0).astype(np.int64)
+        jump = self.parent.astype(np.int64)
+        live = jump >= 0
+        while live.any():
+            idx = np.flatnonzero(live)
+            rank[idx] += rank[jump[idx]]
+            jump[idx] = jump[jump[idx]]
+            live[idx] = jump[idx] >= 0
+        return rank
+
+    def levels(self):
+        """Node indices grouped by depth, root level first."""
+        if self._levels is None:
+            depth = self.depth()
+            order = np.argsort(depth, kind='stable')
+            bounds = np.flatnonzero(np.diff(depth[order])) + 1
+            self._levels = np.split(order, bounds)
+        return self._levels
+
+    def clade_sizes(self):
+        """Number of nodes in every node's clade, itself included.
+
+        A clade is stored contiguously, so node `i`'s clade is the index range
+        `[i, i + size[i])`.
+        """
+        size = np.ones(len(self), dtype=np.int64)
+        for level in reversed(self.levels()[1:]):
+            np.add.at(size, self.parent[level], size[level])
+        return size
+
+    def child_reduce(self, values, ufunc, initial):
+        """Reduce `values` over each node's children with `ufunc` (e.g. np.minimum).
+
+        Only valid when `values` are already final for every child; see
+        `bottom_up` for values that depend on the reduction itself.
+        """
+        out = np.full(len(self), initial, dtype=float)
+        children = np.flatnonzero(self.parent >= 0)
+        ufunc.at(out, self.parent[children], values[children])
+        return out
+
+    def bottom_up(self, tip_values, combine, ufunc, initial):
+        """Fill internal nodes from their children, deepest level first.
+
+        Tips keep `tip_values`; each internal node gets
+        `combine(nodes, reduction)`, where the reduction applies `ufunc`
+        (e.g. np.add, np.fmin) over its children's values starting from
+        `initial`.
+        """
+        values = np.array(tip_values, dtype=float)
+        for level in reversed(self.levels()[1:]):
+            # All children of a node share a depth, so this level finishes its parents
+            parents, inverse = np.unique(self.parent[level], return_inverse=True)
+            reduced = np.full(len(parents), initial, dtype=float)
+            ufunc.at(reduced, inverse, values[level])
+            values[parents] = combine(parents, reduced)
+        return values
+
+    def cumulative_from_root(self, values):
+        """Sum `values` along the path from the root to every node (inclusive)."""
+        out = np.array(values, dtype=float)
+        for level in self.levels()[1:]:
+            out[level] += out[self.parent[level]]
+        return out
+
+    def set_trait(self, name, values):
+        """Store a node-aligned column of values as integer codes; None/NaN become -1."""
+        values = list(values)
+        categories = sorted({value for value in values if not _missing(value)}, key=str)
+        lookup = {value: i for i, value in enumerate(categories)}
+        codes = np.array([-1 if _missing(value) else lookup[value] for value in values], dtype=np.int32)
+        self.traits[name] = (codes, categories)
+
+    def set_tip_trait(self, name, mapping, default=None):
+        """Set trait `name` on the tips from a name->value `mapping`; internal nodes get -1."""
+        values = [mapping.get(self.names[i], default) if self.is_leaf[i] else None for i in range(len(self))]
+        self.set_trait(name, values)
+
+    def trait(self, name):
+        """Decode trait `name` back to an object array, None where unset."""
+        codes, categories = self.traits[name]
+        decoded = np.empty(len(codes), dtype=object)
+        table = np.array(list(categories) + [None], dtype=object)
+        decoded[:] = table[codes]
+        return decoded
+
+    def layout(self):
+        """Set `x` to height and `y` as baltic's `drawTree` does, returning the y span.
+
+        Tips are stacked top to bottom in stored order and every internal
+        node sits at the mean y of its children; see `wnv_trees.layout` for
+        other orders and options.
+        """
+        from wnv_trees.layout import compute_layout
+        if np.isnan(self.height).any():
+            self.height = self.cumulative_from_root(np.nan_to_num(self.length))
+        self.y = compute_layout(self)['y']
+        self.x = self.height.copy()
+        return self.y_span()
+
+    def y_span(self):
+        """The y-axis span baltic stores as `tree.ySpan`."""
+        return float(np.nanmax(self.y) - np.nanmin(self.y) + np.nanmin(self.y) * 2)
+
+    @classmethod
+    def from_baltic(cls, tree):
+        """Build an ArrayTree from a loaded baltic tree.
+
+        Copies the topology, lengths, heights, layout, `absoluteTime` (when
+        set) and every key of each node's `traits` dict, plus `time_source`.
+        """
+        arrays = tree_to_arrays(tree)
+        names = unpack_strings(arrays['names'], len(arrays['parent']))
+        atree = cls(arrays['parent'], arrays['length'], names, is_leaf=arrays['is_leaf'])
+        atree.height = arrays['height']
+        atree.x = arrays['x']
+        atree.y = arrays['y']
+
+        # Same pre-order walk as tree_to_arrays, to read the per-object extras
+        order = []
+        stack = [tree.root]
+        while stack:
+            k = stack.pop()
+            order.append(k)
+            if k.branchType != 'leaf':
+                stack.extend(reversed(k.children))
+        atree.time = np.array([getattr(k, 'absoluteTime', np.nan) for k in order], dtype=float)
+        keys = sorted({key for k in order for key in k.traits})
+        for key in keys:
+            atree.set_trait(key, [k.traits.get(key) for k in order])
+        if any(hasattr(k, 'time_source') for k in order):
+            atree.set_trait('time_source', [getattr(k, 'time_source', None) for k in order])
+        return atree
+
+    def to_baltic(self):
+        """Rebuild baltic objects, with `absoluteTime`, `time_source` and traits set.
+
+        Lays the tree out first if it has no y coordinates yet.
+        """
+        if np.isnan(self.y).any():
+            self.layout()
+        n = len(self)
+        tip_y = np.where(self.is_leaf, self.y, np.nan)
+        y_min = self.bottom_up(tip_y, lambda nodes, low: low, np.fmin, np.inf)
+        y_max = self.bottom_up(tip_y, lambda nodes, high: high, np.fmax, -np.inf)
+        y_range = np.where(self.is_leaf[:, None], np.nan, np.column_stack([y_min, y_max]))
+        tree = arrays_to_tree({
+            'parent': self.parent,
+            'is_leaf': self.is_leaf,
+            'index': np.arange(n),
+            'length': self.length,
+            'height': self.height,
+            'x': self.x,
+            'y': self.y,
+            'y_range': y_range,
+            'names': pack_strings(['' if _missing(name) else str(name) for name in self.names]),
+            'trait_nodes': np.zeros(0, dtype=np.int64),
+            'traits': pack_strings([]),
+            'tree_height': np.array(np.nanmax(self.height)),
+            'y_span': np.array(self.y_span()),
+        })
+
+        columns = {name: self.trait(name) for name in self.traits if name != 'time_source'}
+        sources = self.trait('time_source') if 'time_source' in self.traits else None
+        for i, k in enumerate(tree.Objects):
+            if not np.isnan(self.time[i]):
+                k.absoluteTime = float(self.time[i])
+            if sources is not None and sources[i] is not None:
+                k.time_source = sources[i]
+            for name, values in columns.items():
+                if values[i] is not None:
+                    k.traits[name] = values[i]
+        return tree
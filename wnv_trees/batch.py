@@ -0,0 +1,143 @@
+"""Render several figures in parallel worker processes with the Agg backend.
+
+The parent process loads, annotates and dates everything the requested
+figures need before starting the pool. Workers are forked from it, so they
+share the annotated tree copy-on-write instead of each parsing it again. On
+platforms without fork the workers rebuild the pipeline, which then comes
+straight from the on-disk tree and metadata caches.
+
+Each figure is drawn once and saved in every requested format. When the
+pipeline rasterizes background layers, PDF and SVG files are saved at its
+`rasterize` DPI, which only sets the resolution of those embedded images.
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from wnv_trees.profiling import Profiler, count_artists
+
+FORMATS = ('png', 'pdf', 'svg')
+VECTOR_FORMATS = ('pdf', 'svg')
+
+# Set in the parent before forking, or by _init_worker when spawning
+_PIPELINE = None
+
+
+def figure_inputs(names):
+    """Pipeline attributes the figures in `names` read, in loading order."""
+    from wnv_trees.figures import FIGURE_INPUTS
+    inputs = []
+    for name in names:
+        for attribute in FIGURE_INPUTS[name]:
+            if attribute not in inputs:
+                inputs.append(attribute)
+    return inputs
+
+
+def prepare(pipeline, names):
+    """Load everything the figures in `names` need, so workers only draw."""
+    for attribute in figure_inputs(names):
+        getattr(pipeline, attribute)
+    return pipeline
+
+
+def render_figure(pipeline, name, outdir, formats=('png',), dpi=300):
+    """Draw figure `name` and save it as `outdir/name.<format>` for each format.
+
+    Returns (paths, timings), where timings maps stage names to seconds.
+    PDF and SVG are saved at `pipeline.rasterize` DPI when that is set.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    from wnv_trees.figures import FIGURES
+
+    profiler = pipeline.profiler
+    timings = {}
+    start = time.perf_counter()
+    with profiler.span(f'draw {name}'):
+        fig = FIGURES[name](pipeline)
+        if profiler.enabled:
+            profiler.annotate(artists=count_artists(fig))
+    timings[f'draw {name}'] = time.perf_counter() - start
+
+    paths = []
+    for fmt in formats:
+        path = os.path.join(outdir, f'{name}.{fmt}')
+        save_dpi = pipeline.rasterize if pipeline.rasterize and fmt in VECTOR_FORMATS else dpi
+        start = time.perf_counter()
+        with profiler.span(f'save {name}.{fmt}'):
+            fig.savefig(path, dpi=save_dpi, bbox_inches='tight')
+        timings[f'save {name}.{fmt}'] = time.perf_counter() - start
+        paths.append(path)
+    plt.close(fig)
+    return paths, timings
+
+
+def _init_worker(pipeline_args):
+    global _PIPELINE
+    if _PIPELINE is None:
+        from wnv_trees.pipeline import Pipeline
+        _PIPELINE = Pipeline(**pipeline_args)
+    else:
+        # Forked: drop the parent's records so only this worker's come back
+        _PIPELINE.profiler.drain()
+
+
+def _render_in_worker(name, outdir, formats, dpi):
+    paths, timings = render_figure(_PIPELINE, name, outdir, formats, dpi)
+    return paths, timings, _PIPELINE.profiler.drain()
+
+
+def render_figures(pipeline, names, outdir, formats=('png',), dpi=300, jobs=None):
+    """Render `names` into `outdir`, using up to `jobs` worker processes.
+
+    `jobs=None` uses one process per figure up to the number of CPUs, and
+    `jobs=1` renders in this process. Worker timings are merged into
+    `pipeline.timings`, and their profiling records into `pipeline.profiler`;
+    with several workers the summed timings are CPU time spread over
+    processes rather than wall-clock time. Returns the list of written
+    paths.
+    """
+    global _PIPELINE
+    formats = tuple(formats)
+    unknown = [fmt for fmt in formats if fmt not in FORMATS]
+    if unknown:
+        raise ValueError(f"Unsupported format(s) {', '.join(unknown)}; choose from {', '.join(FORMATS)}")
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    jobs = max(1, min(jobs, len(names)))
+    os.makedirs(outdir, exist_ok=True)
+
+    prepare(pipeline, names)
+
+    paths = []
+    if jobs == 1:
+        results = [render_figure(pipeline, name, outdir, formats, dpi) + ([],) for name in names]
+    else:
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+        pipeline_args = {
+            'tree_path': pipeline.tree_path, 'metadata_path': pipeline.metadata_path,
+            'divergence_tree_path': pipeline.divergence_tree_path,
+            'cache_dir': pipeline.cache_dir, 'use_cache': pipeline.use_cache,
+            'collapse': pipeline.collapse, 'rasterize': pipeline.rasterize, 'dating': pipeline.dating,
+            'profiler': Profiler(pipeline.profiler.enabled, pipeline.profiler.trace_memory),
+        }
+        _PIPELINE = pipeline if context.get_start_method() == 'fork' else None
+        try:
+            with ProcessPoolExecutor(max_workers=jobs, mp_context=context,
+                                     initializer=_init_worker, initargs=(pipeline_args,)) as pool:
+                futures = [pool.submit(_render_in_worker, name, outdir, formats, dpi) for name in names]
+                results = [future.result() for future in futures]
+        finally:
+            _PIPELINE = None
+
+    for figure_paths, timings, records in results:
+        paths.extend(figure_paths)
+        pipeline.profiler.records.extend(records)
+        for stage, seconds in timings.items():
+            pipeline.timings[stage] = pipeline.timings.get(stage, 0.0) + seconds
+    return paths
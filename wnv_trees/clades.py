@@ -0,0 +1,165 @@
+"""Per-clade category counts for every node, computed in one pass.
+
+Clade summaries such as "how many descendant tips per Region, broad region
+or year" have meant collecting each internal node's leaves and counting them
+in Python, once per node and per column. On a large tree that makes the
+work quadratic. Here the counts for every node come from one numpy pass.
+Nodes are stored in pre-order (see `ArrayTree`), so a clade's tips are
+the tips in the contiguous index range `[i, i + size[i])`. A running total of
+one-hot tip rows then gives every clade's count matrix row as the difference
+of two prefix rows. The result is a (node x category) count array. Bubble
+sizes, majority categories and clade tables are then slices of it.
+"""
+import numpy as np
+import pandas as pd
+
+from wnv_trees.traits import join_tips
+
+COLUMNS = ('Region', 'broad_region', 'year')
+
+
+def _label(category):
+    # Years come out of the metadata as floats; show 2023 rather than 2023.0
+    if isinstance(category, float) and category.is_integer():
+        return int(category)
+    return category
+
+
+def count_matrix(atree, tip_codes, n_categories):
+    """(nodes x categories) count of each category code among every node's tips.
+
+    `tip_codes` are aligned with `atree.tips`, -1 for tips without a category.
+    """
+    tip_codes = np.asarray(tip_codes, dtype=np.int64)
+    tips = atree.tips
+    size = atree.clade_sizes()
+    known = tip_codes >= 0
+    # Row j + 1 of `running` counts the categories of the tips among nodes 0..j
+    running = np.zeros((len(atree) + 1, n_categories), dtype=np.int32)
+    running[tips[known] + 1, tip_codes[known]] = 1
+    np.cumsum(running, axis=0, out=running)
+    nodes = np.arange(len(atree))
+    return running[nodes + size] - running[nodes]
+
+
+def clade_counts(atree, tip_values, categories=None):
+    """Count the categories of `tip_values` among every node's descendant tips.
+
+    `tip_values` are aligned with `atree.tips` (e.g. a `join_tips` column);
+    None and NaN are not counted. `categories` fixes the column order and
+    defaults to the sorted distinct values. Returns a dict with
+    'categories', 'counts' ((nodes x categories) int32, a tip's row being
+    its own category), 'tips' (all descendant tips of each node, counted or
+    not) and 'size' (nodes in each clade).
+    """
+    tip_values = np.asarray(tip_values, dtype=object)
+    if categories is None:
+        codes, categories = pd.factorize(tip_values, sort=True)
+    else:
+        codes = pd.Index(list(categories)).get_indexer(tip_values)
+    size = atree.clade_sizes()
+    tip_total = np.cumsum(np.r_[0, atree.is_leaf.astype(np.int64)])
+    nodes = np.arange(len(atree))
+    return {
+        'categories': [_label(category) for category in categories],
+        'counts': count_matrix(atree, codes, len(categories)),
+        'tips': tip_total[nodes + size] - tip_total[nodes],
+        'size': size,
+    }
+
+
+def trait_counts(atree, metadata, columns=COLUMNS, key='strain'):
+    """`clade_counts` of several metadata columns, joined to the tips once.
+
+    Categorical columns keep their categories (used or not) as the column
+    order, so tables for different trees line up. Returns a dict from
+    column name to its `clade_counts` result.
+    """
+    names = atree.names[atree.tips]
+    table = join_tips(names, metadata, key=key, columns=list(columns))
+    out = {}
+    for column in columns:
+        dtype = metadata[column].dtype
+        categories = list(dtype.categories) if isinstance(dtype, pd.CategoricalDtype) else None
+        out[column] = clade_counts(atree, table[column], categories)
+    return out
+
+
+def majority(counts):
+    """The most common category of every node and the share of its counted tips.
+
+    Returns a dict with 'category' (an object array, None for nodes with no
+    counted tips) and 'share' (NaN for those nodes). Ties go to the first
+    category.
+    """
+    matrix = counts['counts']
+    best = matrix.argmax(axis=1)
+    counted = matrix.sum(axis=1)
+    labels = np.array(list(counts['categories']) + [None], dtype=object)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        share = matrix[np.arange(len(matrix)), best] / counted
+    return {'category': labels[np.where(counted > 0, best, -1)], 'share': share}
+
+
+def bubble_sizes(counts, nodes, categories=None, scale=10.0, minimum=0.0):
+    """Marker areas for `nodes` proportional to their number of tips in `categories`.
+
+    `categories` (default: all of them) are summed; the area is
+    `minimum + scale * count`, in points squared as `scatter` expects.
+    """
+    matrix = counts['counts'][np.asarray(nodes, dtype=np.int64)]
+    if categories is not None:
+        columns = [counts['categories'].index(category) for category in categories]
+        matrix = matrix[:, columns]
+    return minimum + scale * matrix.sum(axis=1)
+
+
+def pure_clades(atree, counts, min_tips=2):
+    """Roots of the maximal clades whose tips all have a counted category.
+
+    With counts of, say, the Nebraska 2023 samples by region, these are the
+    largest clades made only of those samples. Nested clades are left out,
+    and so are clades of fewer than `min_tips` tips.
+    """
+    pure = (counts['counts'].sum(axis=1) == counts['tips']) & (counts['tips'] > 0)
+    parent = atree.parent
+    has_parent = parent >= 0
+    top = pure.copy()
+    top[has_parent] &= ~pure[parent[has_parent]]
+    return np.flatnonzero(top & ~atree.is_leaf & (counts['tips'] >= min_tips))
+
+
+def clade_table(atree, counts, nodes=None, min_tips=2, proportions=False):
+    """A DataFrame with one row per clade and one count column per category.
+
+    `nodes` defaults to every internal node with at least `min_tips` tips.
+    Each row gives the node index, its first and last tip (which, with the
+    tips in drawing order, identify the clade), 'tips', the node's 'time'
+    and 'height', the per-category counts (or shares of the counted tips,
+    with `proportions`) and the majority category with its share.
+    """
+    if nodes is None:
+        nodes = np.flatnonzero(~atree.is_leaf & (counts['tips'] >= min_tips))
+    nodes = np.asarray(nodes, dtype=np.int64)
+    tips = atree.tips
+    # Position of each clade's first tip among the tips
+    first = np.searchsorted(tips, nodes)
+    last = first + counts['tips'][nodes] - 1
+    matrix = counts['counts'][nodes]
+    if proportions:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            matrix = matrix / matrix.sum(axis=1, keepdims=True)
+    winner = majority(counts)
+    table = pd.DataFrame({
+        'node': nodes,
+        'first_tip': atree.names[tips[first]],
+        'last_tip': atree.names[tips[last]],
+        'tips': counts['tips'][nodes],
+        'time': atree.time[nodes],
+        'height': atree.height[nodes],
+    })
+    for i, category in enumerate(counts['categories']):
+        table[str(category)] = matrix[:, i]
+    table['majority'] = winner['category'][nodes]
+    table['majority_share'] = winner['share'][nodes]
+    return table
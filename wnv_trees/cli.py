@@ -0,0 +1,443 @@
+"""Command-line entry point: `wnv-trees render --figures ne2023,unmc-regions,...`.
+
+All requested figures are drawn from a single `Pipeline`, so the tree and
+metadata are loaded, annotated and dated once however many figures are asked
+for; the figures themselves are drawn and saved headless in parallel worker
+processes. Per-stage timings are printed at the end.
+"""
+import argparse
+import os
+import sys
+import time
+
+from wnv_trees.profiling import FORMATS as PROFILE_FORMATS, Profiler
+
+
+def _figure_names(value):
+    from wnv_trees.figures import FIGURES
+    if value == 'all':
+        return list(FIGURES)
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in FIGURES]
+    if unknown:
+        raise argparse.ArgumentTypeError(
+            f"unknown figure(s) {', '.join(unknown)}; choose from {', '.join(FIGURES)}")
+    return names
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='wnv-trees', description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    render = commands.add_parser('render', help='Render figures from one loaded tree and metadata table')
+    render.add_argument('--figures', type=_figure_names, default='all',
+                        help="Comma-separated figure names, or 'all' (default)")
+    render.add_argument('--tree', default='tree_2025.nwk', help='Time tree in Newick format')
+    render.add_argument('--divergence-tree', default='tree_NE_2025.nwk',
+                        help="Tree drawn against divergence by the 'divergence' figure")
+    render.add_argument('--metadata', default='updated_metadata.tsv', help='Metadata TSV')
+    render.add_argument('--outdir', default='figures', help='Directory to write figures to')
+    render.add_argument('--format', default='png',
+                        help='Comma-separated output formats: png, pdf and/or svg')
+    render.add_argument('--dpi', type=int, default=300)
+    render.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Worker processes (default: one per figure, up to the CPU count)')
+    render.add_argument('--collapse', type=int, default=None, metavar='MIN_TIPS',
+                        help='Draw background clades of at least MIN_TIPS tips with no highlighted '
+                             'samples as wedges')
+    render.add_argument('--rasterize', type=int, default=None, metavar='DPI',
+                        help='Rasterize grey branches and background tips at DPI in PDF/SVG output, '
+                             'keeping highlighted tips, axes and text as vectors')
+    render.add_argument('--dating', choices=('heuristic', 'clock'), default='heuristic',
+                        help='Date internal nodes from their earliest child (heuristic) or by '
+                             'fitting a least-squares strict clock to the tip dates (clock)')
+    render.add_argument('--profile', action='store_true',
+                        help='Record wall/CPU time, memory and object counts per stage and print a table '
+                             '(also on with WNV_TREES_PROFILE=1)')
+    render.add_argument('--profile-memory', action='store_true',
+                        help='Also trace Python allocations with tracemalloc (slower)')
+    render.add_argument('--profile-output', default=None, metavar='FILE',
+                        help='Write the profile records to FILE (implies --profile)')
+    render.add_argument('--profile-format', choices=PROFILE_FORMATS, default='json',
+                        help="Profile file format: 'json' or a 'chrome' trace (chrome://tracing, Perfetto)")
+    render.add_argument('--cache-dir', default=None, help='Parsed tree/metadata cache directory')
+    render.add_argument('--no-cache', action='store_true', help='Parse inputs without the on-disk cache')
+    render.add_argument('-v', '--verbose', action='store_true')
+
+    watch = commands.add_parser('watch', help='Keep a highlight figure loaded and re-save it whenever '
+                                              'the metadata or highlight list changes')
+    watch.add_argument('--highlight', required=True,
+                       help='File listing the strains to highlight, one per line (# starts a comment); '
+                            'lines may be glob patterns such as UNMC*')
+    watch.add_argument('--against', choices=('time', 'divergence'), default='time',
+                       help='Draw the time tree against time, or the divergence tree against divergence')
+    watch.add_argument('--tree', default='tree_2025.nwk', help='Time tree in Newick format')
+    watch.add_argument('--divergence-tree', default='tree_NE_2025.nwk', help='Divergence tree in Newick format')
+    watch.add_argument('--metadata', default='updated_metadata.tsv', help='Metadata TSV')
+    watch.add_argument('--output', default='figures/highlighted.png', help='Figure file to (re)write')
+    watch.add_argument('--dpi', type=int, default=300)
+    watch.add_argument('--interval', type=float, default=1.0, help='Seconds between checks for changes')
+    watch.add_argument('--once', action='store_true', help='Render once and exit')
+    watch.add_argument('--dating', choices=('heuristic', 'clock'), default='heuristic',
+                       help='How to date the time tree (see render --dating)')
+    watch.add_argument('--cache-dir', default=None, help='Parsed tree/metadata cache directory')
+    watch.add_argument('-v', '--verbose', action='store_true')
+
+    clades = commands.add_parser('clades', help='Write a table of per-clade tip counts by a metadata column')
+    clades.add_argument('--column', default='Region',
+                        help='Metadata column to count, e.g. Region, broad_region or year')
+    clades.add_argument('--min-tips', type=int, default=10, help='Smallest clade to list')
+    clades.add_argument('--proportions', action='store_true', help='Shares of the counted tips, not counts')
+    clades.add_argument('--tree', default='tree_2025.nwk', help='Time tree in Newick format')
+    clades.add_argument('--metadata', default='updated_metadata.tsv', help='Metadata TSV')
+    clades.add_argument('--output', default='-', help='TSV file to write (default: standard output)')
+    clades.add_argument('--cache-dir', default=None, help='Parsed tree/metadata cache directory')
+    clades.add_argument('-v', '--verbose', action='store_true')
+
+    rtt = commands.add_parser('root-to-tip', help='Regress root-to-tip divergence on sampling date and '
+                                                  'flag clock outliers')
+    rtt.add_argument('--tree', default='tree_NE_2025.nwk', help='Divergence tree in Newick format')
+    rtt.add_argument('--metadata', default='updated_metadata.tsv', help='Metadata TSV')
+    rtt.add_argument('--reroot', action='store_true', help='Use the root position that maximises R²')
+    rtt.add_argument('--threshold', type=float, default=None,
+                     help='Flag tips whose robust residual z-score exceeds this (default: 3)')
+    rtt.add_argument('--output', default='root_to_tip.tsv', help='Residual table to write')
+    rtt.add_argument('--plot', default=None, metavar='FILE', help='Also save the regression scatter plot')
+    rtt.add_argument('--cache-dir', default=None, help='Parsed tree/metadata cache directory')
+    rtt.add_argument('-v', '--verbose', action='store_true')
+
+    clusters = commands.add_parser('clusters', help='Count introductions: maximal clades of tips matching '
+                                                    'metadata predicates')
+    clusters.add_argument('--predicate', action='append', default=[], metavar='[NAME:] COND ...',
+                          help='Tips to cluster, e.g. "NE: Region=NE_Central,NE_East year=2023" or '
+                               '"strain=UNMC*"; repeat for a batch (default: NE 2023, all and by region)')
+    clusters.add_argument('--predicates', default=None, metavar='FILE',
+                          help='File of predicates, one per line (# comments allowed)')
+    clusters.add_argument('-k', '--exceptions', type=int, default=0,
+                          help='Non-matching tips a cluster may contain (0: monophyletic clusters)')
+    clusters.add_argument('--tree', default='tree_2025.nwk', help='Time tree in Newick format')
+    clusters.add_argument('--metadata', default='updated_metadata.tsv', help='Metadata TSV')
+    clusters.add_argument('--dating', choices=('heuristic', 'clock'), default='heuristic',
+                          help='How to date the tree for TMRCAs (see render --dating)')
+    clusters.add_argument('--output', default='clusters.tsv', help='Cluster table to write')
+    clusters.add_argument('--cache-dir', default=None, help='Parsed tree/metadata cache directory')
+    clusters.add_argument('-v', '--verbose', action='store_true')
+
+    nearest = commands.add_parser('nearest', help="Each query tip's nearest relatives outside a set of tips, "
+                                                  'by patristic distance')
+    nearest.add_argument('--query', action='append', default=[], metavar='STRAIN',
+                         help='Query strain or glob pattern such as UNMC*; repeatable (default: the NE 2023 '
+                              'strains)')
+    nearest.add_argument('--queries', default=None, metavar='FILE',
+                         help='File of query strains or patterns, one per line (# comments allowed)')
+    nearest.add_argument('--exclude', action='append', default=None, metavar='[NAME:] COND ...',
+                         help='Tips that may not be neighbours, as a clusters --predicate; repeatable '
+                              '(default: "Region=NE_Central,NE_West,NE_East")')
+    nearest.add_argument('--all-tips', action='store_true', help='Let every other tip be a neighbour')
+    nearest.add_argument('-k', '--neighbours', type=int, default=1, help='Neighbours to list per query')
+    nearest.add_argument('--against', choices=('time', 'divergence'), default='time',
+                         help='Distances in years on the time tree, or substitutions/site on the divergence '
+                              'tree')
+    nearest.add_argument('--tree', default='tree_2025.nwk', help='Time tree in Newick format')
+    nearest.add_argument('--divergence-tree', default='tree_NE_2025.nwk',
+                         help='Divergence tree in Newick format')
+    nearest.add_argument('--metadata', default='updated_metadata.tsv', help='Metadata TSV')
+    nearest.add_argument('--dating', choices=('heuristic', 'clock'), default='heuristic',
+                         help='How to date the time tree (see render --dating)')
+    nearest.add_argument('--output', default='nearest.tsv', help='Neighbour table to write')
+    nearest.add_argument('--matrix', default=None, metavar='FILE',
+                         help="Also write the query tips' pairwise distance matrix")
+    nearest.add_argument('--cache-dir', default=None, help='Parsed tree/metadata cache directory')
+    nearest.add_argument('-v', '--verbose', action='store_true')
+
+    commands.add_parser('list', help='List the available figure names')
+    return parser
+
+
+def render(args):
+    import matplotlib
+    matplotlib.use('Agg')
+
+    from wnv_trees.batch import render_figures
+    from wnv_trees.pipeline import Pipeline
+
+    names = args.figures if isinstance(args.figures, list) else _figure_names(args.figures)
+    formats = [fmt.strip() for fmt in args.format.split(',') if fmt.strip()]
+    profiler = Profiler.from_env()
+    if args.profile or args.profile_memory or args.profile_output:
+        profiler = Profiler(enabled=True, trace_memory=args.profile_memory or profiler.trace_memory)
+    pipeline = Pipeline(args.tree, args.metadata, divergence_tree_path=args.divergence_tree,
+                        cache_dir=args.cache_dir, use_cache=not args.no_cache, verbose=args.verbose,
+                        collapse=args.collapse, rasterize=args.rasterize, dating=args.dating,
+                        profiler=profiler)
+
+    start = time.perf_counter()
+    paths = render_figures(pipeline, names, args.outdir, formats, dpi=args.dpi, jobs=args.jobs)
+    wall = time.perf_counter() - start
+
+    print(f"{'file':<40} {'MB':>8} {'save s':>8}")
+    for path in paths:
+        name = os.path.basename(path)
+        print(f"{path:<40} {os.path.getsize(path) / 1e6:8.2f} {pipeline.timings[f'save {name}']:8.3f}")
+
+    print("\nStage timings:")
+    for line in pipeline.timing_report():
+        print(f"  {line}")
+    print(f"Wall clock: {wall:.3f}s")
+
+    if profiler.enabled:
+        print("\nProfile:")
+        for line in profiler.report():
+            print(f"  {line}")
+        if args.profile_output:
+            print(f"Wrote {profiler.write(args.profile_output, args.profile_format)}")
+    return 0
+
+
+def read_lines(path):
+    """The lines of `path` in order, with # comments, surrounding space and blank lines dropped."""
+    with open(path) as handle:
+        lines = [line.split('#', 1)[0].strip() for line in handle]
+    return [line for line in lines if line]
+
+
+def read_highlights(path):
+    """Strain names listed in `path`, one per line; blank lines and # comments are skipped."""
+    return set(read_lines(path))
+
+
+def _highlight_rules(index, queries):
+    # Expand names and glob patterns against the tree's tips
+    from wnv_trees.figures import UNMC_RED
+    strains = index.selected_names(index.select(queries))
+    return [{'name': 'highlighted', 'label': f'Highlighted ({len(strains)})', 'members': strains,
+             'colour': UNMC_RED, 'size': 140, 'edgecolor': 'black', 'linewidth': 2.5, 'alpha': 1.0,
+             'zorder': 20005}]
+
+
+def _mtimes(paths, previous):
+    # An editor saving by rename can leave a path briefly missing: keep its
+    # previous stamp so the change is picked up on the next poll instead
+    stamps = []
+    for path, stamp in zip(paths, previous):
+        try:
+            stamps.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            stamps.append(stamp)
+    return stamps
+
+
+def watch(args):
+    import matplotlib
+    matplotlib.use('Agg')
+
+    from wnv_trees.figures import UNMC_BLUE
+    from wnv_trees.pipeline import Pipeline
+    from wnv_trees.session import RenderSession
+
+    pipeline = Pipeline(args.tree, args.metadata, divergence_tree_path=args.divergence_tree,
+                        cache_dir=args.cache_dir, verbose=args.verbose, dating=args.dating)
+    tree = 'tree' if args.against == 'time' else 'divergence_tree'
+    default = {'label': 'Other samples', 'colour': UNMC_BLUE, 'size': 80, 'alpha': 0.9, 'zorder': 20001}
+    outdir = os.path.dirname(args.output)
+    if outdir:
+        os.makedirs(outdir, exist_ok=True)
+
+    start = time.perf_counter()
+    index = pipeline.tip_index(tree)
+    session = RenderSession(pipeline, _highlight_rules(index, read_highlights(args.highlight)), default,
+                            tree=tree, title='Highlighted Samples')
+    session.save(args.output, dpi=args.dpi)
+    print(f"Wrote {args.output} in {time.perf_counter() - start:.3f}s")
+    if args.once:
+        return 0
+
+    watched = [args.metadata, args.highlight]
+    stamps = [os.stat(path).st_mtime_ns for path in watched]
+    print(f"Watching {', '.join(watched)} (Ctrl-C to stop)")
+    try:
+        while True:
+            time.sleep(args.interval)
+            current = _mtimes(watched, stamps)
+            if current == stamps:
+                continue
+            stamps = current
+            report = session.update(rules=_highlight_rules(index, read_highlights(args.highlight)))
+            seconds = session.save(args.output, dpi=args.dpi)
+            changed = [name for name in ('metadata', 'dates', 'rules') if report[name]] or ['nothing']
+            action = 'redrew the figure' if report['redrawn'] else f"restyled {report['tips_changed']} tips"
+            print(f"{', '.join(changed)} changed: {action} in {report['elapsed']:.3f}s, "
+                  f"saved in {seconds:.3f}s")
+    except KeyboardInterrupt:
+        session.close()
+    return 0
+
+
+def clades(args):
+    from wnv_trees.clades import clade_table
+    from wnv_trees.pipeline import Pipeline
+
+    pipeline = Pipeline(args.tree, args.metadata, cache_dir=args.cache_dir, verbose=args.verbose)
+    counts = pipeline.clade_counts([args.column])[args.column]
+    table = clade_table(pipeline.lca_index().atree, counts, min_tips=args.min_tips,
+                        proportions=args.proportions)
+    table.to_csv(sys.stdout if args.output == '-' else args.output, sep='\t', index=False,
+                 float_format='%.4f')
+    if args.output != '-':
+        print(f"Wrote {len(table)} clades to {args.output}")
+    if args.verbose:
+        for line in pipeline.timing_report():
+            print(f"  {line}", file=sys.stderr)
+    return 0
+
+
+def root_to_tip(args):
+    from wnv_trees.clock import tip_dates
+    from wnv_trees.pipeline import Pipeline
+    from wnv_trees.temporal import OUTLIER_Z, fit, plot_root_to_tip, residual_table
+
+    pipeline = Pipeline(args.tree, args.metadata, divergence_tree_path=args.tree, cache_dir=args.cache_dir,
+                        verbose=args.verbose)
+    threshold = OUTLIER_Z if args.threshold is None else args.threshold
+    index = pipeline.lca_index('divergence_tree')
+    atree = index.atree
+    with pipeline.stage('root-to-tip fit'):
+        dates = tip_dates(atree.names[atree.tips], pipeline.metadata)['date']
+        result = fit(atree, dates, reroot=args.reroot, index=index)
+        table = residual_table(atree, pipeline.metadata, result, threshold=threshold)
+    table.to_csv(args.output, sep='\t', index=False, float_format='%.6g')
+
+    print(f"{result['tips']} dated tips: rate {result['rate']:.4g} substitutions/site/year, "
+          f"root date {result['root_time']:.2f}, R² {result['r2']:.3f}")
+    if args.reroot:
+        root = result['root']
+        print(f"Best-fitting root is {root['distance']:.4g} above node {root['node']} "
+              f"(R² {result['original_r2']:.3f} at the tree's own root)")
+    outliers = table[table['outlier']].sort_values('z', key=abs, ascending=False)
+    print(f"{len(outliers)} outliers with |z| > {threshold:g}:")
+    for region, count in outliers['Region'].astype(object).fillna('unknown').value_counts().items():
+        print(f"  {region}: {count}")
+    for row in outliers.head(10).itertuples():
+        print(f"  {row.strain:<24} date {row.decimal_year:9.2f}  clock date {row.clock_date:9.2f}  "
+              f"z {row.z:6.1f}")
+    print(f"Wrote {args.output}")
+
+    if args.plot:
+        import matplotlib
+        matplotlib.use('Agg')
+        ax = plot_root_to_tip(table, result)
+        ax.figure.tight_layout()
+        ax.figure.savefig(args.plot, dpi=150)
+        print(f"Wrote {args.plot}")
+    if args.verbose:
+        for line in pipeline.timing_report():
+            print(f"  {line}")
+    return 0
+
+
+def clusters(args):
+    from wnv_trees.clusters import (cluster_summary, cluster_table, find_clusters, ne_predicates,
+                                    parse_predicate, predicate_masks)
+    from wnv_trees.pipeline import Pipeline
+
+    pipeline = Pipeline(args.tree, args.metadata, cache_dir=args.cache_dir, verbose=args.verbose,
+                        dating=args.dating)
+    atree = pipeline.lca_index().atree
+    texts = list(args.predicate)
+    if args.predicates:
+        texts.extend(read_lines(args.predicates))
+    if texts:
+        predicates = dict(parse_predicate(text, pipeline.tip_index()) for text in texts)
+    else:
+        predicates = ne_predicates()
+
+    with pipeline.stage('clusters'):
+        masks = predicate_masks(atree.names[atree.tips], pipeline.metadata, predicates)
+        results = find_clusters(atree, masks, exceptions=args.exceptions)
+        table = cluster_table(atree, masks, results, list(predicates))
+    table.to_csv(args.output, sep='\t', index=False, float_format='%.4f')
+
+    summary = cluster_summary(masks, results, list(predicates))
+    allowed = f'at most {args.exceptions} other tips' if args.exceptions else 'monophyletic'
+    print(f"Clusters ({allowed}):")
+    print(summary.to_string(index=False))
+    print(f"Wrote {len(table)} clusters to {args.output}")
+    if args.verbose:
+        for line in pipeline.timing_report():
+            print(f"  {line}")
+    return 0
+
+
+def nearest(args):
+    import numpy as np
+
+    from wnv_trees.clusters import parse_predicate, predicate_masks
+    from wnv_trees.distances import matrix_table, neighbour_table
+    from wnv_trees.pipeline import NE_REGIONS, Pipeline
+
+    pipeline = Pipeline(args.tree, args.metadata, divergence_tree_path=args.divergence_tree,
+                        cache_dir=args.cache_dir, verbose=args.verbose, dating=args.dating)
+    tree = 'tree' if args.against == 'time' else 'divergence_tree'
+    distances = pipeline.distance_index(tree)
+    atree = distances.index.atree
+    index = distances.index.tips
+    queries = list(args.query)
+    if args.queries:
+        queries.extend(read_lines(args.queries))
+    mask = index.select(queries) if queries else index.isin(pipeline.strains['ne_2023'])
+    if not mask.any():
+        raise ValueError('No query strains are tips of the tree')
+    allowed = None
+    if not args.all_tips:
+        texts = args.exclude or [f"Region={','.join(NE_REGIONS)}"]
+        predicates = dict(parse_predicate(text, index) for text in texts)
+        allowed = ~predicate_masks(atree.names[atree.tips], pipeline.metadata, predicates).any(axis=1)
+
+    nodes = index.nodes(mask)
+    with pipeline.stage('nearest'):
+        neighbours, patristic = distances.nearest_many(nodes, args.neighbours, allowed)
+        table = neighbour_table(distances, nodes, neighbours, patristic, pipeline.metadata)
+    table.to_csv(args.output, sep='\t', index=False, float_format='%.6g')
+    unit = 'years' if args.against == 'time' else 'substitutions/site'
+    nearest = table[table['rank'] == 1]
+    print(f"{len(nodes)} queries; nearest allowed relative at median {np.median(nearest['distance']):.4g} "
+          f"{unit} (max {nearest['distance'].max():.4g})")
+    if 'neighbour_region' in nearest:
+        regions = nearest['neighbour_region'].astype(object).fillna('unknown')
+        for region, count in regions.value_counts().items():
+            print(f"  {region}: {count}")
+    print(f"Wrote {len(table)} neighbours to {args.output}")
+    if args.matrix:
+        with pipeline.stage('distance matrix'):
+            matrix = matrix_table(distances, nodes)
+        matrix.to_csv(args.matrix, sep='\t', float_format='%.6g')
+        print(f"Wrote the {len(nodes)} x {len(nodes)} distance matrix to {args.matrix}")
+    if args.verbose:
+        for line in pipeline.timing_report():
+            print(f"  {line}")
+    return 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == 'list':
+        from wnv_trees.figures import FIGURES
+        width = max(len(name) for name in FIGURES)
+        for name, function in FIGURES.items():
+            print(f"{name:<{width}}  {function.__doc__.splitlines()[0]}")
+        return 0
+    if args.command == 'watch':
+        return watch(args)
+    if args.command == 'clades':
+        return clades(args)
+    if args.command == 'root-to-tip':
+        return root_to_tip(args)
+    if args.command == 'clusters':
+        return clusters(args)
+    if args.command == 'nearest':
+        return nearest(args)
+    return render(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,261 @@
+"""Strict-clock dating of a tree by least squares, in linear time.
+
+`set_node_times` dates every internal node as its earliest child's time minus
+its own branch length. Undated tips are put in 2020 and childless nodes in
+2010, so one bad date or long branch moves every ancestor. This module fits a
+strict molecular clock to all the tip dates instead:
+
+1. Root-to-tip regression of each dated tip's divergence from the root on
+   its date gives the substitution rate (the slope) and the root's date (where
+   the line crosses zero divergence).
+2. With the rate fixed, node times minimise the sum over branches of
+   (t_child - t_parent - length / rate) ** 2. The tip times are held at
+   their dates. On a tree this quadratic is solved exactly in two passes.
+   Going up, each clade's least cost as a function of its parent's time is
+   `a * (t_parent - m) ** 2`. Going down, each node's time then follows from
+   its parent's.
+3. Tips dated only to a month or year (`YYYY-MM-XX`, `YYYY-XX-XX`) are
+   constrained to that interval, not pinned to its middle. Between solves,
+   each such tip moves to the point of its interval closest to what the clock
+   predicts from its parent, and the fit is solved again until no tip moves.
+   Undated tips are left free and cost nothing.
+4. No node is allowed to be younger than its children. The few parents the
+   fit puts after a child are moved back to that child's time.
+
+Every pass works one depth level at a time with numpy, so the cost is linear
+in the number of nodes.
+"""
+import time
+
+import numpy as np
+
+from wnv_trees.arraytree import ArrayTree
+from wnv_trees.dates import date_bounds
+from wnv_trees.traits import join_tips
+
+
+def root_to_tip(divergence, dates):
+    """Least-squares line of root-to-tip `divergence` against tip `dates`.
+
+    NaN dates are ignored. Returns a dict with 'rate' (the slope, in
+    substitutions per site per year), 'root_time' (the date at zero
+    divergence), 'intercept', 'r2', 'residual_std' and 'tips' (the number
+    of tips used).
+    """
+    divergence = np.asarray(divergence, dtype=float)
+    dates = np.asarray(dates, dtype=float)
+    used = ~np.isnan(dates) & ~np.isnan(divergence)
+    x, y = dates[used], divergence[used]
+    if len(x) < 2 or np.ptp(x) == 0:
+        raise ValueError('Root-to-tip regression needs at least two distinct tip dates')
+    x_mean, y_mean = x.mean(), y.mean()
+    sxx = ((x - x_mean) ** 2).sum()
+    sxy = ((x - x_mean) * (y - y_mean)).sum()
+    rate = sxy / sxx
+    intercept = y_mean - rate * x_mean
+    residuals = y - (intercept + rate * x)
+    syy = ((y - y_mean) ** 2).sum()
+    return {
+        'rate': float(rate),
+        'root_time': float(-intercept / rate) if rate != 0 else np.nan,
+        'intercept': float(intercept),
+        'r2': float(1 - (residuals ** 2).sum() / syy) if syy > 0 else np.nan,
+        'residual_std': float(residuals.std()),
+        'tips': int(used.sum()),
+    }
+
+
+def tip_dates(names, metadata, key='strain'):
+    """Each tip's decimal year and date interval, from `metadata`'s 'date' column.
+
+    Returns a dict of float arrays aligned with `names`: 'date' (the
+    point estimate), 'lower' and 'upper'; all NaN for tips without a date.
+    """
+    table = join_tips(names, metadata, key=key, columns=['date', 'decimal_year'])
+    bounds = date_bounds(table['date'])
+    return {
+        'date': table['decimal_year'].astype(float),
+        'lower': bounds['lower'].to_numpy(dtype=float),
+        'upper': bounds['upper'].to_numpy(dtype=float),
+    }
+
+
+def _solve(atree, levels, expected, fixed, times):
+    # One exact least-squares solve with the tips in `fixed` held at `times`.
+    # Going up, the children of node v add up to S * (t_v - m) ** 2 + const
+    # (`weight`, `mean`), and v's whole clade costs a * (t_parent - mu) ** 2
+    parent = atree.parent
+    n = len(atree)
+    a = np.where(fixed, 1.0, 0.0)
+    mu = np.where(fixed, times - expected, 0.0)
+    weight = np.zeros(n)
+    weighted = np.zeros(n)
+    internal = ~atree.is_leaf
+    for level in reversed(levels[1:]):
+        nodes = level[internal[level]]
+        if len(nodes):
+            s = weight[nodes]
+            mean = np.divide(weighted[nodes], s, out=np.zeros(len(nodes)), where=s > 0)
+            a[nodes] = s / (1.0 + s)
+            mu[nodes] = mean - expected[nodes]
+        np.add.at(weight, parent[level], a[level])
+        np.add.at(weighted, parent[level], a[level] * mu[level])
+
+    root = levels[0]
+    if not (weight[root] > 0).all():
+        raise ValueError('No dated tips to fit the clock to')
+    times = times.copy()
+    times[root] = weighted[root] / weight[root]
+    for level in levels[1:]:
+        nodes = level[~fixed[level]]
+        start = times[parent[nodes]] + expected[nodes]
+        s = weight[nodes]
+        mean = np.divide(weighted[nodes], s, out=np.zeros(len(nodes)), where=s > 0)
+        # Tips and clades with no dated tips sit exactly where the clock puts them
+        times[nodes] = np.where(s > 0, (start + s * mean) / (1.0 + s), start)
+    return times
+
+
+def clock_times(atree, dates, lower=None, upper=None, rate=None, iterations=500, tolerance=1e-6):
+    """Date every node of `atree` under a strict clock fitted to its tip dates.
+
+    `dates` are the tips' decimal years (aligned with `atree.tips`, NaN when
+    unknown) and `lower`/`upper` optional date intervals; tips with
+    `lower < upper` are only constrained to their interval. `atree.length`
+    must hold divergence branch lengths. `rate` skips the root-to-tip
+    estimate. Interval tips are refitted at most `iterations` times, until
+    none moves by more than `tolerance` years.
+
+    Returns a dict with 'time' (per node), the root-to-tip 'regression',
+    'rate', 'root_time' (the fitted root's date), 'rms' (root mean square
+    of the branch residuals t_child - t_parent - length / rate, in years),
+    'clamped' (parents moved back to a child's time), 'iterations',
+    'converged' (False when the refit stopped at `iterations` with tips
+    still moving), tip counts 'fixed', 'interval' and 'undated', and
+    'elapsed' seconds.
+    """
+    start = time.perf_counter()
+    tips = atree.tips
+    dates = np.asarray(dates, dtype=float)
+    lower = dates if lower is None else np.asarray(lower, dtype=float)
+    upper = dates if upper is None else np.asarray(upper, dtype=float)
+    lengths = np.nan_to_num(atree.length)
+    lengths[atree.parent < 0] = 0.0
+    divergence = atree.cumulative_from_root(lengths)
+
+    # The regression uses each tip's interval midpoint when it has one
+    midpoint = np.where(np.isnan(lower), dates, (lower + upper) / 2)
+    regression = root_to_tip(divergence[tips], midpoint)
+    if rate is None:
+        rate = regression['rate']
+    if not rate > 0:
+        raise ValueError(f'Root-to-tip regression gave a rate of {rate:.3g}; '
+                         'the tip dates show no clock signal (pass rate= to force one)')
+    expected = lengths / rate
+
+    n = len(atree)
+    interval = ~np.isnan(lower) & (upper > lower)
+    fixed = np.zeros(n, dtype=bool)
+    fixed[tips] = ~np.isnan(midpoint)
+    times = np.full(n, np.nan)
+    times[tips] = midpoint
+    levels = atree.levels()
+    interval_nodes = tips[interval]
+
+    converged = False
+    for iteration in range(1, max(1, iterations) + 1):
+        times = _solve(atree, levels, expected, fixed, times)
+        if not len(interval_nodes):
+            converged = True
+            break
+        # Move each interval tip to the point of its interval nearest the clock's prediction
+        predicted = times[atree.parent[interval_nodes]] + expected[interval_nodes]
+        moved = np.clip(predicted, lower[interval], upper[interval])
+        shift = np.abs(moved - times[interval_nodes]).max()
+        times[interval_nodes] = moved
+        if shift <= tolerance:
+            converged = True
+            break
+
+    # No parent after any of its children
+    fitted = times
+    times = atree.bottom_up(np.where(atree.is_leaf, times, np.nan),
+                            lambda nodes, earliest: np.minimum(fitted[nodes], earliest), np.minimum, np.inf)
+    child = atree.parent >= 0
+    residuals = times[child] - times[atree.parent[child]] - expected[child]
+    return {
+        'time': times,
+        'regression': regression,
+        'rate': float(rate),
+        'root_time': float(times[levels[0][0]]),
+        'rms': float(np.sqrt(np.mean(residuals ** 2))) if len(residuals) else 0.0,
+        'clamped': int((times < fitted - 1e-12).sum()),
+        'iterations': iteration,
+        'converged': converged,
+        'fixed': int((fixed[tips] & ~interval).sum()),
+        'interval': int(interval.sum()),
+        'undated': int(np.isnan(midpoint).sum()),
+        'elapsed': time.perf_counter() - start,
+    }
+
+
+def _time_sources(atree, dates, lower, upper):
+    # Same vocabulary as set_node_times, with 'clock' for fitted times
+    sources = np.full(len(atree), 'clock', dtype=object)
+    tips = atree.tips
+    sources[tips] = np.where(np.isnan(dates), 'clock_undated',
+                             np.where(upper > lower, 'interval', 'metadata'))
+    return sources
+
+
+def _report(stats, verbose):
+    if not verbose:
+        return
+    regression = stats['regression']
+    print(f"Clock fit: rate {stats['rate']:.3g}/year, root {stats['root_time']:.2f}, "
+          f"R^2 {regression['r2']:.3f} over {regression['tips']} tips, "
+          f"branch RMS {stats['rms']:.3f} years ({stats['iterations']} iterations, "
+          f"{stats['elapsed']:.3f}s)")
+    if not stats['converged']:
+        print(f"  interval tips had not converged after {stats['iterations']} iterations; "
+              f"pass a larger iterations= or tolerance=")
+    print(f"  tips: {stats['fixed']} dated, {stats['interval']} interval, {stats['undated']} undated; "
+          f"{stats['clamped']} nodes moved back to a child's time")
+
+
+def set_array_clock_times(atree, metadata, key='strain', verbose=False, **options):
+    """Fill `atree.time` and a 'time_source' trait from a `clock_times` fit.
+
+    Tip dates and intervals come from `metadata` (see `tip_dates`);
+    `options` go to `clock_times`, whose result (without 'time') is
+    returned. Time sources are 'metadata' and 'interval' for dated tips,
+    'clock_undated' for the rest and 'clock' for internal nodes.
+    """
+    table = tip_dates(atree.names[atree.tips], metadata, key=key)
+    fit = clock_times(atree, table['date'], table['lower'], table['upper'], **options)
+    atree.time = fit.pop('time')
+    atree.set_trait('time_source', _time_sources(atree, table['date'], table['lower'], table['upper']))
+    _report(fit, verbose)
+    return fit
+
+
+def set_clock_times(tree, metadata, key='strain', verbose=False, **options):
+    """`set_array_clock_times` for a baltic tree: sets `absoluteTime` and `time_source`.
+
+    The tree's branch lengths must be divergence (substitutions per site).
+    Returns the fit diagnostics, as `set_array_clock_times` does.
+    """
+    atree = ArrayTree.from_baltic(tree)
+    fit = set_array_clock_times(atree, metadata, key=key, verbose=verbose, **options)
+    sources = atree.trait('time_source')
+    # The pre-order walk ArrayTree.from_baltic numbers the nodes by
+    i = 0
+    stack = [tree.root]
+    while stack:
+        node = stack.pop()
+        node.absoluteTime = float(atree.time[i])
+        node.time_source = sources[i]
+        i += 1
+        if node.branchType != 'leaf':
+            stack.extend(reversed(node.children))
+    return fit
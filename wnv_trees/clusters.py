@@ -0,0 +1,186 @@
+"""Introduction clusters: maximal clades of tips that match a metadata predicate.
+
+How many separate introductions do the Nebraska 2023 samples represent?
+Each introduction shows up as a clade made up of Nebraska 2023 tips. A
+cluster here is a maximal clade holding at least one matching tip and at
+most `exceptions` non-matching ones. With `exceptions=0` it is a
+monophyletic group of matching tips. Every matching tip then lies in exactly
+one cluster, so the number of clusters counts the introductions (singletons
+included).
+
+A clade in an `ArrayTree` is a contiguous pre-order range, so every node's
+matching and non-matching tip counts are differences of running totals. A
+node qualifies when its counts allow it. It is a cluster root when its
+parent does not qualify. That is one vectorized pass for any number of
+predicates at once, using a (nodes x predicates) count array, so a batch of
+predicates on the national tree costs little more than one.
+"""
+import numpy as np
+import pandas as pd
+
+from wnv_trees.pipeline import NE_REGIONS, NE_YEAR
+from wnv_trees.traits import join_tips, rule_mask
+
+
+def ne_predicates(year=NE_YEAR):
+    """The Nebraska question as predicate rules: all NE regions together and each one alone."""
+    predicates = {f'NE {year}': {'column': 'Region', 'values': NE_REGIONS, 'years': year}}
+    for region in NE_REGIONS:
+        predicates[f'{region} {year}'] = {'column': 'Region', 'values': [region], 'years': year}
+    return predicates
+
+
+def predicate_masks(names, metadata, predicates, key='strain'):
+    """Tip masks for `predicates`, a dict from name to a `wnv_trees.traits` rule.
+
+    Rules use the match keys of tip rules ('members', 'column' with
+    'values', 'years'); a list of rules matches tips matching all of them.
+    Returns a (tips x predicates) bool array, columns in `predicates` order.
+    """
+    table = join_tips(names, metadata, key=key)
+    masks = []
+    for rules in predicates.values():
+        mask = np.ones(len(names), dtype=bool)
+        for rule in ([rules] if isinstance(rules, dict) else rules):
+            mask &= rule_mask(table, rule)
+        masks.append(mask)
+    return np.column_stack(masks)
+
+
+def parse_predicate(text, index=None):
+    """A predicate from text such as `NE 2023: Region=NE_Central,NE_East year=2023`.
+
+    Returns (name, rules). The optional `name:` prefix defaults to the text
+    itself. Conditions are separated by spaces and all must hold:
+    `year=2023` or `year=2019-2023` selects collection years,
+    `strain=UNMC*,XYZ1` selects strains by name or glob pattern (needs a
+    `TipIndex` as `index`), and any other `column=value,value` selects
+    metadata values.
+    """
+    name, _, spec = text.rpartition(':')
+    name = name.strip() or text.strip()
+    rules = []
+    for condition in spec.split():
+        column, _, values = condition.partition('=')
+        if not values:
+            raise ValueError(f"Bad condition {condition!r} in predicate {text!r}; expected column=value")
+        values = values.split(',')
+        if column == 'year':
+            first, _, last = values[0].partition('-')
+            rules.append({'years': (int(first), int(last or first))})
+        elif column == 'strain':
+            if index is None:
+                raise ValueError('strain= conditions need a TipIndex')
+            rules.append({'members': index.selected_names(index.select(values))})
+        else:
+            rules.append({'column': column, 'values': values})
+    return name, rules
+
+
+def _clade_totals(atree, size, tip_values):
+    # (nodes x columns) sums of tip-aligned `tip_values` over every clade
+    running = np.zeros((len(atree) + 1, tip_values.shape[1]), dtype=np.int32)
+    running[atree.tips + 1] = tip_values
+    np.cumsum(running, axis=0, out=running)
+    nodes = np.arange(len(atree))
+    return running[nodes + size] - running[nodes]
+
+
+def find_clusters(atree, masks, exceptions=0, ignore=None):
+    """Maximal clusters of matching tips for every column of `masks`.
+
+    `masks` is a (tips x predicates) bool array aligned with `atree.tips`
+    (a 1-d mask is one predicate). A cluster's clade may hold at most
+    `exceptions` non-matching tips. Tips in `ignore` (same shape, or one
+    tip mask for all predicates) count as neither matching nor
+    non-matching. Returns a list with one dict per predicate: 'roots' (the
+    cluster root nodes), 'matching' and 'others' (each cluster's tip counts),
+    'cluster' (for every tip, the index in 'roots' of the cluster whose
+    clade holds it, -1 for tips in none) and 'counted' (the tips not
+    ignored).
+    """
+    masks = np.asarray(masks, dtype=bool)
+    if masks.ndim == 1:
+        masks = masks[:, None]
+    counted = np.ones_like(masks)
+    if ignore is not None:
+        ignore = np.asarray(ignore, dtype=bool)
+        counted = ~np.broadcast_to(ignore[:, None] if ignore.ndim == 1 else ignore, masks.shape)
+    size = atree.clade_sizes()
+    matching = _clade_totals(atree, size, masks & counted)
+    others = _clade_totals(atree, size, ~masks & counted)
+
+    qualifies = (matching > 0) & (others <= exceptions)
+    parent = atree.parent
+    has_parent = parent >= 0
+    roots = qualifies.copy()
+    roots[has_parent] &= ~qualifies[parent[has_parent]]
+
+    tips = atree.tips
+    results = []
+    for p in range(masks.shape[1]):
+        root_nodes = np.flatnonzero(roots[:, p])
+        # Cluster ranges are disjoint and sorted, so each tip's candidate is the last root before it
+        candidate = np.searchsorted(root_nodes, tips, side='right') - 1
+        inside = candidate >= 0
+        inside[inside] = tips[inside] < root_nodes[candidate[inside]] + size[root_nodes[candidate[inside]]]
+        results.append({
+            'roots': root_nodes,
+            'matching': matching[root_nodes, p],
+            'others': others[root_nodes, p],
+            'cluster': np.where(inside, candidate, -1),
+            'counted': counted[:, p],
+        })
+    return results
+
+
+def cluster_table(atree, masks, results, predicates):
+    """One row per cluster, largest first within each predicate.
+
+    `predicates` names the columns of `masks` (e.g. the keys of the dict
+    given to `predicate_masks`). Columns: predicate, cluster (1 = largest),
+    size (matching tips), exceptions (non-matching tips), node, tmrca (the
+    cluster root's time), parent_time (the time of the root's parent, before
+    which the introduction happened), members and exception_strains
+    (comma-separated strains).
+    """
+    masks = np.asarray(masks, dtype=bool).reshape(len(atree.tips), -1)
+    names = atree.names[atree.tips]
+    rows = []
+    for p, (predicate, result) in enumerate(zip(predicates, results)):
+        order = np.lexsort((result['roots'], -result['matching']))
+        # Tips grouped by cluster, so each cluster's members are one slice
+        in_cluster = np.flatnonzero(result['cluster'] >= 0)
+        by_cluster = in_cluster[np.argsort(result['cluster'][in_cluster], kind='stable')]
+        bounds = np.searchsorted(result['cluster'][by_cluster], np.arange(len(result['roots']) + 1))
+        for rank, i in enumerate(order, start=1):
+            node = result['roots'][i]
+            members = by_cluster[bounds[i]:bounds[i + 1]]
+            exceptions = members[~masks[members, p] & result['counted'][members]]
+            parent = atree.parent[node]
+            rows.append({
+                'predicate': predicate,
+                'cluster': rank,
+                'size': int(result['matching'][i]),
+                'exceptions': int(result['others'][i]),
+                'node': int(node),
+                'tmrca': atree.time[node],
+                'parent_time': atree.time[parent] if parent >= 0 else np.nan,
+                'members': ','.join(names[members[masks[members, p]]]),
+                'exception_strains': ','.join(names[exceptions]),
+            })
+    columns = ['predicate', 'cluster', 'size', 'exceptions', 'node', 'tmrca', 'parent_time', 'members',
+               'exception_strains']
+    return pd.DataFrame(rows, columns=columns)
+
+
+def cluster_summary(masks, results, predicates):
+    """Per predicate: matching (not ignored) tips, clusters, singletons and the largest cluster's size."""
+    masks = np.asarray(masks, dtype=bool).reshape(-1, len(results))
+    return pd.DataFrame([{
+        'predicate': predicate,
+        'matching_tips': int((masks[:, p] & result['counted']).sum()),
+        'clusters': len(result['roots']),
+        'singletons': int((result['matching'] == 1).sum()),
+        'largest': int(result['matching'].max()) if len(result['roots']) else 0,
+    } for p, (predicate, result) in enumerate(zip(predicates, results))])
@@ -0,0 +1,112 @@
+"""Level-of-detail drawing: collapse clades with no highlighted tips into wedges.
+
+In the highlight figures only a small fraction of tips (the NE 2023 strains,
+the UNMC samples) matter, but every grey background branch and tip still
+costs drawing and saving time. `collapse_clades` finds the maximal clades
+that contain no highlighted tip and have at least `min_tips` tips;
+`draw_wedges` draws each of them as one triangle spanning the clade's tips
+instead of its individual branches.
+"""
+from matplotlib.collections import PolyCollection
+
+from wnv_trees.dating import postorder
+from wnv_trees.render import _to_rgba
+
+DEFAULT_MIN_TIPS = 20
+
+
+def collapse_clades(tree, is_highlighted, min_tips=DEFAULT_MIN_TIPS):
+    """Split `tree` into collapsed clades and the nodes that stay visible.
+
+    `is_highlighted` is a function of a leaf. Returns (clades, visible):
+    `clades` are the maximal clades with no highlighted tips and at least
+    `min_tips` tips, and `visible` lists every node outside them in
+    `tree.Objects` order, including each clade's own root so its stem branch
+    is still drawn.
+    """
+    tips = {}
+    flagged = {}
+    for k in postorder(tree):
+        if k.branchType == 'leaf':
+            tips[id(k)] = 1
+            flagged[id(k)] = bool(is_highlighted(k))
+        else:
+            tips[id(k)] = sum(tips[id(child)] for child in k.children)
+            flagged[id(k)] = any(flagged[id(child)] for child in k.children)
+
+    # Walk down from the root, stopping at the first collapsible clade on each path
+    clades = []
+    hidden = set()
+    stack = [tree.root]
+    while stack:
+        k = stack.pop()
+        if k.branchType == 'leaf':
+            continue
+        if not flagged[id(k)] and tips[id(k)] >= min_tips:
+            clades.append(k)
+            inner = list(k.children)
+            while inner:
+                child = inner.pop()
+                hidden.add(id(child))
+                if child.branchType != 'leaf':
+                    inner.extend(child.children)
+        else:
+            stack.extend(k.children)
+
+    visible = [k for k in tree.Objects if id(k) not in hidden]
+    return clades, visible
+
+
+def clade_extent(clade, x_attr, y_attr):
+    """Tip count, x of the furthest tip and y range of the tips below `clade`."""
+    xs = []
+    ys = []
+    stack = [clade]
+    while stack:
+        k = stack.pop()
+        if k.branchType == 'leaf':
+            xs.append(x_attr(k))
+            ys.append(y_attr(k))
+        else:
+            stack.extend(k.children)
+    return len(xs), max(xs), min(ys), max(ys)
+
+
+def draw_wedges(ax, clades, x_attr=None, y_attr=None, colour='#CCCCCC', alpha=0.6, zorder=9,
+                label=False, span_format=None, fontsize=8, **kwargs):
+    """Draw each collapsed clade as a triangle from its root to its tips' y range.
+
+    The apex sits at the clade root and the base at the furthest tip's x,
+    spanning the lowest to highest tip. With `label` the tip count is written
+    at the base of each wedge, followed by the clade's x span formatted with
+    `span_format` when given (e.g. '{:.0f}-{:.0f}' for the years from the
+    clade root to its latest tip). Returns a list of dicts, one per clade, with
+    'node', 'tips', 'x_start', 'x_end', 'y_min' and 'y_max', so callers can
+    report each clade's size and time span.
+    """
+    if x_attr is None:
+        x_attr = lambda k: k.x
+    if y_attr is None:
+        y_attr = lambda k: k.y
+
+    summaries = []
+    polygons = []
+    for clade in clades:
+        n_tips, x_end, y_min, y_max = clade_extent(clade, x_attr, y_attr)
+        x_start, y_root = x_attr(clade), y_attr(clade)
+        polygons.append([(x_start, y_root), (x_end, y_max), (x_end, y_min)])
+        summaries.append({'node': clade, 'tips': n_tips, 'x_start': x_start, 'x_end': x_end,
+                          'y_min': y_min, 'y_max': y_max})
+        if label:
+            text = f' {n_tips} tips'
+            if span_format:
+                text += ', ' + span_format.format(x_start, x_end)
+            ax.text(x_end, (y_min + y_max) / 2, text, va='center', ha='left',
+                    fontsize=fontsize, color='#666666', zorder=zorder)
+
+    if polygons:
+        facecolours = _to_rgba([colour] * len(polygons), alpha)
+        ax.add_collection(PolyCollection(polygons, facecolors=facecolours, edgecolors='none',
+                                         zorder=zorder, **kwargs))
+        ax.autoscale_view()
+    return summaries
@@ -0,0 +1,155 @@
+"""Columnar conversion of partial collection dates to decimal years.
+
+Metadata dates come as `YYYY-MM-DD`, `YYYY-XX-XX` (unknown month/day) or just
+`YYYY`. Unknown months default to June and unknown days to the 15th, and a
+bare year is kept as the start of that year, matching the per-row
+`date_to_decimal_year` the scripts used to define. `YYYY/MM/DD` and
+`MM/DD/YYYY` are read as full dates, as the old `extract_year` did. Dates
+that don't form a valid calendar date fall back to their leading four-digit
+year.
+
+Large metadata tables repeat the same dates many times, so the string work is
+done once per distinct value and broadcast back to the rows.
+"""
+import numpy as np
+import pandas as pd
+
+# Defaults for XX placeholders
+DEFAULT_MONTH = 6
+DEFAULT_DAY = 15
+
+# Ordered so precision comparisons work, e.g. precision >= 'month'
+PRECISIONS = ['year', 'month', 'day']
+
+_FULL_DATE = r'^(\d+)-(\d+|XX)-(\d+|XX)(?:-.*)?$'
+_YEAR_FIRST = r'^(\d+)(?:-[^-]*)?$'
+_LEADING_YEAR = r'^(\d{4})'
+# Slash-separated full dates, rewritten as YYYY-MM-DD before parsing
+_SLASH_YEAR_FIRST = r'^(\d{4})/(\d{1,2})/(\d{1,2})$'
+_SLASH_MONTH_FIRST = r'^(\d{1,2})/(\d{1,2})/(\d{4})$'
+
+
+def _parse_unique(dates):
+    """Parse an Index of distinct date strings into year, decimal year and precision arrays.
+
+    Precision is returned as codes into PRECISIONS, with -1 for unparseable dates.
+    """
+    n = len(dates)
+    year = np.full(n, np.nan)
+    decimal_year = np.full(n, np.nan)
+    precision = np.full(n, -1, dtype=np.int8)
+    if n == 0:
+        return year, decimal_year, precision
+
+    # Leading four-digit year, the fallback for anything else
+    leading = pd.to_numeric(dates.str.extract(_LEADING_YEAR, expand=False), errors='coerce')
+    year[:] = leading.to_numpy(dtype=float, na_value=np.nan)
+    fallback = ~np.isnan(year)
+    decimal_year[fallback] = year[fallback]
+    precision[fallback] = PRECISIONS.index('year')
+
+    # YYYY or YYYY-something: the first part as a whole year
+    first = pd.to_numeric(dates.str.extract(_YEAR_FIRST, expand=False), errors='coerce')
+    first = first.to_numpy(dtype=float, na_value=np.nan)
+    has_first = ~np.isnan(first)
+    decimal_year[has_first] = first[has_first]
+    precision[has_first] = PRECISIONS.index('year')
+
+    # YYYY-MM-DD with optional XX month/day, including the slash forms
+    slashed = dates.str.replace(_SLASH_YEAR_FIRST, r'\1-\2-\3', regex=True)
+    slashed = slashed.str.replace(_SLASH_MONTH_FIRST, r'\3-\1-\2', regex=True)
+    month_first = np.asarray(dates.str.match(_SLASH_MONTH_FIRST), dtype=bool)
+    parts = slashed.str.extract(_FULL_DATE)
+    full = parts[0].notna().to_numpy()
+    if full.any():
+        y = parts[0][full].astype(np.int64).to_numpy()
+        month_known = (parts[1][full] != 'XX').to_numpy()
+        day_known = (parts[2][full] != 'XX').to_numpy()
+        m = np.where(month_known, pd.to_numeric(parts[1][full], errors='coerce').fillna(DEFAULT_MONTH), DEFAULT_MONTH).astype(np.int64)
+        d = np.where(day_known, pd.to_numeric(parts[2][full], errors='coerce').fillna(DEFAULT_DAY), DEFAULT_DAY).astype(np.int64)
+
+        # Calendar arithmetic with datetime64 to validate and find day-of-year
+        valid = (y >= 1) & (y <= 9999) & (m >= 1) & (m <= 12) & (d >= 1)
+        years = (np.clip(y, 1, 9999) - 1970).astype('datetime64[Y]')
+        month_start = years.astype('datetime64[M]') + (np.clip(m, 1, 12) - 1)
+        month_days = ((month_start + 1).astype('datetime64[D]') - month_start.astype('datetime64[D]')).astype(np.int64)
+        valid &= d <= month_days
+
+        year_start = years.astype('datetime64[D]')
+        year_days = ((years + 1).astype('datetime64[D]') - year_start).astype(np.int64)
+        day_of_year = (month_start.astype('datetime64[D]') + (d - 1) - year_start).astype(np.int64)
+        fraction = day_of_year.astype(float) / year_days.astype(float)
+
+        idx = np.flatnonzero(full)[valid]
+        decimal_year[idx] = y[valid] + fraction[valid]
+        # MM/DD/YYYY has no leading year; an invalid one stays unreadable
+        year[idx] = np.where(month_first[idx], y[valid], year[idx])
+        precision[idx] = np.where(month_known[valid] & day_known[valid], PRECISIONS.index('day'),
+                                  np.where(month_known[valid], PRECISIONS.index('month'),
+                                           PRECISIONS.index('year')))
+
+    return year, decimal_year, precision
+
+
+def parse_dates(dates):
+    """Convert a column of date strings to year, decimal year and precision.
+
+    Returns a DataFrame indexed like `dates` with float columns `year` and
+    `decimal_year` (NaN when no year can be read) and an ordered categorical
+    `date_precision` of 'year', 'month' or 'day'.
+    """
+    dates = pd.Series(dates)
+    codes, uniques = pd.factorize(dates)
+    year, decimal_year, precision = _parse_unique(pd.Index(uniques).astype(str))
+
+    # Row -1 (missing dates) picks the trailing NaN slot
+    year = np.append(year, np.nan)[codes]
+    decimal_year = np.append(decimal_year, np.nan)[codes]
+    precision = np.append(precision, -1)[codes]
+
+    return pd.DataFrame({
+        'year': year,
+        'decimal_year': decimal_year,
+        'date_precision': pd.Categorical.from_codes(precision, categories=PRECISIONS, ordered=True),
+    }, index=dates.index)
+
+
+def add_date_columns(metadata, column='date'):
+    """Add `year`, `decimal_year` and `date_precision` columns to `metadata` in place."""
+    parsed = parse_dates(metadata[column])
+    for name in parsed.columns:
+        metadata[name] = parsed[name]
+    return metadata
+
+
+def date_bounds(dates):
+    """The interval of decimal years each date string could stand for.
+
+    A full date is a point (lower == upper). `YYYY-MM-XX` spans its month,
+    and `YYYY-XX-XX` or a bare year spans the whole year. Returns a
+    DataFrame indexed like `dates` with float columns `lower` and `upper`
+    (NaN when no year can be read), for dating methods that treat
+    incomplete dates as constraints rather than mid-month/mid-year guesses.
+    """
+    dates = pd.Series(dates)
+    codes, uniques = pd.factorize(dates)
+    uniques = pd.Index(uniques).astype(str)
+    year, decimal_year, precision = _parse_unique(uniques)
+    lower = np.where(precision == PRECISIONS.index('day'), decimal_year, year)
+    upper = np.where(precision == PRECISIONS.index('day'), decimal_year, year + 1)
+
+    month = np.flatnonzero(precision == PRECISIONS.index('month'))
+    if len(month):
+        m = pd.to_numeric(uniques[month].str.extract(_FULL_DATE)[1]).to_numpy(dtype=np.int64)
+        years = (year[month].astype(np.int64) - 1970).astype('datetime64[Y]')
+        start = years.astype('datetime64[M]') + (m - 1)
+        year_start = years.astype('datetime64[D]')
+        year_days = ((years + 1).astype('datetime64[D]') - year_start).astype(float)
+        for bound, month_start in ((lower, start), (upper, start + 1)):
+            day_of_year = (month_start.astype('datetime64[D]') - year_start).astype(float)
+            bound[month] = year[month] + day_of_year / year_days
+
+    return pd.DataFrame({
+        'lower': np.append(lower, np.nan)[codes],
+        'upper': np.append(upper, np.nan)[codes],
+    }, index=dates.index)
@@ -0,0 +1,193 @@
+"""Patristic distances and nearest-relative queries without an all-pairs matrix.
+
+Finding each highlighted sample's closest non-Nebraska relative has meant
+computing the distance to every other tip, which is O(n²) for a batch of
+queries over the whole tree. The distance between tips u and v is
+`D[u] + D[v] - 2 * D[mrca(u, v)]`, with D the distance from the root. So
+with the root distances precomputed and an `LCAIndex`, any pair costs O(1)
+and a (k x k) distance matrix costs O(k²).
+
+For nearest neighbours, walk up from the query tip q. At each ancestor a,
+reached from its child c, the tips newly in reach are those of a's clade
+outside c's clade: two contiguous pre-order ranges, each at distance
+`D[q] - 2 * D[a] + D[t]`. A sparse table of range minima of D over the
+candidate tips gives the closest tip of a range in O(1). A heap of ranges
+(split around each tip taken) then returns the tips in order of distance.
+Every tip still to be reached from an ancestor a is at least `D[q] - D[a]`
+away, and that bound grows as the walk goes up. The walk therefore stops
+as soon as the heap holds k tips closer than the next ancestor's bound,
+which costs O(k log k) plus the ancestors passed.
+"""
+import heapq
+
+import numpy as np
+import pandas as pd
+
+from wnv_trees.traits import join_tips
+
+
+def _argmin_table(values):
+    # table[j][i] is the index of the smallest of values[i:i + 2**j]
+    table = [np.arange(len(values), dtype=np.int32)]
+    width = 1
+    while 2 * width <= len(values):
+        previous = table[-1]
+        left, right = previous[:-width], previous[width:]
+        table.append(np.where(values[right] < values[left], right, left))
+        width *= 2
+    return table
+
+
+class DistanceIndex:
+    """Patristic distances between the nodes of an `LCAIndex`'s tree.
+
+    Distances are sums of `atree.length` (years on a time tree, substitutions
+    per site on a divergence tree), with missing lengths taken as zero.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        atree = index.atree
+        lengths = np.nan_to_num(atree.length)
+        lengths[atree.parent < 0] = 0.0
+        self.root_distance = atree.cumulative_from_root(lengths)
+        self._candidates = {}
+
+    def distance_many(self, u, v):
+        """Pairwise distances between two equal-length arrays of node indices."""
+        u = np.asarray(u, dtype=np.int64)
+        v = np.asarray(v, dtype=np.int64)
+        depth = self.root_distance
+        return depth[u] + depth[v] - 2 * depth[self.index.mrca_many(u, v)]
+
+    def distance(self, u, v):
+        """Distance between nodes `u` and `v`."""
+        depth = self.root_distance
+        return float(depth[u] + depth[v] - 2 * depth[self.index.mrca(u, v)])
+
+    def matrix(self, nodes):
+        """The (k x k) distance matrix of `nodes`, from k² constant-time MRCA queries."""
+        nodes = np.asarray(nodes, dtype=np.int64)
+        u, v = np.meshgrid(nodes, nodes, indexing='ij')
+        return self.distance_many(u.ravel(), v.ravel()).reshape(len(nodes), len(nodes))
+
+    def candidates(self, allowed=None):
+        """Range-minimum table over the root distances of the tips in the `allowed` mask.
+
+        `allowed` is aligned with `index.tips` (tip drawing order); None
+        allows every tip. The table is built once per distinct mask and can
+        be passed to `nearest` as `allowed`.
+        """
+        atree = self.index.atree
+        if allowed is None:
+            allowed = np.ones(len(atree.tips), dtype=bool)
+        allowed = np.asarray(allowed, dtype=bool)
+        key = allowed.tobytes()
+        if key not in self._candidates:
+            values = np.full(len(atree), np.inf)
+            tips = atree.tips[allowed]
+            values[tips] = self.root_distance[tips]
+            # Only the latest table is kept: each one is O(n log n) memory
+            self._candidates = {key: (values, _argmin_table(values))}
+        return self._candidates[key]
+
+    def _closest(self, candidates, low, high):
+        # Index of the smallest candidate value in [low, high]
+        values, table = candidates
+        level = (high - low + 1).bit_length() - 1
+        left, right = table[level][low], table[level][high - (1 << level) + 1]
+        return int(right if values[right] < values[left] else left)
+
+    def nearest(self, query, k=1, allowed=None):
+        """The `k` tips closest to node `query`, nearest first, as (nodes, distances).
+
+        `allowed` is a tip mask (see `candidates`) or a table from
+        `candidates`; the query itself is never returned. Fewer than `k`
+        tips come back when fewer are allowed.
+        """
+        candidates = allowed if isinstance(allowed, tuple) else self.candidates(allowed)
+        values = candidates[0]
+        depth = self.root_distance
+        parent = self.index.parent
+        size = self.index.size
+        query = int(query)
+        heap = []
+
+        def push(low, high, base):
+            if low <= high:
+                best = self._closest(candidates, low, high)
+                if values[best] < np.inf:
+                    heapq.heappush(heap, (base + values[best], best, low, high, base))
+
+        nodes, distances = [], []
+        child, ancestor = query, int(parent[query])
+        while len(nodes) < k:
+            # Reach up while an unvisited ancestor's tips could still be closer
+            while ancestor >= 0 and (not heap or depth[query] - depth[ancestor] < heap[0][0]):
+                base = depth[query] - 2 * depth[ancestor]
+                push(ancestor, child - 1, base)
+                push(child + int(size[child]), ancestor + int(size[ancestor]) - 1, base)
+                child, ancestor = ancestor, int(parent[ancestor])
+            if not heap:
+                break
+            distance, best, low, high, base = heapq.heappop(heap)
+            nodes.append(best)
+            distances.append(distance)
+            push(low, best - 1, base)
+            push(best + 1, high, base)
+        return np.array(nodes, dtype=np.int64), np.array(distances)
+
+    def nearest_many(self, queries, k=1, allowed=None):
+        """`nearest` for each of `queries`; returns (k-column node and distance arrays).
+
+        Rows run out with -1 and NaN where fewer than `k` tips are allowed.
+        """
+        candidates = self.candidates(allowed)
+        nodes = np.full((len(queries), k), -1, dtype=np.int64)
+        distances = np.full((len(queries), k), np.nan)
+        for row, query in enumerate(queries):
+            found, distance = self.nearest(query, k, candidates)
+            nodes[row, :len(found)] = found
+            distances[row, :len(found)] = distance
+        return nodes, distances
+
+
+def neighbour_table(distances, queries, neighbours, patristic, metadata, key='strain'):
+    """One row per query and neighbour rank, for export as TSV.
+
+    `queries` are node indices, `neighbours` and `patristic` the arrays from
+    `DistanceIndex.nearest_many`. Columns: query, rank, neighbour, distance,
+    query_region, neighbour_region, query_date and neighbour_date (decimal
+    years), time_separation (neighbour_date - query_date), mrca (node
+    index) and tmrca (the MRCA's time, NaN on an undated tree).
+    """
+    atree = distances.index.atree
+    rows, ranks = np.nonzero(neighbours >= 0)
+    query = np.asarray(queries, dtype=np.int64)[rows]
+    neighbour = neighbours[rows, ranks]
+    mrca = distances.index.mrca_many(query, neighbour)
+    columns = [column for column in ('Region', 'decimal_year') if column in metadata]
+    query_meta = join_tips(atree.names[query], metadata, key=key, columns=columns)
+    neighbour_meta = join_tips(atree.names[neighbour], metadata, key=key, columns=columns)
+    table = pd.DataFrame({
+        'query': atree.names[query],
+        'rank': ranks + 1,
+        'neighbour': atree.names[neighbour],
+        'distance': patristic[rows, ranks],
+    })
+    if 'Region' in metadata:
+        table['query_region'] = query_meta['Region']
+        table['neighbour_region'] = neighbour_meta['Region']
+    if 'decimal_year' in metadata:
+        table['query_date'] = query_meta['decimal_year'].astype(float)
+        table['neighbour_date'] = neighbour_meta['decimal_year'].astype(float)
+        table['time_separation'] = table['neighbour_date'] - table['query_date']
+    table['mrca'] = mrca
+    table['tmrca'] = atree.time[mrca]
+    return table
+
+
+def matrix_table(distances, nodes):
+    """The distance matrix of `nodes` as a DataFrame labelled by tip name."""
+    names = distances.index.atree.names[np.asarray(nodes, dtype=np.int64)]
+    return pd.DataFrame(distances.matrix(nodes), index=pd.Index(names, name='strain'), columns=names)
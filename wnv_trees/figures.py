@@ -0,0 +1,392 @@
+"""The repository's figures as functions of a shared `Pipeline`.
+
+Each function draws one of the standalone scripts' figures from the state in
+a `Pipeline` and returns the matplotlib Figure. None of them modify the tree,
+so any number of figures can be drawn from one loaded and dated tree.
+`FIGURES` maps the names used on the command line to these functions.
+"""
+import matplotlib.pyplot as plt
+from matplotlib import gridspec
+from matplotlib.patches import Patch
+
+from wnv_trees.ancestral import state_colours
+from wnv_trees.clades import bubble_sizes, majority, pure_clades
+from wnv_trees.collapse import collapse_clades, draw_wedges
+from wnv_trees.pipeline import NE_YEAR
+from wnv_trees.render import draw_branches, draw_tip_classes, draw_tips
+from wnv_trees.traits import annotate_tips
+
+NE_COLOURS = {
+    'NE_Central': '#FCB614',  # Yellow/Gold
+    'NE_West': '#005E63',     # Teal
+    'NE_East': '#AD122A',     # Red
+}
+
+UNMC_COLORS = {
+    'green_2': '#A1B426',      # Bright Green
+    'orange_1': '#F26721',     # Dark Orange
+    'blue_1': '#002957',       # Dark Blue
+    'green_1': '#656515',      # Dark Green
+    'grey': '#CCCCCC'          # Light grey
+}
+
+REGION_COLORS = {
+    'Northeast': UNMC_COLORS['green_2'],
+    'West': UNMC_COLORS['orange_1'],
+    'Midwest': UNMC_COLORS['blue_1'],
+    'South': '#129DBF',
+    'Other': UNMC_COLORS['grey']
+}
+
+UNMC_BLUE = '#002957'
+UNMC_RED = '#AD122A'
+
+UNMC_SAMPLES = {
+    'UNMC0008', 'UNMC0009', 'UNMC0014', 'UNMC0020', 'UNMC0185', 'UNMC0270',
+    'UNMC0299', 'UNMC0261', 'UNMC0267', 'UNMC0015', 'UNMC0011', 'UNMC0016',
+    'UNMC0017', 'UNMC0013', 'UNMC0730', 'UNMC0567', 'UNMC0019', 'UNMC0209',
+    'UNMC0265', 'UNMC0728', 'UNMC0010', 'UNMC0575', 'UNMC0538', 'UNMC0012',
+    'UNMC0707', 'UNMC0282', 'UNMC0699', 'UNMC0678', 'UNMC0706'
+}
+
+# Vertical compression applied to the NE 2023 time trees
+Y_COMPRESSION = 0.6
+TIME_RANGE = (1993, 2025)
+# Wedge labels on the time trees: the years from a collapsed clade's root to its latest tip
+TIME_SPAN = '{:.0f}-{:.0f}'
+
+# Clade bubbles on the bubbles figure: area per tip (points squared) and opacity
+BUBBLE_SCALE = 60.0
+BUBBLE_ALPHA = 0.35
+
+
+def _time_axes(ax, tree, title, y_scale=1.0):
+    ax.set_ylim(-10, tree.ySpan * y_scale + 10)
+    ax.set_xlim(*TIME_RANGE)
+    [ax.spines[loc].set_visible(False) for loc in ['left', 'right', 'top']]
+    ax.grid(axis='x', ls='-', color='grey', alpha=0.3)
+    ax.tick_params(axis='y', size=0)
+    ax.tick_params(axis='x', labelsize=16)
+    ax.set_yticklabels([])
+    ax.set_xlabel('Time (Years)', fontsize=18)
+    ax.set_title(title, fontsize=20, fontweight='bold', pad=20)
+
+
+def _divergence_axes(ax, tree):
+    ax.set_ylim(-5, tree.ySpan + 5)
+    x_coords = [node.x for node in tree.Objects if getattr(node, 'x', None) is not None]
+    x_min, x_max = min(x_coords), max(x_coords)
+    x_range = x_max - x_min
+    ax.set_xlim(x_min - 0.05 * x_range, x_max + 0.05 * x_range)
+
+    [ax.spines[loc].set_visible(False) for loc in ['left', 'right', 'top']]
+    ax.grid(axis='x', linestyle='-', color='grey', alpha=0.3, linewidth=0.8)
+    ax.tick_params(axis='y', size=0)
+    ax.tick_params(axis='x', labelsize=14)
+    ax.set_yticklabels([])
+    ax.set_xlabel('Nucleotide Divergence from Root', fontsize=18, fontweight='bold')
+
+
+def _background(pipeline):
+    # Extra style for the grey branches, wedges and non-highlighted tips: with
+    # rasterizing on they become images in PDF/SVG while highlights stay vector
+    return {'rasterized': True} if pipeline.rasterize else {}
+
+
+def _tight_layout(pipeline, fig):
+    # Text extents are measured by drawing the figure, so this can cost as much as a save
+    with pipeline.profiler.span('tight_layout'):
+        fig.tight_layout()
+
+
+def _collapsed(pipeline, ax, tree, is_highlighted, x_attr=None, y_attr=None, span_format=None):
+    # With level-of-detail drawing on, draw background clades as labelled
+    # wedges and return the nodes left to draw individually
+    if not pipeline.collapse:
+        return None
+    clades, visible = collapse_clades(tree, is_highlighted, pipeline.collapse)
+    wedges = draw_wedges(ax, clades, x_attr=x_attr, y_attr=y_attr, label=True, span_format=span_format,
+                         **_background(pipeline))
+    hidden = sum(wedge['tips'] for wedge in wedges)
+    pipeline.profiler.annotate(collapsed_clades=len(wedges), collapsed_tips=hidden)
+    if pipeline.verbose:
+        print(f"Collapsed {len(wedges)} background clades ({hidden} tips) into wedges")
+    return visible
+
+
+def _styled_tips(pipeline, ax, tree, rules, default, x_attr=None, y_attr=None, nodes=None):
+    # Tip colours and sizes from metadata rules, evaluated as arrays
+    if x_attr is None:
+        x_attr = lambda k: k.x
+    if y_attr is None:
+        y_attr = lambda k: k.y
+    tips = [k for k in (tree.Objects if nodes is None else nodes) if k.branchType == 'leaf']
+    styles = annotate_tips([k.name for k in tips], pipeline.metadata, rules, default,
+                           verbose=pipeline.verbose)
+    pipeline.profiler.annotate(unmatched_tips=len(styles['table']['unmatched']))
+    draw_tips(ax, [x_attr(k) for k in tips], [y_attr(k) for k in tips], styles['rgba'], styles['size'],
+              edgecolors=styles['edge_rgba'], linewidths=styles['linewidth'], zorders=styles['zorder'],
+              rasterized=styles['rasterized'])
+    return styles['counts']
+
+
+def _ne_legend(ax, bubbles=False):
+    legend_elements = [ax.scatter([], [], c=colour, s=150, edgecolors='black', linewidth=1,
+                                  label=f'{region} ({NE_YEAR})')
+                       for region, colour in NE_COLOURS.items()]
+    legend_elements.append(ax.scatter([], [], c='#BBBBBB', s=75, edgecolors='black', linewidth=0.5,
+                                      label='Other samples'))
+    if bubbles:
+        legend_elements.append(ax.scatter([], [], c='#BBBBBB', s=300, alpha=BUBBLE_ALPHA,
+                                          label=f'NE {NE_YEAR} clade (area by tips)'))
+    ax.legend(handles=legend_elements, loc='upper left', fontsize=16,
+              title='Sample Types', title_fontsize=18, frameon=True, fancybox=True, shadow=True,
+              bbox_to_anchor=(0.02, 0.98))
+
+
+def _clade_bubbles(pipeline, ax, x_attr, y_attr):
+    # A bubble on every maximal all-NE 2023 clade, sized by its tip count
+    # and coloured by its majority NE region
+    index = pipeline.lca_index()
+    counts = pipeline.ne_2023_counts()
+    nodes = pure_clades(index.atree, counts)
+    regions = majority(counts)['category'][nodes]
+    ax.scatter([x_attr(index.node(i)) for i in nodes], [y_attr(index.node(i)) for i in nodes],
+               s=bubble_sizes(counts, nodes, scale=BUBBLE_SCALE), c=[NE_COLOURS[r] for r in regions],
+               alpha=BUBBLE_ALPHA, linewidths=0, zorder=20002)
+    return len(nodes)
+
+
+def _ne_2023_figure(pipeline, title, colour_branches, y_scale, edges=True, bubbles=False):
+    tree = pipeline.tree
+    ne_2023 = pipeline.strains['ne_2023']
+    fig, ax = plt.subplots(figsize=(20, 10), facecolor='w')
+
+    x_attr = lambda k: k.absoluteTime
+    y_attr = lambda k: k.y * y_scale
+
+    def branch_colour(k):
+        if colour_branches and k.branchType == 'leaf' and k.name in ne_2023:
+            return NE_COLOURS[ne_2023[k.name]]
+        return '#CCCCCC'
+
+    def rasterized(k):
+        # Only the grey branches; coloured NE branches stay vector
+        return bool(pipeline.rasterize) and branch_colour(k) == '#CCCCCC'
+
+    visible = _collapsed(pipeline, ax, tree, lambda k: k.name in ne_2023, x_attr, y_attr, TIME_SPAN)
+    draw_branches(ax, tree, x_attr=x_attr, y_attr=y_attr, colour=branch_colour,
+                  connector_colour='#CCCCCC', width=2, alpha=0.8, zorder=10, nodes=visible,
+                  rasterized=rasterized)
+
+    highlighted = {'name': 'ne_2023', 'column': 'Region', 'colours': NE_COLOURS, 'years': NE_YEAR,
+                   'size': 100, 'zorder': 20003}
+    other = {'colour': '#BBBBBB', 'size': 30, 'zorder': 20001, **_background(pipeline)}
+    if edges:
+        highlighted.update(edgecolor='black', linewidth=1, alpha=1.0)
+        other.update(alpha=0.6)
+    _styled_tips(pipeline, ax, tree, [highlighted], other, x_attr=x_attr, y_attr=y_attr, nodes=visible)
+    if bubbles:
+        _clade_bubbles(pipeline, ax, x_attr, y_attr)
+
+    _time_axes(ax, tree, title, y_scale)
+    _ne_legend(ax, bubbles)
+    _tight_layout(pipeline, fig)
+    return fig
+
+
+def ne2023(pipeline):
+    """Time tree with Nebraska 2023 tips and their branches coloured by NE region."""
+    return _ne_2023_figure(pipeline, 'Phylogenetic Tree - Nebraska 2023 Samples Highlighted',
+                           colour_branches=True, y_scale=Y_COMPRESSION)
+
+
+def ne2023_tips(pipeline):
+    """Time tree with grey branches and only the Nebraska 2023 tip markers coloured."""
+    return _ne_2023_figure(pipeline, 'Phylogenetic Tree - Nebraska 2023 Tips Only Highlighted',
+                           colour_branches=False, y_scale=1.0)
+
+
+def bubbles(pipeline):
+    """Compressed time tree with edge-less Nebraska 2023 tips and a bubble on each all-NE 2023 clade."""
+    return _ne_2023_figure(pipeline, 'Phylogenetic Tree - Nebraska 2023 Samples Highlighted',
+                           colour_branches=True, y_scale=Y_COMPRESSION, edges=False, bubbles=True)
+
+
+def unmc_regions(pipeline):
+    """Time tree with tips coloured by broad US region and the UNMC samples in red."""
+    tree = pipeline.tree
+    fig, ax = plt.subplots(figsize=(20, 10), facecolor='w')
+    x_attr = lambda k: k.absoluteTime
+
+    visible = _collapsed(pipeline, ax, tree, lambda k: k.name in UNMC_SAMPLES, x_attr,
+                         span_format=TIME_SPAN)
+    draw_branches(ax, tree, x_attr=x_attr, colour='#CCCCCC', width=1.5, alpha=0.7, zorder=10,
+                  nodes=visible, **_background(pipeline))
+    regional = {'size': 40, 'alpha': 0.8, 'zorder': 20001, **_background(pipeline)}
+    _styled_tips(pipeline, ax, tree, [
+        {'name': 'unmc', 'members': UNMC_SAMPLES, 'colour': UNMC_RED, 'size': 120, 'edgecolor': 'black',
+         'linewidth': 2, 'alpha': 1.0, 'zorder': 20005},
+        {'name': 'regional', 'column': 'broad_region', 'colours': REGION_COLORS, **regional},
+    ], dict(regional, colour=UNMC_COLORS['grey']), x_attr=x_attr, nodes=visible)
+
+    _time_axes(ax, tree, 'Phylogenetic Tree - UNMC Samples Highlighted by US Region')
+    legend_elements = [
+        ax.scatter([], [], c=REGION_COLORS['Northeast'], s=80, label='Northeast', alpha=0.8),
+        ax.scatter([], [], c=REGION_COLORS['West'], s=80, label='West', alpha=0.8),
+        ax.scatter([], [], c=REGION_COLORS['Midwest'], s=80, label='Midwest (incl. Nebraska)', alpha=0.8),
+        ax.scatter([], [], c=REGION_COLORS['South'], s=80, label='South', alpha=0.8),
+        ax.scatter([], [], c=UNMC_RED, s=150, edgecolors='black', linewidth=2, label='UNMC Samples'),
+    ]
+    ax.legend(handles=legend_elements, loc='upper left', fontsize=14,
+              title='Regional Distribution', title_fontsize=16, frameon=True,
+              fancybox=True, shadow=True, bbox_to_anchor=(0.02, 0.98))
+    _tight_layout(pipeline, fig)
+    return fig
+
+
+def ancestral_regions(pipeline):
+    """Time tree with every branch coloured by broad US region, inferred for internal nodes."""
+    tree = pipeline.tree
+    regions = pipeline.ancestral('broad_region')
+    fig, ax = plt.subplots(figsize=(20, 10), facecolor='w')
+    x_attr = lambda k: k.absoluteTime
+
+    draw_branches(ax, tree, x_attr=x_attr, colour=state_colours(regions, REGION_COLORS),
+                  width=1.5, alpha=0.8, zorder=10, **_background(pipeline))
+    regional = {'size': 30, 'alpha': 0.9, 'zorder': 20001, **_background(pipeline)}
+    _styled_tips(pipeline, ax, tree, [
+        {'name': 'regional', 'column': 'broad_region', 'colours': REGION_COLORS, **regional},
+    ], dict(regional, colour=UNMC_COLORS['grey']), x_attr=x_attr)
+
+    _time_axes(ax, tree, 'Phylogenetic Tree - Branches Coloured by Inferred US Region')
+    legend_elements = [ax.scatter([], [], c=colour, s=80, label=region, alpha=0.9)
+                       for region, colour in REGION_COLORS.items()]
+    ax.legend(handles=legend_elements, loc='upper left', fontsize=14,
+              title='Region (tips and inferred ancestors)', title_fontsize=16, frameon=True,
+              fancybox=True, shadow=True, bbox_to_anchor=(0.02, 0.98))
+    _tight_layout(pipeline, fig)
+    return fig
+
+
+def divergence(pipeline):
+    """Divergence tree with the UNMC samples highlighted, using baltic's own x/y layout."""
+    tree = pipeline.divergence_tree
+    fig, ax = plt.subplots(figsize=(20, 14), facecolor='white')
+
+    visible = _collapsed(pipeline, ax, tree, lambda k: k.name in UNMC_SAMPLES)
+    draw_branches(ax, tree, colour='#AAAAAA', width=2, alpha=0.8, zorder=10, nodes=visible,
+                  **_background(pipeline))
+
+    index = pipeline.tip_index('divergence_tree')
+    highlighted = index.selected_names(index.isin(UNMC_SAMPLES))
+    unmc = index.selected_names(index.search('UNMC'))
+
+    def classify_tip(node):
+        strain = getattr(node, 'name', None)
+        if strain in highlighted:
+            return 'highlighted'
+        elif strain in unmc:
+            return 'unmc'
+        return 'other'
+
+    draw_tip_classes(ax, tree, classify_tip, styles={
+        'highlighted': {'colour': UNMC_RED, 'size': 140, 'edgecolor': 'black',
+                        'linewidth': 2.5, 'alpha': 1.0, 'zorder': 20005},
+        'unmc': {'colour': UNMC_BLUE, 'size': 80, 'alpha': 0.9, 'zorder': 20002},
+        'other': {'colour': UNMC_BLUE, 'size': 80, 'alpha': 0.9, 'zorder': 20001, **_background(pipeline)},
+    }, nodes=visible)
+
+    _divergence_axes(ax, tree)
+    _tight_layout(pipeline, fig)
+    return fig
+
+
+def year_histogram(pipeline):
+    """Genome counts per collection year, split at the 2019 cutoff (explore_data.py)."""
+    metadata_with_years = pipeline.metadata.dropna(subset=['year'])
+    year_counts = metadata_with_years['year'].value_counts().sort_index()
+
+    fig = plt.figure(figsize=(15, 10))
+    gs = gridspec.GridSpec(2, 2, height_ratios=[2, 1], width_ratios=[3, 1])
+
+    # Main bar plot - all years, with 2023 highlighted
+    ax1 = fig.add_subplot(gs[0, :])
+    colors = ['orange' if year == 2023 else 'steelblue' for year in year_counts.index]
+    bars = ax1.bar(year_counts.index, year_counts.values, alpha=0.7, color=colors, edgecolor='navy', linewidth=0.5)
+    ax1.axvline(x=2019, color='red', linestyle='--', linewidth=2, alpha=0.8, label='2019 Cutoff')
+    legend_elements = [
+        plt.Line2D([0], [0], color='red', linestyle='--', linewidth=2, alpha=0.8, label='2019 Cutoff'),
+        Patch(facecolor='steelblue', alpha=0.7, label='Published genomes'),
+        Patch(facecolor='orange', alpha=0.7, label='Genomes generated as part of this study')
+    ]
+    ax1.set_xlabel('Year', fontsize=12, fontweight='bold')
+    ax1.set_ylabel('Number of Genomes', fontsize=12, fontweight='bold')
+    ax1.set_title('West Nile Virus Genome Counts by Year\nDemonstrating 2019 Cutoff Rationale',
+                  fontsize=14, fontweight='bold', pad=20)
+    ax1.grid(True, alpha=0.3)
+    ax1.legend(handles=legend_elements, fontsize=10, loc='upper left')
+    all_years = list(range(int(year_counts.index.min()), int(year_counts.index.max()) + 1))
+    ax1.set_xticks(all_years)
+    ax1.set_xticklabels(all_years, rotation=45, ha='right')
+    for bar in bars:
+        height = bar.get_height()
+        ax1.text(bar.get_x() + bar.get_width()/2, height + max(year_counts.values) * 0.005,
+                 f'{int(height)}', ha='center', va='bottom', fontsize=7, fontweight='bold')
+
+    # Bottom left: pre- vs post-2019
+    ax2 = fig.add_subplot(gs[1, 0])
+    pre_2019 = metadata_with_years[metadata_with_years['year'] <= 2019]
+    post_2019 = metadata_with_years[metadata_with_years['year'] > 2019]
+    comparison_data = [len(pre_2019), len(post_2019)]
+    comparison_labels = [f'≤2019\n({len(pre_2019)} genomes)', f'>2019\n({len(post_2019)} genomes)']
+    bars2 = ax2.bar(comparison_labels, comparison_data, color=['lightblue', 'lightcoral'], alpha=0.7,
+                    edgecolor='black')
+    ax2.set_title('Genome Distribution: Pre vs Post 2019', fontweight='bold')
+    ax2.set_ylabel('Number of Genomes')
+    total = sum(comparison_data)
+    for bar, count in zip(bars2, comparison_data):
+        ax2.text(bar.get_x() + bar.get_width()/2, bar.get_height() + max(comparison_data) * 0.02,
+                 f'{count / total * 100:.1f}%', ha='center', va='bottom', fontweight='bold')
+
+    # Bottom right: recent years detail
+    ax3 = fig.add_subplot(gs[1, 1])
+    recent_years = year_counts[year_counts.index >= 2015]
+    bars3 = ax3.bar(recent_years.index, recent_years.values,
+                    color=['lightblue' if year <= 2019 else 'lightcoral' for year in recent_years.index],
+                    alpha=0.7, edgecolor='black')
+    ax3.axvline(x=2019, color='red', linestyle='--', linewidth=2, alpha=0.8)
+    ax3.set_title('Recent Years Detail (2015+)', fontweight='bold')
+    ax3.set_xlabel('Year')
+    ax3.set_ylabel('Count')
+    ax3.tick_params(axis='x', rotation=45)
+    for bar in bars3:
+        height = bar.get_height()
+        if height > 0:
+            ax3.text(bar.get_x() + bar.get_width()/2, height + max(recent_years.values) * 0.02,
+                     f'{int(height)}', ha='center', va='bottom', fontsize=8, fontweight='bold')
+
+    _tight_layout(pipeline, fig)
+    return fig
+
+
+# Pipeline attributes each figure reads, so they can be loaded up front
+FIGURE_INPUTS = {
+    'ne2023': ('tree', 'strains'),
+    'ne2023-tips': ('tree', 'strains'),
+    'bubbles': ('tree', 'strains'),
+    'unmc-regions': ('tree', 'strains'),
+    'ancestral-regions': ('tree', 'metadata'),
+    'divergence': ('divergence_tree',),
+    'year-histogram': ('metadata',),
+}
+
+FIGURES = {
+    'ne2023': ne2023,
+    'ne2023-tips': ne2023_tips,
+    'bubbles': bubbles,
+    'unmc-regions': unmc_regions,
+    'ancestral-regions': ancestral_regions,
+    'divergence': divergence,
+    'year-histogram': year_histogram,
+}
@@ -0,0 +1,130 @@
+"""Vectorized tree layout on an `ArrayTree`.
+
+Computes everything `drawTree` plus the scripts' compression loops do, as
+whole-array operations: the order tips are stacked in (file order, baltic's
+`sortBranches` order or ladderized), tip y positions, internal y as the mean
+or midpoint of the children, x as time or cumulative divergence, and an
+optional vertical compression. Nothing is written to baltic nodes unless
+`apply_layout` is called.
+"""
+import numpy as np
+
+from wnv_trees.arraytree import ArrayTree
+
+ORDERS = ('file', 'baltic', 'ascending', 'descending')
+
+
+def tip_counts(atree):
+    """Number of tips below every node (1 for a tip)."""
+    return atree.bottom_up(atree.is_leaf.astype(float), lambda nodes, total: total, np.add, 0.0)
+
+
+def _sibling_keys(atree, order, counts):
+    # Keys for sorting each node's children, most significant last (np.lexsort)
+    index = np.arange(len(atree))
+    if order == 'file':
+        return (index,)
+    if order == 'baltic':
+        # sortBranches(): tips before clades, tips by decreasing length, clades by
+        # increasing size then decreasing length
+        length = np.nan_to_num(atree.length)
+        is_node = ~atree.is_leaf
+        return (index, -length, np.where(is_node, counts, 0), is_node)
+    sign = 1 if order == 'ascending' else -1
+    return (index, sign * counts)
+
+
+def tip_order(atree, order='file'):
+    """Rank of every tip from the top of the plot, and each node's first tip rank.
+
+    `order` is 'file' (as stored), 'baltic' (the child order `loadNewick`
+    produces with `sortBranches`), or 'ascending'/'descending' to ladderize
+    by clade size. Returns (start, counts): `start[i]` is the rank of the
+    first tip under node `i` and `counts[i]` its number of tips.
+    """
+    if order not in ORDERS:
+        raise ValueError(f"order must be one of {', '.join(ORDERS)}")
+    counts = tip_counts(atree)
+    children = np.flatnonzero(atree.parent >= 0)
+    keys = [key[children] for key in _sibling_keys(atree, order, counts)]
+    sorted_children = children[np.lexsort(keys + [atree.parent[children]])]
+
+    # Tips before each child within its parent: exclusive cumulative sum per group
+    parents = atree.parent[sorted_children]
+    running = np.cumsum(counts[sorted_children])
+    group_start = np.r_[True, parents[1:] != parents[:-1]]
+    before_group = np.maximum.accumulate(np.where(group_start, running - counts[sorted_children], 0))
+    offset = np.zeros(len(atree))
+    offset[sorted_children] = running - counts[sorted_children] - before_group
+    return atree.cumulative_from_root(offset), counts
+
+
+def compute_layout(atree, x='divergence', y='mean', order='file', compression=1.0):
+    """Lay out `atree` and return a dict of 'x', 'y', 'y_span' and 'start'.
+
+    `x` is 'divergence' (cumulative branch length from the root, baltic's
+    `height`), 'time' (`atree.time`) or a node-aligned array. `y` places
+    internal nodes at the 'mean' of their children's y (as `drawTree` does)
+    or the 'midpoint' of the outermost children. `compression` scales y and
+    the y span, like the scripts' `y_compression_factor`.
+    """
+    start, _ = tip_order(atree, order)
+    n_tips = int(atree.is_leaf.sum())
+    tip_y = np.where(atree.is_leaf, n_tips - start - 0.5, np.nan)
+
+    if y == 'mean':
+        child_counts = atree.child_reduce(np.ones(len(atree)), np.add, 0.0)
+        ys = atree.bottom_up(tip_y, lambda nodes, total: total / child_counts[nodes], np.add, 0.0)
+    elif y == 'midpoint':
+        low = atree.bottom_up(tip_y, lambda nodes, value: value, np.fmin, np.inf)
+        high = atree.bottom_up(tip_y, lambda nodes, value: value, np.fmax, -np.inf)
+        ys = (low + high) / 2
+    else:
+        raise ValueError("y must be 'mean' or 'midpoint'")
+
+    if isinstance(x, str):
+        if x == 'divergence':
+            xs = atree.cumulative_from_root(np.nan_to_num(atree.length))
+        elif x == 'time':
+            xs = atree.time.copy()
+        else:
+            raise ValueError("x must be 'divergence', 'time' or an array")
+    else:
+        xs = np.asarray(x, dtype=float)
+
+    ys = ys * compression
+    y_span = float(np.nanmax(ys) - np.nanmin(ys) + np.nanmin(ys) * 2)
+    return {'x': xs, 'y': ys, 'y_span': y_span, 'start': start}
+
+
+def apply_layout(tree, layout):
+    """Write a layout computed on `ArrayTree.from_baltic(tree)` back to `tree`.
+
+    Sets `x`, `y` and `yRange` on every node and `tree.ySpan`, and reorders
+    each node's children top to bottom so they agree with the new tip order.
+    """
+    nodes = []
+    stack = [tree.root]
+    while stack:
+        k = stack.pop()
+        nodes.append(k)
+        if k.branchType != 'leaf':
+            stack.extend(reversed(k.children))
+
+    xs, ys = layout['x'], layout['y']
+    for i, k in enumerate(nodes):
+        k.x = float(xs[i])
+        k.y = float(ys[i])
+    for k in reversed(nodes):
+        if k.branchType != 'leaf':
+            k.children.sort(key=lambda child: -child.y)
+            k.yRange = [min(child.yRange[0] if child.branchType != 'leaf' else child.y for child in k.children),
+                        max(child.yRange[1] if child.branchType != 'leaf' else child.y for child in k.children)]
+    tree.ySpan = layout['y_span']
+    return tree
+
+
+def layout_baltic(tree, x='divergence', y='mean', order='file', compression=1.0):
+    """Lay out a baltic tree with `compute_layout` and write the result back to it."""
+    atree = ArrayTree.from_baltic(tree)
+    return apply_layout(tree, compute_layout(atree, x=x, y=y, order=order, compression=compression))
@@ -0,0 +1,153 @@
+"""Constant-time MRCA and clade-membership queries on a pre-order tree.
+
+baltic's `commonAncestor` walks every descendant's path to the root and
+intersects the paths, so each query costs O(k * depth). `LCAIndex` does the
+work once per tree. Because `ArrayTree` stores nodes in pre-order, every
+clade is a contiguous index range `[i, i + size[i])`. That makes subtree
+membership and clade tip counts O(1). For two nodes u < v, their most recent
+common ancestor is the parent of the shallowest node in `(u, v]`. A sparse
+table of range-minimum depths answers that in O(1). It is the Euler-tour
+RMQ method, using the pre-order itself instead of a 2n - 1 tour. The MRCA of
+any set of nodes is the MRCA of its lowest and highest index, so a set of k
+nodes costs O(k). Every query also has a batch form that runs on numpy
+arrays.
+"""
+import numpy as np
+
+from wnv_trees.arraytree import ArrayTree
+from wnv_trees.tipindex import TipIndex
+
+
+class LCAIndex:
+    """MRCA, descendant and clade-size queries on an `ArrayTree`.
+
+    Nodes are `ArrayTree` indices. With `from_tree`, `objects` holds the
+    matching baltic nodes and `node(i)` converts an index back.
+    """
+
+    def __init__(self, atree, objects=None):
+        self.atree = atree
+        self.objects = objects
+        self.parent = atree.parent
+        self.depth = atree.depth()
+        self.size = atree.clade_sizes()
+        self.tip_count = np.cumsum(np.r_[0, atree.is_leaf.astype(np.int64)])
+        self.tips = TipIndex.from_array_tree(atree)
+        self._table = self._sparse_table()
+
+    @classmethod
+    def from_tree(cls, tree):
+        """Index a baltic tree; `node(i)` then returns the baltic node for index `i`."""
+        objects = []
+        stack = [tree.root]
+        while stack:
+            k = stack.pop()
+            objects.append(k)
+            if k.branchType != 'leaf':
+                stack.extend(reversed(k.children))
+        return cls(ArrayTree.from_baltic(tree), objects)
+
+    def _sparse_table(self):
+        # table[j][i] is the index of the shallowest node in [i, i + 2**j)
+        depth = self.depth
+        table = [np.arange(len(depth), dtype=np.int32)]
+        width = 1
+        while 2 * width <= len(depth):
+            previous = table[-1]
+            left, right = previous[:-width], previous[width:]
+            table.append(np.where(depth[right] < depth[left], right, left))
+            width *= 2
+        return table
+
+    def _shallowest(self, low, high):
+        # Shallowest node in [low, high] for arrays of inclusive ranges
+        level = np.floor(np.log2(high - low + 1)).astype(np.int64)
+        result = np.empty(len(low), dtype=np.int64)
+        for j in np.unique(level):
+            rows = level == j
+            table = self._table[j]
+            left = table[low[rows]]
+            right = table[high[rows] - (1 << j) + 1]
+            result[rows] = np.where(self.depth[right] < self.depth[left], right, left)
+        return result
+
+    def node(self, i):
+        """The baltic node for index `i` (only for indexes built with `from_tree`)."""
+        if self.objects is None:
+            raise ValueError('This index was not built from a baltic tree')
+        return self.objects[i]
+
+    def index_of(self, names):
+        """Node indices of the tips called `names`; raises KeyError for unknown names."""
+        positions = self.tips.positions(names)
+        if (positions < 0).any():
+            missing = [name for name, position in zip(names, positions) if position < 0]
+            raise KeyError(f"No tips named {', '.join(map(str, missing[:5]))}")
+        return self.tips.tip_nodes[positions]
+
+    def mrca_many(self, u, v):
+        """Pairwise MRCAs of two equal-length arrays of node indices."""
+        u = np.asarray(u, dtype=np.int64)
+        v = np.asarray(v, dtype=np.int64)
+        low, high = np.minimum(u, v), np.maximum(u, v)
+        result = low.copy()
+        apart = low != high
+        if apart.any():
+            shallowest = self._shallowest(low[apart] + 1, high[apart])
+            result[apart] = self.parent[shallowest]
+        return result
+
+    def mrca(self, u, v):
+        """MRCA of nodes `u` and `v`."""
+        # Scalar version of mrca_many, without the array overhead
+        low, high = sorted((int(u), int(v)))
+        if low == high:
+            return low
+        level = (high - low).bit_length() - 1
+        table = self._table[level]
+        left, right = table[low + 1], table[high - (1 << level) + 1]
+        return int(self.parent[right if self.depth[right] < self.depth[left] else left])
+
+    def mrca_set(self, nodes):
+        """MRCA of a set of node indices, in O(k)."""
+        nodes = np.asarray(nodes, dtype=np.int64)
+        if not len(nodes):
+            raise ValueError('Need at least one node')
+        return self.mrca(nodes.min(), nodes.max())
+
+    def mrca_of_names(self, names):
+        """MRCA of the tips called `names`."""
+        return self.mrca_set(self.index_of(list(names)))
+
+    def mrca_sets(self, sets):
+        """MRCAs of many node sets at once (e.g. one per clade query)."""
+        low = np.array([np.min(nodes) for nodes in sets], dtype=np.int64)
+        high = np.array([np.max(nodes) for nodes in sets], dtype=np.int64)
+        return self.mrca_many(low, high)
+
+    def is_descendant(self, nodes, ancestors):
+        """Whether each of `nodes` lies in the clade of the matching `ancestors` (itself included)."""
+        nodes = np.asarray(nodes, dtype=np.int64)
+        ancestors = np.asarray(ancestors, dtype=np.int64)
+        return (nodes >= ancestors) & (nodes < ancestors + self.size[ancestors])
+
+    def clade(self, ancestor):
+        """Node indices of the clade rooted at `ancestor`, itself first."""
+        return np.arange(ancestor, ancestor + self.size[ancestor])
+
+    def clade_tips(self, ancestors):
+        """Number of tips in the clade of each of `ancestors`."""
+        ancestors = np.asarray(ancestors, dtype=np.int64)
+        return self.tip_count[ancestors + self.size[ancestors]] - self.tip_count[ancestors]
+
+    def clade_tip_mask(self, ancestor):
+        """Mask over `self.tips` (tip drawing order) of the tips in `ancestor`'s clade."""
+        first = self.tip_count[ancestor]
+        mask = np.zeros(len(self.tips), dtype=bool)
+        mask[first:self.tip_count[ancestor + self.size[ancestor]]] = True
+        return mask
+
+    def is_monophyletic(self, nodes):
+        """Whether the tips `nodes` make up a whole clade, with no other tips in it."""
+        nodes = np.unique(np.asarray(nodes, dtype=np.int64))
+        return int(self.clade_tips([self.mrca_set(nodes)])[0]) == len(nodes)
@@ -0,0 +1,137 @@
+"""Typed, projected loading of the sample metadata table with a columnar cache.
+
+The scripts only ever use `strain`, `Region` and `date`, so `load_metadata`
+reads just those columns, stores `Region` as a categorical and adds the
+derived `year`, `decimal_year`, `date_precision` and `broad_region` columns.
+The finished table is cached as an .npz of column arrays keyed on the TSV's
+content hash, so it is only re-parsed when the file changes.
+"""
+import hashlib
+import os
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from wnv_trees.dates import add_date_columns
+from wnv_trees.tree_cache import (DEFAULT_MAX_BYTES, cache_subdir, evict, file_digest,
+                                  pack_strings, save_arrays, unpack_strings)
+
+# Bump when the derived columns or on-disk layout change
+CACHE_VERSION = 2
+DEFAULT_COLUMNS = ('strain', 'Region', 'date')
+
+BROAD_REGIONS = ['Northeast', 'West', 'Midwest', 'South', 'Other']
+
+
+# Regional groupings (combining all NE_ regions into Midwest)
+def get_broad_region(region):
+    if pd.isna(region):
+        return 'Other'
+
+    region_str = str(region)
+
+    # Group NE_ regions as Midwest (since they're Nebraska samples)
+    if region_str.startswith('NE_'):
+        return 'Midwest'
+    elif region_str in BROAD_REGIONS:
+        return region_str
+    else:
+        return 'Other'
+
+
+def broad_regions(regions):
+    """Vectorized `get_broad_region` for a column of regions, returned as a categorical."""
+    regions = pd.Series(regions).astype('category')
+    mapping = [get_broad_region(region) for region in regions.cat.categories]
+    codes = np.array([BROAD_REGIONS.index(name) for name in mapping] + [BROAD_REGIONS.index('Other')])
+    # Missing regions have code -1, which picks the trailing 'Other'
+    return pd.Series(pd.Categorical.from_codes(codes[regions.cat.codes.to_numpy()], categories=BROAD_REGIONS),
+                     index=regions.index)
+
+
+def _read_tsv(path, columns):
+    dtypes = {column: str for column in columns}
+    if 'Region' in columns:
+        dtypes['Region'] = 'category'
+    metadata = pd.read_csv(path, sep='\t', usecols=list(columns), dtype=dtypes)
+    metadata = metadata[list(columns)]
+    if 'date' in columns:
+        add_date_columns(metadata)
+    if 'Region' in columns:
+        metadata['broad_region'] = broad_regions(metadata['Region'])
+    return metadata
+
+
+def _frame_to_arrays(metadata):
+    # Each column becomes a few arrays: floats as-is, categoricals as codes plus
+    # packed categories, strings as a packed buffer plus a missing-value mask
+    arrays = {'columns': np.array(list(metadata.columns))}
+    for column in metadata.columns:
+        values = metadata[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            arrays[f'{column}.codes'] = values.cat.codes.to_numpy()
+            arrays[f'{column}.categories'] = pack_strings([str(c) for c in values.cat.categories])
+            arrays[f'{column}.n_categories'] = np.array(len(values.cat.categories))
+            arrays[f'{column}.ordered'] = np.array(values.cat.ordered)
+        elif pd.api.types.is_float_dtype(values.dtype):
+            arrays[f'{column}.values'] = values.to_numpy()
+        else:
+            arrays[f'{column}.missing'] = values.isna().to_numpy()
+            arrays[f'{column}.strings'] = pack_strings(values.fillna('').astype(str).tolist())
+    return arrays
+
+
+def _arrays_to_frame(arrays):
+    data = {}
+    for column in arrays['columns']:
+        column = str(column)
+        if f'{column}.codes' in arrays:
+            categories = unpack_strings(arrays[f'{column}.categories'], int(arrays[f'{column}.n_categories']))
+            data[column] = pd.Categorical.from_codes(arrays[f'{column}.codes'], categories=categories,
+                                                     ordered=bool(arrays[f'{column}.ordered']))
+        elif f'{column}.values' in arrays:
+            data[column] = arrays[f'{column}.values']
+        else:
+            missing = arrays[f'{column}.missing']
+            strings = np.array(unpack_strings(arrays[f'{column}.strings'], len(missing)), dtype=object)
+            strings[missing] = np.nan
+            data[column] = strings
+    return pd.DataFrame(data)
+
+
+def _entry_path(cache_dir, digest, columns):
+    key = hashlib.sha256('\t'.join(columns).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(cache_subdir(cache_dir, 'metadata'), f'{digest}-{key}-v{CACHE_VERSION}.npz')
+
+
+def load_metadata(path, columns=DEFAULT_COLUMNS, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES,
+                  use_cache=True, verbose=False):
+    """Load the metadata TSV with only `columns`, plus derived date and region columns.
+
+    `Region` and `broad_region` are categoricals; `date_precision` is an
+    ordered categorical of 'year', 'month' or 'day'. With `use_cache` the result is read
+    from (or written to) the columnar cache.
+    """
+    columns = tuple(columns)
+    if not use_cache:
+        return _read_tsv(path, columns)
+
+    entry = _entry_path(cache_dir, file_digest(path), columns)
+    if os.path.exists(entry):
+        try:
+            with np.load(entry) as data:
+                metadata = _arrays_to_frame({name: data[name] for name in data.files})
+            os.utime(entry)
+            if verbose:
+                print(f"Loaded {path} from metadata cache ({len(metadata)} rows)")
+            return metadata
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            os.remove(entry)
+
+    metadata = _read_tsv(path, columns)
+    save_arrays(entry, _frame_to_arrays(metadata))
+    evict(cache_dir, max_bytes, kind='metadata')
+    if verbose:
+        print(f"Parsed {path} and cached it ({len(metadata)} rows)")
+    return metadata
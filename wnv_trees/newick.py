@@ -0,0 +1,181 @@
+"""Streaming Newick parser that builds flat arrays instead of baltic objects.
+
+`bt.loadNewick` reads the whole file into one string and builds an object
+per node before anything else can run. `read_newick` instead tokenizes the
+file in fixed-size chunks (or straight from a memory map) and appends each
+node to growing typed arrays as it is read: parent index, branch length,
+whether it is a tip, and the tip names in a single NUL-separated byte
+buffer. Apart from those outputs, memory use is bounded by the chunk size
+and the depth of the tree.
+
+Nodes come out in file pre-order, which is what `ArrayTree` expects; unlike
+`loadNewick` the children are not re-sorted. Internal node labels and
+bracketed comments (e.g. BEAST `[&...]` annotations) are skipped.
+"""
+import mmap
+import os
+import re
+import time
+from array import array
+
+import numpy as np
+
+from wnv_trees.arraytree import ArrayTree
+from wnv_trees.tree_cache import unpack_strings
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+# Comments and quoted names may be cut off by the end of a chunk, so they also
+# match up to the end of the buffer; a match touching the end is carried over
+_TOKEN = re.compile(rb"\[[^\]]*(?:\]|$)|'(?:[^']|'')*(?:'|$)|[(),:;]|[^(),:;\[\]'\s]+")
+
+
+class NewickError(ValueError):
+    """Raised for malformed Newick input."""
+
+
+class _Builder:
+    """Parser state: the output arrays plus the stack of open clades."""
+
+    def __init__(self):
+        self.parent = array('i')
+        self.length = array('d')
+        self.is_leaf = array('b')
+        self.names = bytearray()
+        self.stack = []
+        self.last = -1            # node a following ':' or label applies to
+        self.after_close = False  # a name right after ')' is an internal label
+        self.expect_length = False
+        self.done = False
+
+    def _add(self, leaf, name=b''):
+        self.parent.append(self.stack[-1] if self.stack else -1)
+        self.length.append(np.nan)
+        self.is_leaf.append(leaf)
+        self.names += name
+        self.names.append(0)
+        return len(self.parent) - 1
+
+    def feed(self, token):
+        if self.done:
+            return
+        first = token[:1]
+        if first == b'[':
+            return
+        if self.expect_length:
+            self.expect_length = False
+            try:
+                self.length[self.last] = float(token)
+            except ValueError:
+                raise NewickError(f'Expected a branch length, got {token[:40]!r}') from None
+            return
+        if first == b'(':
+            node = self._add(False)
+            self.stack.append(node)
+            self.after_close = False
+        elif first == b')':
+            if not self.stack:
+                raise NewickError('Unbalanced parentheses')
+            self.last = self.stack.pop()
+            self.after_close = True
+        elif first == b',':
+            self.after_close = False
+        elif first == b':':
+            if self.last < 0:
+                raise NewickError('Branch length without a branch')
+            self.expect_length = True
+        elif first == b';':
+            if self.stack:
+                raise NewickError('Unbalanced parentheses')
+            self.done = True
+        elif self.after_close:
+            self.after_close = False  # internal node label
+        else:
+            if first == b"'":
+                token = token[1:-1].replace(b"''", b"'")
+            self.last = self._add(True, token.strip(b'"'))
+
+    def arrays(self):
+        if not self.parent:
+            raise NewickError('No tree found')
+        if not self.done or self.stack:
+            raise NewickError('Tree is not terminated with ;')
+        names = np.frombuffer(bytes(self.names[:-1]), dtype=np.uint8)
+        return {
+            'parent': np.frombuffer(self.parent, dtype=np.int32).copy(),
+            'length': np.frombuffer(self.length, dtype=float).copy(),
+            'is_leaf': np.frombuffer(self.is_leaf, dtype=np.int8).astype(bool),
+            'names': names,
+        }
+
+
+def _tokens(buffer, final):
+    """Yield complete tokens from `buffer`, then the offset of any unfinished tail."""
+    end = len(buffer)
+    for match in _TOKEN.finditer(buffer):
+        if not final and match.end() == end:
+            yield match.start()
+            return
+        yield match.group()
+    yield end
+
+
+def read_newick(path, chunk_size=DEFAULT_CHUNK_SIZE, use_mmap=False, verbose=False):
+    """Parse the first tree in a Newick file into flat arrays.
+
+    Returns a dict with 'parent' (int32, -1 for the root), 'length'
+    (float, NaN where absent), 'is_leaf' (bool) and 'names' (the
+    `pack_strings` buffer of every node's name, '' for internal nodes), plus
+    'stats' with the bytes read, node count, elapsed seconds and throughput.
+    With `use_mmap` the file is tokenized straight from a memory map rather
+    than read in `chunk_size` pieces.
+    """
+    start = time.perf_counter()
+    builder = _Builder()
+    size = os.path.getsize(path)
+
+    with open(path, 'rb') as handle:
+        if use_mmap and size:
+            with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for token in _tokens(mapped, final=True):
+                    if isinstance(token, int):
+                        break
+                    builder.feed(token)
+        else:
+            carry = b''
+            while not builder.done:
+                chunk = handle.read(chunk_size)
+                final = not chunk
+                buffer = carry + chunk
+                carry = b''
+                for token in _tokens(buffer, final):
+                    if isinstance(token, int):
+                        carry = buffer[token:]
+                        break
+                    builder.feed(token)
+                if final:
+                    break
+
+    arrays = builder.arrays()
+    elapsed = time.perf_counter() - start
+    n = len(arrays['parent'])
+    arrays['stats'] = {
+        'bytes': size,
+        'nodes': n,
+        'tips': int(arrays['is_leaf'].sum()),
+        'elapsed': elapsed,
+        'mb_per_s': size / 1e6 / max(elapsed, 1e-9),
+        'nodes_per_s': n / max(elapsed, 1e-9),
+    }
+    if verbose:
+        stats = arrays['stats']
+        print(f"Parsed {stats['nodes']} nodes ({stats['tips']} tips) from {path} in {elapsed:.3f}s "
+              f"({stats['mb_per_s']:.1f} MB/s, {stats['nodes_per_s']:,.0f} nodes/s)")
+    return arrays
+
+
+def load_array_tree(path, chunk_size=DEFAULT_CHUNK_SIZE, use_mmap=False, verbose=False):
+    """Parse a Newick file straight into an `ArrayTree`, without baltic objects."""
+    arrays = read_newick(path, chunk_size=chunk_size, use_mmap=use_mmap, verbose=verbose)
+    names = unpack_strings(arrays['names'], len(arrays['parent']))
+    return ArrayTree(arrays['parent'], arrays['length'], names, is_leaf=arrays['is_leaf'])
@@ -0,0 +1,194 @@
+"""Load the tree and metadata once and share them between figures.
+
+Every figure script repeats the same setup: load the tree, load the metadata,
+build strain lookups and date the tree. A `Pipeline` does each of those steps
+at most once, the first time a figure asks for it, and records how long every
+stage took so a batch run can report where its time went.
+"""
+import time
+from contextlib import contextmanager
+
+from wnv_trees.ancestral import reconstruct_tree
+from wnv_trees.clades import COLUMNS, clade_counts, trait_counts
+from wnv_trees.clock import set_clock_times
+from wnv_trees.dating import set_node_times
+from wnv_trees.distances import DistanceIndex
+from wnv_trees.lca import LCAIndex
+from wnv_trees.metadata import load_metadata
+from wnv_trees.profiling import Profiler, object_counts
+from wnv_trees.tipindex import TipIndex
+from wnv_trees.tree_cache import load_tree
+
+NE_REGIONS = ['NE_Central', 'NE_West', 'NE_East']
+NE_YEAR = 2023
+DATING_METHODS = ('heuristic', 'clock')
+
+
+class Pipeline:
+    """Lazily loaded, shared state for rendering several figures in one process.
+
+    `tree_path` is the time tree used by the time-axis figures and
+    `divergence_tree_path` the tree drawn on its own divergence axis (the
+    UNMC-only figure). Each attribute is built on first access and reused
+    afterwards; the time spent building it is added to `timings`.
+
+    `collapse` is the minimum size of background clades the highlight
+    figures draw as wedges (see `wnv_trees.collapse`), or None to draw every
+    branch. `rasterize` is the resolution (DPI) at which their dense
+    background layers are rasterized in PDF and SVG output, or None to keep
+    everything as vectors. `dating` picks how the time tree is dated:
+    'heuristic' (`set_node_times`, each node just before its earliest child)
+    or 'clock' (a least-squares strict clock, see `wnv_trees.clock`).
+    `profiler` records a `wnv_trees.profiling` span
+    for every stage; by default it is configured from `WNV_TREES_PROFILE`
+    and does nothing.
+    """
+
+    def __init__(self, tree_path, metadata_path, divergence_tree_path=None, cache_dir=None,
+                 use_cache=True, verbose=False, collapse=None, rasterize=None,
+                 dating='heuristic', profiler=None):
+        if dating not in DATING_METHODS:
+            raise ValueError(f"dating must be one of {', '.join(DATING_METHODS)}")
+        self.tree_path = tree_path
+        self.metadata_path = metadata_path
+        self.divergence_tree_path = divergence_tree_path
+        self.cache_dir = cache_dir
+        self.use_cache = use_cache
+        self.verbose = verbose
+        self.collapse = collapse
+        self.rasterize = rasterize
+        self.dating = dating
+        self.profiler = Profiler.from_env() if profiler is None else profiler
+        self.timings = {}
+        self._values = {}
+        self._nested = []
+
+    @contextmanager
+    def stage(self, name):
+        """Time the body of the `with` block and add it to `timings[name]`.
+
+        Time spent in stages nested inside this one (e.g. the tree loading a
+        figure triggers) is counted only under the nested stage.
+        """
+        self._nested.append(0.0)
+        start = time.perf_counter()
+        try:
+            with self.profiler.span(name):
+                yield
+        finally:
+            elapsed = time.perf_counter() - start
+            own = elapsed - self._nested.pop()
+            if self._nested:
+                self._nested[-1] += elapsed
+            self.timings[name] = self.timings.get(name, 0.0) + own
+
+    def _get(self, name, build):
+        if name not in self._values:
+            with self.stage(name):
+                self._values[name] = build()
+                self.profiler.annotate(**object_counts(self._values[name]))
+        return self._values[name]
+
+    def reset(self, *names):
+        """Forget the values built by stages `names` so the next access rebuilds them."""
+        for name in names:
+            self._values.pop(name, None)
+
+    @property
+    def metadata(self):
+        """The metadata table from `load_metadata`."""
+        return self._get('load metadata', lambda: load_metadata(
+            self.metadata_path, cache_dir=self.cache_dir, use_cache=self.use_cache,
+            verbose=self.verbose))
+
+    @property
+    def strains(self):
+        """Per-strain lookups shared by the figures.
+
+        A dict with 'region', 'broad_region' and 'decimal_year' maps keyed by
+        strain, plus 'ne_2023', mapping each Nebraska sample from NE_YEAR to
+        its NE_* region.
+        """
+        metadata = self.metadata
+
+        def build():
+            strain = metadata['strain']
+            ne = metadata['Region'].isin(NE_REGIONS) & (metadata['year'] == NE_YEAR)
+            self.profiler.annotate(strains=len(strain), ne_2023=int(ne.sum()))
+            return {
+                'region': dict(zip(strain, metadata['Region'])),
+                'broad_region': dict(zip(strain, metadata['broad_region'])),
+                'decimal_year': dict(zip(strain, metadata['decimal_year'])),
+                'ne_2023': dict(zip(strain[ne], metadata.loc[ne, 'Region'].astype(str))),
+            }
+        return self._get('annotate', build)
+
+    @property
+    def tree(self):
+        """The time tree, laid out by baltic and dated by the `dating` method."""
+        tree = self._get('load tree', lambda: load_tree(
+            self.tree_path, cache_dir=self.cache_dir, use_cache=self.use_cache, verbose=self.verbose))
+        strains = self.strains
+        if self.dating == 'clock':
+            date = lambda: set_clock_times(tree, self.metadata, verbose=self.verbose)
+        else:
+            date = lambda: set_node_times(tree, strains['decimal_year'], verbose=self.verbose)
+        self._get('date tree', date)
+        return tree
+
+    @property
+    def divergence_tree(self):
+        """The tree drawn against divergence, laid out by baltic and not dated."""
+        if self.divergence_tree_path is None:
+            raise ValueError('This figure needs a divergence tree; pass divergence_tree_path')
+        return self._get('load divergence tree', lambda: load_tree(
+            self.divergence_tree_path, cache_dir=self.cache_dir, use_cache=self.use_cache,
+            verbose=self.verbose))
+
+    def tip_index(self, tree='tree'):
+        """A `TipIndex` of the leaves of `tree` ('tree' or 'divergence_tree'), built once."""
+        return self._get(f'index {tree}', lambda: TipIndex.from_tree(getattr(self, tree)))
+
+    def lca_index(self, tree='tree'):
+        """An `LCAIndex` for MRCA and clade queries on `tree`, built once."""
+        return self._get(f'lca index {tree}', lambda: LCAIndex.from_tree(getattr(self, tree)))
+
+    def distance_index(self, tree='tree'):
+        """A `DistanceIndex` for patristic distances on `tree`, sharing `lca_index(tree)`."""
+        return self._get(f'distance index {tree}', lambda: DistanceIndex(self.lca_index(tree)))
+
+    def clade_counts(self, columns=COLUMNS, tree='tree'):
+        """Per-clade category counts of metadata `columns` on `tree` (see `wnv_trees.clades`).
+
+        Node indices are those of `lca_index(tree)`, so its MRCA queries can
+        pick the rows. Built once per tree and set of columns.
+        """
+        columns = tuple(columns)
+        return self._get(f"clade counts {tree} {','.join(columns)}", lambda: trait_counts(
+            self.lca_index(tree).atree, self.metadata, columns))
+
+    def ne_2023_counts(self):
+        """Per-clade counts of the Nebraska NE_YEAR samples by NE region, on `lca_index()`'s nodes."""
+        def build():
+            atree = self.lca_index().atree
+            ne_2023 = self.strains['ne_2023']
+            regions = [ne_2023.get(name) for name in atree.names[atree.tips]]
+            return clade_counts(atree, regions, NE_REGIONS)
+        return self._get('clade counts ne_2023', build)
+
+    def ancestral(self, column, method='mk'):
+        """Reconstruct metadata `column` over the time tree, once.
+
+        See `wnv_trees.ancestral.reconstruct_tree`; returns its result. The
+        states are not stored on the shared tree's nodes.
+        """
+        tree = self.tree
+        return self._get(f'ancestral {column} {method}', lambda: reconstruct_tree(
+            tree, self.metadata, column, method=method))
+
+    def timing_report(self):
+        """Return the stage timings as printable lines, in the order the stages first ran."""
+        width = max([len(name) for name in self.timings] + [len('total')])
+        lines = [f"{name:<{width}}  {seconds:8.3f}s" for name, seconds in self.timings.items()]
+        lines.append(f"{'total':<{width}}  {sum(self.timings.values()):8.3f}s")
+        return lines
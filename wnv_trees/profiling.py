@@ -0,0 +1,179 @@
+"""Opt-in per-stage profiling: wall and CPU time, memory and object counts.
+
+`Pipeline.stage` and the figure renderer open a `Profiler.span` around each
+stage. When profiling is off (the default) a span is a shared no-op context
+manager, so the hooks cost next to nothing. When it is on, each span records
+wall-clock and CPU time, resident memory before and after, the process's
+peak RSS and, with `trace_memory`, the tracemalloc allocation delta and peak.
+Stages attach object counts (tree nodes, metadata rows, strains, matplotlib
+artists) with `annotate`.
+
+Turn it on with `wnv-trees render --profile` or the environment variable
+`WNV_TREES_PROFILE=1` (`=memory` also traces allocations). Records can be
+printed as a table or written as JSON or as a Chrome trace that
+chrome://tracing or https://ui.perfetto.dev can open.
+"""
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ENV_VAR = 'WNV_TREES_PROFILE'
+FORMATS = ('json', 'chrome')
+
+_DISABLED = nullcontext()
+
+
+def current_rss():
+    """Resident set size of this process in bytes, or None where unknown."""
+    try:
+        with open('/proc/self/statm') as handle:
+            return int(handle.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes, or None where unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def object_counts(value):
+    """Size counts worth recording for a stage's result: tree nodes or table rows."""
+    if hasattr(value, 'Objects'):
+        return {'nodes': len(value.Objects)}
+    if hasattr(value, 'shape'):
+        return {'rows': value.shape[0]}
+    return {}
+
+
+def count_artists(fig):
+    """Number of artists in a matplotlib figure, including ticks and text."""
+    return len(fig.findobj())
+
+
+def _mb(value):
+    return None if value is None else value / 1e6
+
+
+class Profiler:
+    """Collects one record per span; does nothing unless `enabled`.
+
+    Records are dicts with 'name', 'pid', 'depth', 'start' (Unix time),
+    'wall' and 'cpu' (seconds), 'rss_before', 'rss_after' and 'peak_rss'
+    (bytes), 'alloc' and 'alloc_peak' (bytes, only with `trace_memory`) and
+    'counts'.
+    """
+
+    def __init__(self, enabled=False, trace_memory=False):
+        self.enabled = enabled
+        self.trace_memory = enabled and trace_memory
+        self.records = []
+        self._open = []
+
+    @classmethod
+    def from_env(cls):
+        """A profiler configured by `WNV_TREES_PROFILE` ('1'/'on', 'memory', or unset/'0')."""
+        value = os.environ.get(ENV_VAR, '').strip().lower()
+        if value in ('', '0', 'off', 'false', 'no'):
+            return cls()
+        return cls(enabled=True, trace_memory=value == 'memory')
+
+    def span(self, name):
+        """Context manager that records the enclosed block as stage `name`."""
+        if not self.enabled:
+            return _DISABLED
+        return self._span(name)
+
+    @contextmanager
+    def _span(self, name):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        record = {'name': name, 'pid': os.getpid(), 'depth': len(self._open), 'start': time.time(),
+                  'rss_before': current_rss(), 'counts': {}}
+        if self.trace_memory:
+            # Fold the enclosing span's peak so far in before resetting it
+            traced, peak = tracemalloc.get_traced_memory()
+            if self._open:
+                self._open[-1]['_peak'] = max(self._open[-1].get('_peak', 0), peak)
+            tracemalloc.reset_peak()
+            record['_traced'] = traced
+        self._open.append(record)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall'] = time.perf_counter() - wall
+            record['cpu'] = time.process_time() - cpu
+            self._open.pop()
+            record['rss_after'] = current_rss()
+            record['peak_rss'] = peak_rss()
+            if self.trace_memory:
+                traced, peak = tracemalloc.get_traced_memory()
+                peak = max(record.pop('_peak', 0), peak)
+                start = record.pop('_traced')
+                record['alloc'] = traced - start
+                record['alloc_peak'] = peak - start
+                if self._open:
+                    self._open[-1]['_peak'] = max(self._open[-1].get('_peak', 0), peak)
+            self.records.append(record)
+
+    def annotate(self, **counts):
+        """Add object counts to the innermost open span."""
+        if self.enabled and self._open:
+            self._open[-1]['counts'].update(counts)
+
+    def drain(self):
+        """Return the finished records and forget them (for shipping out of a worker)."""
+        records, self.records = self.records, []
+        return records
+
+    def report(self):
+        """Return the records as printable table lines, in the order the spans finished."""
+        if not self.records:
+            return []
+        width = max(len('  ' * record['depth'] + record['name']) for record in self.records)
+        width = max(width, len('stage'))
+        lines = [f"{'stage':<{width}} {'pid':>7} {'wall s':>8} {'cpu s':>8} {'rss MB':>8} "
+                 f"{'+rss MB':>8} {'alloc MB':>9} {'peak MB':>8}  counts"]
+        for record in self.records:
+            name = '  ' * record['depth'] + record['name']
+            rss = _mb(record['rss_after'])
+            grown = None if rss is None or record['rss_before'] is None else rss - _mb(record['rss_before'])
+            cells = [rss, grown, _mb(record.get('alloc')), _mb(record.get('alloc_peak'))]
+            rss_text, grown_text, alloc_text, peak_text = ['-' if value is None else f'{value:.1f}'
+                                                           for value in cells]
+            counts = ', '.join(f'{key}={value}' for key, value in record['counts'].items())
+            lines.append(f"{name:<{width}} {record['pid']:>7} {record['wall']:8.3f} {record['cpu']:8.3f} "
+                         f"{rss_text:>8} {grown_text:>8} {alloc_text:>9} {peak_text:>8}  {counts}")
+        return lines
+
+    def write(self, path, fmt='json'):
+        """Write the records to `path` as 'json' or as a 'chrome' trace."""
+        if fmt not in FORMATS:
+            raise ValueError(f"fmt must be one of {', '.join(FORMATS)}")
+        if fmt == 'json':
+            payload = {'trace_memory': self.trace_memory, 'records': self.records}
+        else:
+            events = []
+            for record in self.records:
+                args = {key: value for key, value in record.items()
+                        if key not in ('name', 'pid', 'start', 'wall', 'depth', 'counts')}
+                args.update(record['counts'])
+                events.append({'name': record['name'], 'ph': 'X', 'pid': record['pid'], 'tid': 0,
+                               'ts': record['start'] * 1e6, 'dur': record['wall'] * 1e6, 'args': args})
+            payload = {'traceEvents': events, 'displayTimeUnit': 'ms'}
+        with open(path, 'w') as handle:
+            json.dump(payload, handle, indent=1)
+        return path
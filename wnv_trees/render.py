@@ -0,0 +1,245 @@
+"""Batched matplotlib drawing for baltic trees.
+
+Drawing one `ax.plot` per branch or one `ax.scatter` per tip creates an
+artist for every element, which makes building and saving big figures very
+slow. These helpers collect everything into numpy arrays and add a handful of
+LineCollections and scatter collections instead.
+"""
+import numpy as np
+import matplotlib.colors as mcolors
+from matplotlib.collections import LineCollection
+
+
+def _to_rgba(colours, alphas):
+    """Convert a list of colours to an (n, 4) RGBA array, overriding alpha."""
+    if isinstance(colours, np.ndarray) and colours.ndim == 2 and colours.shape[1] == 4:
+        # Already RGBA (e.g. from `traits.style_tips`)
+        rgba = colours.astype(float)
+    else:
+        cache = {}
+        rgba = np.empty((len(colours), 4))
+        for i, colour in enumerate(colours):
+            key = colour if isinstance(colour, str) else tuple(colour)
+            if key not in cache:
+                cache[key] = mcolors.to_rgba(colour)
+            rgba[i] = cache[key]
+    alphas = np.broadcast_to(np.asarray(alphas, dtype=object), (len(colours),))
+    # 'none' stays fully transparent whatever alpha is requested
+    has_alpha = np.array([a is not None for a in alphas], dtype=bool) & (rgba[:, 3] > 0)
+    rgba[has_alpha, 3] = alphas[has_alpha].astype(float)
+    return rgba
+
+
+def _styles(nodes, value):
+    if callable(value):
+        return [value(node) for node in nodes]
+    return [value] * len(nodes)
+
+
+def add_segments(ax, segments, colours, widths, alphas, zorders, rasterized=False, **kwargs):
+    """Add (n, 2, 2) `segments` to `ax` as one LineCollection per zorder.
+
+    Colour, width and alpha vary per segment inside a collection; only the
+    zorder, and whether the segments are `rasterized` in vector output, need
+    their own artist. Returns the list of collections added.
+    """
+    segments = np.asarray(segments, dtype=float).reshape(-1, 2, 2)
+    rgba = _to_rgba(colours, alphas)
+    widths = np.broadcast_to(np.asarray(widths, dtype=float), (len(segments),))
+    zorders = np.broadcast_to(np.asarray(zorders, dtype=float), (len(segments),))
+    rasterized = np.broadcast_to(np.asarray(rasterized, dtype=bool), (len(segments),))
+    kwargs.setdefault('capstyle', 'projecting')
+
+    collections = []
+    for zorder in np.unique(zorders):
+        for raster in (False, True):
+            mask = (zorders == zorder) & (rasterized == raster)
+            if not mask.any():
+                continue
+            collection = LineCollection(segments[mask], colors=rgba[mask], linewidths=widths[mask],
+                                        zorder=float(zorder), rasterized=raster, **kwargs)
+            ax.add_collection(collection)
+            collections.append(collection)
+    return collections
+
+
+def draw_branches(ax, tree, x_attr=None, y_attr=None, colour='#CCCCCC', width=2,
+                  alpha=0.8, zorder=10, connector_colour=None, connector_zorder=None,
+                  nodes=None, rasterized=False, **kwargs):
+    """Draw every branch of `tree` with a few LineCollections.
+
+    Each branch gets a horizontal segment from its parent's x to its own x, and
+    every node with more than one child gets a single vertical connector
+    spanning its children. `colour`, `width`, `alpha`, `zorder` and
+    `rasterized` (draw as an image in vector output) may be constants or
+    functions of a node. Connectors are styled by calling the
+    same functions on the parent node, unless `connector_colour` or
+    `connector_zorder` are given (connectors default to `zorder - 1`).
+    `nodes` restricts drawing to a subset of `tree.Objects` (e.g. the visible
+    part of a collapsed tree); connectors are only drawn to drawn children.
+
+    Returns the list of LineCollections that were added to `ax`.
+    """
+    if x_attr is None:
+        x_attr = lambda k: k.x
+    if y_attr is None:
+        y_attr = lambda k: k.y
+    if connector_colour is None:
+        connector_colour = colour
+    if connector_zorder is None:
+        connector_zorder = (lambda k: zorder(k) - 1) if callable(zorder) else zorder - 1
+
+    if nodes is None:
+        nodes = tree.Objects
+        drawn = None
+    else:
+        drawn = {id(k) for k in nodes}
+
+    # Horizontal branches: everything except the root, which has no parent branch
+    branches = [k for k in nodes if k.parent is not None and k is not tree.root]
+    horizontal = np.empty((len(branches), 2, 2))
+    for i, k in enumerate(branches):
+        y = y_attr(k)
+        horizontal[i] = ((x_attr(k.parent), y), (x_attr(k), y))
+
+    # Vertical connectors: once per parent, spanning its lowest to highest child
+    parents = [k for k in nodes if k.branchType != 'leaf' and len(k.children) > 1
+               and (drawn is None or id(k.children[0]) in drawn)]
+    vertical = np.empty((len(parents), 2, 2))
+    for i, k in enumerate(parents):
+        child_ys = [y_attr(child) for child in k.children]
+        x = x_attr(k)
+        vertical[i] = ((x, min(child_ys)), (x, max(child_ys)))
+
+    collections = add_segments(ax, horizontal, _styles(branches, colour), _styles(branches, width),
+                               _styles(branches, alpha), _styles(branches, zorder),
+                               _styles(branches, rasterized), **kwargs)
+    collections += add_segments(ax, vertical, _styles(parents, connector_colour),
+                                _styles(parents, width), _styles(parents, alpha),
+                                _styles(parents, connector_zorder), _styles(parents, rasterized),
+                                **kwargs)
+    ax.autoscale_view()
+    return collections
+
+
+def _node_styles(value, nodes):
+    # A scalar, or a node-aligned array indexed down to `nodes`
+    if np.ndim(value) == 0:
+        return [value] * len(nodes)
+    return np.asarray(value, dtype=object)[nodes]
+
+
+def draw_array_branches(ax, atree, x=None, y=None, colour='#CCCCCC', width=2, alpha=0.8,
+                        zorder=10, connector_colour=None, connector_zorder=None, **kwargs):
+    """`draw_branches` for an `ArrayTree`, building the segments with numpy.
+
+    `x` and `y` default to `atree.x` and `atree.y`. Styles are scalars or
+    arrays with one entry per node; connectors take their parent's entry.
+    """
+    x = atree.x if x is None else np.asarray(x, dtype=float)
+    y = atree.y if y is None else np.asarray(y, dtype=float)
+    if connector_colour is None:
+        connector_colour = colour
+    if connector_zorder is None:
+        connector_zorder = np.asarray(zorder) - 1
+
+    branches = np.flatnonzero(atree.parent >= 0)
+    parents = atree.parent[branches]
+    horizontal = np.stack([np.column_stack([x[parents], y[branches]]),
+                           np.column_stack([x[branches], y[branches]])], axis=1)
+
+    low = np.full(len(atree), np.inf)
+    high = np.full(len(atree), -np.inf)
+    np.minimum.at(low, parents, y[branches])
+    np.maximum.at(high, parents, y[branches])
+    counts = np.bincount(parents, minlength=len(atree))
+    joins = np.flatnonzero(counts > 1)
+    vertical = np.stack([np.column_stack([x[joins], low[joins]]),
+                         np.column_stack([x[joins], high[joins]])], axis=1)
+
+    collections = add_segments(ax, horizontal, _node_styles(colour, branches), _node_styles(width, branches),
+                               _node_styles(alpha, branches), _node_styles(zorder, branches), **kwargs)
+    collections += add_segments(ax, vertical, _node_styles(connector_colour, joins),
+                                _node_styles(width, joins), _node_styles(alpha, joins),
+                                _node_styles(connector_zorder, joins), **kwargs)
+    ax.autoscale_view()
+    return collections
+
+
+def draw_tips(ax, x, y, colours, sizes, edgecolors='none', linewidths=0.0, alphas=None,
+              zorders=20001, rasterized=False, **kwargs):
+    """Draw tip markers from arrays with one scatter collection per zorder.
+
+    `colours` and `edgecolors` are single colours or one per tip (a list or
+    an (n, 4) RGBA array), `sizes`, `linewidths`, `alphas`, `zorders` and
+    `rasterized` scalars or arrays. Alpha is applied to both face and edge
+    colours, as with `ax.scatter(..., alpha=...)`. Returns the list of
+    collections added to `ax`.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if isinstance(colours, str):
+        colours = [colours] * n
+    if isinstance(edgecolors, str):
+        edgecolors = [edgecolors] * n
+    facecolours = _to_rgba(colours, alphas)
+    edgecolours = _to_rgba(edgecolors, alphas)
+    sizes = np.broadcast_to(np.asarray(sizes, dtype=float), (n,))
+    linewidths = np.broadcast_to(np.asarray(linewidths, dtype=float), (n,))
+    zorders = np.broadcast_to(np.asarray(zorders, dtype=float), (n,))
+    rasterized = np.broadcast_to(np.asarray(rasterized, dtype=bool), (n,))
+
+    collections = []
+    for zorder in np.unique(zorders):
+        for raster in (False, True):
+            mask = (zorders == zorder) & (rasterized == raster)
+            if not mask.any():
+                continue
+            collection = ax.scatter(x[mask], y[mask], s=sizes[mask], c=facecolours[mask],
+                                    edgecolors=edgecolours[mask], linewidths=linewidths[mask],
+                                    zorder=float(zorder), rasterized=raster, **kwargs)
+            collections.append(collection)
+    return collections
+
+
+def draw_tip_classes(ax, tree, classify, styles, x_attr=None, y_attr=None, nodes=None, **kwargs):
+    """Draw the tips of `tree` with one scatter collection per style class.
+
+    `classify` maps a leaf to a class name and `styles` maps each class name
+    to a dict with any of 'colour', 'size', 'edgecolor', 'linewidth', 'alpha',
+    'zorder' and 'rasterized'. A 'colour' can be a function of the leaf when
+    the class mixes colours (e.g. regional colours). `nodes` restricts drawing to the tips
+    among a subset of `tree.Objects`. Returns a dict of class name to the
+    number of tips drawn.
+    """
+    if x_attr is None:
+        x_attr = lambda k: k.x
+    if y_attr is None:
+        y_attr = lambda k: k.y
+
+    members = {name: [] for name in styles}
+    for k in (tree.Objects if nodes is None else nodes):
+        if k.branchType == 'leaf':
+            members[classify(k)].append(k)
+
+    counts = {}
+    for name, tips in members.items():
+        counts[name] = len(tips)
+        if not tips:
+            continue
+        style = styles[name]
+        options = dict(kwargs)
+        if 'rasterized' in style:
+            options['rasterized'] = style['rasterized']
+        draw_tips(ax,
+                  [x_attr(k) for k in tips],
+                  [y_attr(k) for k in tips],
+                  _styles(tips, style.get('colour', '#BBBBBB')),
+                  style.get('size', 40),
+                  edgecolors=style.get('edgecolor', 'none'),
+                  linewidths=style.get('linewidth', 0.0),
+                  alphas=style.get('alpha'),
+                  zorders=style.get('zorder', 20001),
+                  **options)
+    return counts
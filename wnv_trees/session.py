@@ -0,0 +1,211 @@
+"""A persistent figure that re-renders only what a metadata or highlight edit changes.
+
+The usual loop is editing the metadata TSV or a highlight list and running a
+script again, which reloads, re-dates and re-lays-out a tree that has not
+changed and redraws every branch. A `RenderSession` keeps the pipeline (tree,
+node times, layout) and the figure with its branch collections alive. Each
+`update` works out what changed — the metadata file's contents, the tip
+rules (highlight membership, colour maps) or the default style — restyles
+the tips from arrays, patches only the tip collections holding a changed tip
+and rebuilds the legend only when the rules changed. Branches are redrawn only
+if new metadata moved a tip's date, since that re-dates the tree.
+"""
+import copy
+import os
+import time
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+from wnv_trees.figures import _divergence_axes, _time_axes
+from wnv_trees.render import draw_branches, draw_tips
+from wnv_trees.traits import annotate_tips
+from wnv_trees.tree_cache import file_digest
+
+STYLE_ARRAYS = ('rgba', 'edge_rgba', 'size', 'linewidth')
+
+
+def _legend_handles(ax, rules, default):
+    # One entry per category of a colour map, one per labelled rule, plus the default
+    handles = []
+    for rule in rules + [dict(default or {}, label=(default or {}).get('label', 'Other samples'))]:
+        common = {'s': min(rule.get('size', 40), 150), 'edgecolors': rule.get('edgecolor', 'none'),
+                  'linewidth': rule.get('linewidth', 0.0), 'alpha': rule.get('alpha')}
+        if 'colours' in rule:
+            for category, colour in rule['colours'].items():
+                handles.append(ax.scatter([], [], c=colour, label=str(category), **common))
+        elif 'label' in rule or 'name' in rule:
+            handles.append(ax.scatter([], [], c=rule.get('colour', '#BBBBBB'),
+                                      label=rule.get('label', rule.get('name')), **common))
+    return handles
+
+
+class RenderSession:
+    """One figure kept alive across edits to the metadata and the tip rules.
+
+    `rules` and `default` are `wnv_trees.traits` tip rules. `tree` is the
+    pipeline attribute to draw: 'tree' (the dated time tree, against time)
+    or 'divergence_tree' (against divergence). Draws on creation;
+    `update` and `save` then reuse the figure.
+    """
+
+    def __init__(self, pipeline, rules, default=None, tree='tree', title='', y_scale=1.0,
+                 figsize=(20, 10), legend_title='Samples'):
+        if tree not in ('tree', 'divergence_tree'):
+            raise ValueError("tree must be 'tree' or 'divergence_tree'")
+        self.pipeline = pipeline
+        self.tree_name = tree
+        self.title = title
+        self.y_scale = y_scale
+        self.figsize = figsize
+        self.legend_title = legend_title
+        self.rules = copy.deepcopy(list(rules))
+        self.default = copy.deepcopy(default)
+        self.fig = None
+        self.draw()
+
+    def _x(self, k):
+        return k.absoluteTime if self.tree_name == 'tree' else k.x
+
+    def _metadata_digest(self):
+        return file_digest(self.pipeline.metadata_path)
+
+    def _tip_dates(self):
+        decimal_year = self.pipeline.strains['decimal_year']
+        return np.array([decimal_year.get(name, np.nan) for name in self._names], dtype=float)
+
+    def draw(self):
+        """Draw the whole figure from scratch: axes, branches, tips and legend."""
+        with self.pipeline.stage('session draw'):
+            if self.fig is not None:
+                plt.close(self.fig)
+            tree = getattr(self.pipeline, self.tree_name)
+            self._digest = self._metadata_digest()
+            self._tips = [k for k in tree.Objects if k.branchType == 'leaf']
+            self._names = [k.name for k in self._tips]
+            self._dates = self._tip_dates() if self.tree_name == 'tree' else None
+
+            self.fig, self.ax = plt.subplots(figsize=self.figsize, facecolor='w')
+            y_attr = lambda k: k.y * self.y_scale
+            draw_branches(self.ax, tree, x_attr=self._x, y_attr=y_attr, colour='#CCCCCC', width=2,
+                          alpha=0.8, zorder=10)
+            self._x_tips = np.array([self._x(k) for k in self._tips], dtype=float)
+            self._y_tips = np.array([y_attr(k) for k in self._tips], dtype=float)
+            if self.tree_name == 'tree':
+                _time_axes(self.ax, tree, self.title, self.y_scale)
+            else:
+                _divergence_axes(self.ax, tree)
+                self.ax.set_title(self.title, fontsize=20, fontweight='bold', pad=20)
+
+            self._groups = {}
+            self._styles = None
+            self._restyle()
+            self._draw_legend()
+            self.fig.tight_layout()
+
+    def _restyle(self):
+        # Style the tips from the current rules and patch the tip collections
+        # (one per z-order/rasterization group); returns how many tips changed
+        styles = annotate_tips(self._names, self.pipeline.metadata, self.rules, self.default,
+                               verbose=self.pipeline.verbose)
+        keys = np.column_stack([styles['zorder'], styles['rasterized']])
+        old = self._styles
+        if old is None:
+            changed = np.ones(len(self._tips), dtype=bool)
+        else:
+            changed = (keys != np.column_stack([old['zorder'], old['rasterized']])).any(axis=1)
+            for name in STYLE_ARRAYS:
+                difference = styles[name] != old[name]
+                changed |= difference.any(axis=1) if difference.ndim == 2 else difference
+        self._styles = styles
+
+        groups = {}
+        for key in np.unique(keys, axis=0):
+            key = tuple(key)
+            indices = np.flatnonzero((keys == key).all(axis=1))
+            if key in self._groups:
+                old_indices, collection = self._groups.pop(key)
+                if np.array_equal(indices, old_indices) and not changed[indices].any():
+                    groups[key] = (indices, collection)
+                    continue
+                collection.set_offsets(np.column_stack([self._x_tips[indices], self._y_tips[indices]]))
+                collection.set_facecolor(styles['rgba'][indices])
+                collection.set_edgecolor(styles['edge_rgba'][indices])
+                collection.set_sizes(styles['size'][indices])
+                collection.set_linewidth(styles['linewidth'][indices])
+            else:
+                collection, = draw_tips(self.ax, self._x_tips[indices], self._y_tips[indices],
+                                        styles['rgba'][indices], styles['size'][indices],
+                                        edgecolors=styles['edge_rgba'][indices],
+                                        linewidths=styles['linewidth'][indices], zorders=key[0],
+                                        rasterized=bool(key[1]))
+            groups[key] = (indices, collection)
+        # Groups no tip belongs to any more
+        for _, collection in self._groups.values():
+            collection.remove()
+        self._groups = groups
+        return int(changed.sum())
+
+    def _draw_legend(self):
+        legend = self.ax.get_legend()
+        if legend is not None:
+            legend.remove()
+            # The empty scatters backing the old entries
+            for handle in self._handles:
+                handle.remove()
+        self._handles = _legend_handles(self.ax, self.rules, self.default)
+        self.ax.legend(handles=self._handles, loc='upper left',
+                       fontsize=16, title=self.legend_title, title_fontsize=18, frameon=True,
+                       fancybox=True, shadow=True, bbox_to_anchor=(0.02, 0.98))
+
+    def update(self, rules=None, default=None):
+        """Bring the figure up to date with the metadata file and new rules.
+
+        `rules`/`default` replace the current ones when given. Returns a dict
+        saying what changed ('metadata', 'dates', 'rules') and what was done:
+        'redrawn' (the whole figure, because tip dates moved), the number of
+        'tips_changed' and the 'elapsed' seconds.
+        """
+        start = time.perf_counter()
+        report = {'metadata': False, 'dates': False, 'rules': False, 'redrawn': False, 'tips_changed': 0}
+
+        digest = self._metadata_digest()
+        if digest != self._digest:
+            report['metadata'] = True
+            self._digest = digest
+            self.pipeline.reset('load metadata', 'annotate')
+            if self.tree_name == 'tree':
+                dates = self._tip_dates()
+                if not np.array_equal(dates, self._dates, equal_nan=True):
+                    report['dates'] = True
+                    self.pipeline.reset('date tree')
+
+        if rules is not None and rules != self.rules:
+            self.rules = copy.deepcopy(list(rules))
+            report['rules'] = True
+        if default is not None and default != self.default:
+            self.default = copy.deepcopy(default)
+            report['rules'] = True
+
+        if report['dates']:
+            self.draw()
+            report['redrawn'] = True
+            report['tips_changed'] = len(self._tips)
+        elif report['metadata'] or report['rules']:
+            with self.pipeline.stage('session update'):
+                report['tips_changed'] = self._restyle()
+                if report['rules']:
+                    self._draw_legend()
+        report['elapsed'] = time.perf_counter() - start
+        return report
+
+    def save(self, path, dpi=300):
+        """Save the current figure to `path`; returns the seconds it took."""
+        start = time.perf_counter()
+        with self.pipeline.stage(f'save {os.path.basename(path)}'):
+            self.fig.savefig(path, dpi=dpi, bbox_inches='tight')
+        return time.perf_counter() - start
+
+    def close(self):
+        plt.close(self.fig)
+        self.fig = None
@@ -0,0 +1,259 @@
+"""Root-to-tip regression and a temporal-signal report for finding clock outliers.
+
+Each tip's divergence from the root (the x axis of the divergence figure) is
+regressed on its sampling date. Tips far from the line are the usual
+suspects: mislabelled dates, contaminated or mis-assembled samples. `fit`
+does the regression, and with `reroot` it also searches every branch for
+the root position that maximises R², as TempEst does.
+
+Re-rooting is not done by re-rooting the tree once per candidate. The
+regression needs only six sums over the dated tips: n, Σt, Σt², Σd, Σd²
+and Σtd, where d is the distance to the root. For a root on the branch
+above node c, at distance s from c, those sums are the sums for the tips in
+c's clade with every d increased by s, plus the sums for the other tips
+with every d decreased by s. Clade sums come from one bottom-up pass and
+the complementary sums from one top-down pass. Each candidate's R² is then
+arithmetic on arrays, for every branch at once.
+"""
+import numpy as np
+import pandas as pd
+
+from wnv_trees.clock import root_to_tip, tip_dates
+from wnv_trees.lca import LCAIndex
+from wnv_trees.traits import join_tips
+
+# Columns of the per-node sums: n, Σt, Σt², Σd, Σd², Σtd
+N, T, TT, D, DD, TD = range(6)
+
+# Tips whose robust z-score of the residual exceeds this are flagged
+OUTLIER_Z = 3.0
+
+
+def _shift(sums, distance):
+    # The same tips' sums with every d increased by `distance`, which has the
+    # shape of sums[..., 0] or broadcasts with it
+    distance = np.asarray(distance, dtype=float)
+    shape = np.broadcast_shapes(sums.shape[:-1], distance.shape) + (6,)
+    sums = np.broadcast_to(sums, shape)
+    out = sums.copy()
+    out[..., D] = sums[..., D] + distance * sums[..., N]
+    out[..., DD] = sums[..., DD] + 2 * distance * sums[..., D] + distance ** 2 * sums[..., N]
+    out[..., TD] = sums[..., TD] + distance * sums[..., T]
+    return out
+
+
+def _lengths(atree):
+    # Branch lengths with missing ones and the root's own taken as zero
+    lengths = np.nan_to_num(atree.length)
+    lengths[atree.parent < 0] = 0.0
+    return lengths
+
+
+def _regression(sums):
+    # Slope, intercept and R² of d on t from the six sums (any leading shape)
+    n, t, tt, d, dd, td = (sums[..., i] for i in range(6))
+    sxx = n * tt - t ** 2
+    sxy = n * td - t * d
+    syy = n * dd - d ** 2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = sxy / sxx
+        intercept = (d - slope * t) / n
+        r2 = sxy ** 2 / (sxx * syy)
+    return slope, intercept, r2
+
+
+def clade_sums(atree, dates, lengths):
+    """Per-node sums over the dated tips of each clade, distances from that node.
+
+    Returns (inside, outside): (n_nodes, 6) arrays of n, Σt, Σt², Σd, Σd²
+    and Σtd for the tips in the node's clade and for all other tips, each
+    with d measured from the node.
+    """
+    n = len(atree)
+    dated = np.zeros(n, dtype=bool)
+    dated[atree.tips] = ~np.isnan(dates)
+    times = np.zeros(n)
+    times[atree.tips] = np.nan_to_num(dates)
+    inside = np.zeros((n, 6))
+    inside[dated, N] = 1.0
+    inside[dated, T] = times[dated]
+    inside[dated, TT] = times[dated] ** 2
+
+    parent = atree.parent
+    levels = atree.levels()
+    for level in reversed(levels[1:]):
+        np.add.at(inside, parent[level], _shift(inside[level], lengths[level]))
+    outside = np.zeros((n, 6))
+    for level in levels[1:]:
+        up = parent[level]
+        # Everything under the parent, seen from it, minus this clade
+        rest = inside[up] + outside[up] - _shift(inside[level], lengths[level])
+        outside[level] = _shift(rest, lengths[level])
+    return inside, outside
+
+
+def scan_roots(atree, dates, points=11, refine=201):
+    """R² of root-to-tip regression for a root at every point of every branch.
+
+    Each branch (named by its child node) is tried at `points` evenly
+    spaced positions. The best branch is then searched again with `refine`
+    positions between the neighbouring grid points. Only roots giving a
+    positive rate count. Returns a dict with 'node' and 'distance' (the best
+    root, `distance` above `node` on its branch), 'r2', 'rate',
+    'intercept', and 'branch_r2' (the best R² found on each branch, NaN for
+    the root).
+    """
+    lengths = _lengths(atree)
+    inside, outside = clade_sums(atree, dates, lengths)
+    branches = np.flatnonzero(atree.parent >= 0)
+
+    def evaluate(nodes, offsets):
+        # offsets: (len(nodes), k) distances above each node
+        sums = (_shift(inside[nodes][:, None, :], offsets)
+                + _shift(outside[nodes][:, None, :], -offsets))
+        slope, intercept, r2 = _regression(sums)
+        return np.where(slope > 0, r2, np.nan), slope, intercept
+
+    fractions = np.linspace(0.0, 1.0, points)
+    offsets = lengths[branches][:, None] * fractions
+    r2, _, _ = evaluate(branches, offsets)
+    branch_r2 = np.full(len(atree), np.nan)
+    found = ~np.isnan(r2).all(axis=1)
+    if not found.any():
+        raise ValueError('No root position gives a positive clock rate')
+    branch_r2[branches[found]] = np.nanmax(r2[found], axis=1)
+
+    best = int(np.nanargmax(branch_r2))
+    step = lengths[best] / max(points - 1, 1)
+    row = np.flatnonzero(branches == best)[0]
+    centre = offsets[row, np.nanargmax(r2[row])]
+    fine = np.clip(np.linspace(centre - step, centre + step, refine), 0.0, lengths[best])[None, :]
+    r2, slope, intercept = evaluate(np.array([best]), fine)
+    k = int(np.nanargmax(r2[0]))
+    return {
+        'node': best,
+        'distance': float(fine[0, k]),
+        'r2': float(r2[0, k]),
+        'rate': float(slope[0, k]),
+        'intercept': float(intercept[0, k]),
+        'branch_r2': branch_r2,
+    }
+
+
+def root_distances(atree, node, distance, index=None):
+    """Every tip's divergence from a root placed `distance` above `node`."""
+    lengths = _lengths(atree)
+    depth = atree.cumulative_from_root(lengths)
+    index = index or LCAIndex(atree)
+    tips = atree.tips
+    below = index.is_descendant(tips, np.full(len(tips), node))
+    lca = index.mrca_many(tips, np.full(len(tips), node))
+    return np.where(below, depth[tips] - depth[node] + distance,
+                    depth[tips] + depth[node] - 2 * depth[lca] - distance)
+
+
+def fit(atree, dates, reroot=False, points=11, index=None):
+    """Root-to-tip regression of `atree`'s tips on `dates` (aligned with `atree.tips`).
+
+    With `reroot`, the root is first moved to the branch position that
+    maximises R² (see `scan_roots`). The tree itself is not changed. Returns
+    the `wnv_trees.clock.root_to_tip` dict plus 'divergence' (every tip's
+    distance from the root used). With `reroot` it also holds 'root' (the
+    `scan_roots` result) and 'original_r2' (R² at the tree's own root).
+    `index` is an `LCAIndex` of `atree` to reuse when re-rooting.
+    """
+    dates = np.asarray(dates, dtype=float)
+    lengths = _lengths(atree)
+    divergence = atree.cumulative_from_root(lengths)[atree.tips]
+    original = root_to_tip(divergence, dates)
+    if not reroot:
+        return dict(original, divergence=divergence)
+    root = scan_roots(atree, dates, points=points)
+    divergence = root_distances(atree, root['node'], root['distance'], index)
+    return dict(root_to_tip(divergence, dates), divergence=divergence, root=root,
+                original_r2=original['r2'])
+
+
+def residual_table(atree, metadata, result, key='strain', threshold=OUTLIER_Z):
+    """One row per tip with its divergence, residual from the fitted line and outlier flag.
+
+    `result` is from `fit`. Columns: strain, Region, date, decimal_year,
+    divergence, expected (the point of the line nearest the tip's
+    divergence within its date interval, so a tip dated `YYYY-MM-XX` or
+    `YYYY-XX-XX` is only off the line by as much as its whole month or year
+    is), residual, clock_date (the date the line gives for the tip's
+    divergence), z (the residual over 1.4826 x the median absolute residual
+    of the fully dated tips) and outlier (|z| > `threshold`).
+    """
+    names = atree.names[atree.tips]
+    columns = [column for column in ('Region', 'date', 'decimal_year') if column in metadata]
+    table = join_tips(names, metadata, key=key, columns=columns)
+    dates = table['decimal_year'].astype(float)
+    if 'date' in metadata:
+        bounds = tip_dates(names, metadata, key=key)
+        lower, upper = bounds['lower'], bounds['upper']
+    else:
+        lower = upper = dates
+    line = np.sort([result['intercept'] + result['rate'] * lower,
+                    result['intercept'] + result['rate'] * upper], axis=0)
+    expected = np.clip(result['divergence'], line[0], line[1])
+    residual = result['divergence'] - expected
+    # Interval tips mostly sit on the line, so they would shrink the scale
+    exact = ~np.isnan(residual) & (lower == upper)
+    scale = residual[exact] if exact.sum() >= 2 else residual
+    spread = 1.4826 * np.nanmedian(np.abs(scale - np.nanmedian(scale)))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = residual / spread
+    out = pd.DataFrame({key: names})
+    for column in columns:
+        out[column] = table[column]
+    out['decimal_year'] = dates
+    out['divergence'] = result['divergence']
+    out['expected'] = expected
+    out['residual'] = residual
+    out['clock_date'] = (result['divergence'] - result['intercept']) / result['rate']
+    out['z'] = z
+    out['outlier'] = np.abs(z) > threshold
+    return out
+
+
+def plot_root_to_tip(table, result, ax=None, colours=None, label_outliers=10):
+    """Scatter of divergence against date, coloured by Region, with outliers ringed.
+
+    `colours` maps Region to colour (default: the figures' regional
+    palette, grey otherwise). The `label_outliers` worst outliers are
+    labelled with their strain. Returns the axes.
+    """
+    import matplotlib.pyplot as plt
+    from wnv_trees.figures import NE_COLOURS, REGION_COLORS
+
+    if ax is None:
+        _, ax = plt.subplots(figsize=(12, 8), facecolor='w')
+    colours = colours or {**REGION_COLORS, **NE_COLOURS}
+    dated = table[table['decimal_year'].notna()]
+    region = dated['Region'].astype(object) if 'Region' in dated else pd.Series('Other', index=dated.index)
+    for name in pd.unique(region):
+        rows = dated[region == name]
+        ax.scatter(rows['decimal_year'], rows['divergence'], s=18, alpha=0.7, linewidths=0,
+                   c=colours.get(name, '#999999'), label=f'{name} ({len(rows)})')
+
+    years = np.array([dated['decimal_year'].min(), dated['decimal_year'].max()])
+    ax.plot(years, result['intercept'] + result['rate'] * years, color='black', linewidth=1.5,
+            label=f"rate {result['rate']:.3g}/year, R² {result['r2']:.3f}")
+    outliers = dated[dated['outlier']]
+    ax.scatter(outliers['decimal_year'], outliers['divergence'], s=80, facecolors='none',
+               edgecolors='red', linewidths=1.5, label=f'Outliers ({len(outliers)})', zorder=5)
+    worst = outliers.reindex(outliers['z'].abs().sort_values(ascending=False).index)[:label_outliers]
+    for row in worst.itertuples():
+        ax.annotate(str(getattr(row, table.columns[0])), (row.decimal_year, row.divergence),
+                    xytext=(4, 4), textcoords='offset points', fontsize=8)
+
+    title = 'Root-to-tip regression'
+    if 'root' in result:
+        title += f" (best-fitting root, R² {result['original_r2']:.3f} at the original root)"
+    ax.set_title(title, fontsize=14, fontweight='bold')
+    ax.set_xlabel('Sampling date', fontsize=12)
+    ax.set_ylabel('Nucleotide Divergence from Root', fontsize=12)
+    ax.grid(alpha=0.3)
+    ax.legend(fontsize=9, loc='upper left')
+    return ax
@@ -0,0 +1,130 @@
+"""An index of tip names for fast prefix, pattern and set queries.
+
+Selecting tips has meant list comprehensions like `'UNMC' in str(strain)`
+over every tip, or rebuilding a set of tip names from `tree.Objects` to
+intersect with a hand-built highlight set. A `TipIndex` is built once per
+tree: the names in tip order, the same names sorted (for prefix ranges by
+binary search) and a dict from name to tip position. Every query returns a
+boolean mask over the tips in drawing order, which `indices` turns into
+positions and `nodes` into the tips themselves.
+"""
+import fnmatch
+import re
+
+import numpy as np
+import pandas as pd
+
+_GLOB_CHARS = re.compile(r'[*?\[]')
+
+
+class TipIndex:
+    """Tip names indexed for exact, prefix, glob, regex and set queries.
+
+    `names` are the tip names in drawing order; `nodes` (optional) are the
+    matching baltic leaves or `ArrayTree` node indices, returned by `nodes`.
+    """
+
+    def __init__(self, names, nodes=None):
+        self.names = np.asarray([str(name) for name in names], dtype=object)
+        self.tip_nodes = nodes
+        text = self.names.astype(str)
+        self._order = np.argsort(text, kind='stable')
+        self._sorted = text[self._order]
+        self._position = {name: i for i, name in enumerate(self.names)}
+
+    @classmethod
+    def from_tree(cls, tree):
+        """Index the leaves of a baltic tree, in `tree.Objects` order."""
+        tips = [k for k in tree.Objects if k.branchType == 'leaf']
+        return cls([k.name for k in tips], tips)
+
+    @classmethod
+    def from_array_tree(cls, atree):
+        """Index the tips of an `ArrayTree`; `nodes` gives their node indices."""
+        tips = atree.tips
+        return cls(atree.names[tips], tips)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._position
+
+    def position(self, name):
+        """Tip position of `name`, or -1 if no tip has that name."""
+        return self._position.get(name, -1)
+
+    def positions(self, names):
+        """Tip positions of several names as an int array, -1 where absent."""
+        lookup = self._position
+        return np.fromiter((lookup.get(name, -1) for name in names), dtype=np.int64)
+
+    def _mask(self, positions):
+        mask = np.zeros(len(self), dtype=bool)
+        mask[positions] = True
+        return mask
+
+    def isin(self, names):
+        """Mask of the tips whose name is in `names`."""
+        positions = self.positions(names)
+        return self._mask(positions[positions >= 0])
+
+    def missing(self, names):
+        """The names in `names` that are not tips, e.g. highlights absent from the tree."""
+        return [name for name in names if name not in self._position]
+
+    def _prefix_range(self, prefix):
+        low = np.searchsorted(self._sorted, prefix, side='left')
+        # Every name starting with `prefix` sorts below prefix + the highest code point
+        high = np.searchsorted(self._sorted, prefix + '\U0010ffff', side='left')
+        return low, high
+
+    def prefix(self, prefix):
+        """Mask of the tips whose name starts with `prefix`, by binary search."""
+        low, high = self._prefix_range(prefix)
+        return self._mask(self._order[low:high])
+
+    def search(self, pattern, flags=0):
+        """Mask of the tips whose name contains a match for regular expression `pattern`."""
+        names = pd.Series(self.names, dtype=object)
+        return names.str.contains(pattern, flags=flags, regex=True).to_numpy(dtype=bool)
+
+    def glob(self, pattern):
+        """Mask of the tips whose whole name matches shell-style `pattern` (`UNMC*`)."""
+        literal = _GLOB_CHARS.split(pattern, maxsplit=1)[0]
+        if literal == pattern:
+            return self.isin([pattern])
+        # Only names starting with the pattern's literal head can match
+        low, high = self._prefix_range(literal)
+        candidates = self._order[low:high]
+        regex = re.compile(fnmatch.translate(pattern))
+        hits = [i for i, name in zip(candidates, self._sorted[low:high]) if regex.match(name)]
+        return self._mask(np.asarray(hits, dtype=np.int64))
+
+    def select(self, queries):
+        """Mask of the tips matching any of `queries`: exact names or glob patterns."""
+        if isinstance(queries, str):
+            queries = [queries]
+        queries = list(queries)
+        exact = [query for query in queries if not _GLOB_CHARS.search(query)]
+        mask = self.isin(exact)
+        for query in queries:
+            if _GLOB_CHARS.search(query):
+                mask |= self.glob(query)
+        return mask
+
+    def indices(self, mask):
+        """Tip positions selected by `mask`."""
+        return np.flatnonzero(mask)
+
+    def nodes(self, mask):
+        """The tips selected by `mask`: baltic leaves, or `ArrayTree` node indices."""
+        if self.tip_nodes is None:
+            raise ValueError('This index was built without nodes')
+        if isinstance(self.tip_nodes, np.ndarray):
+            return self.tip_nodes[mask]
+        return [node for node, keep in zip(self.tip_nodes, mask) if keep]
+
+    def selected_names(self, mask):
+        """The names of the tips selected by `mask`, as a set."""
+        return set(self.names[mask])
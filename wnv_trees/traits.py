@@ -0,0 +1,158 @@
+"""Join metadata to the tree's tips and evaluate colour/size rules as arrays.
+
+The scripts build a `dict(zip(metadata['strain'], ...))` per column and then
+walk `tree.Objects`, looking each tip up and running an if/elif chain to
+pick its colour and size. `join_tips` instead aligns the metadata table to
+a list of tip names with one indexed lookup, and `style_tips` evaluates a
+list of declarative rules over the joined columns with numpy, producing
+RGBA, size, edge, z-order and rasterization arrays that `draw_tips` takes
+directly. Both are linear in the number of tips and rows.
+
+A rule is a dict. Its match conditions are all optional and combined with
+AND:
+
+- 'members': a set of strain names
+- 'column' with 'colours': the tip's value in that column is a key of the
+  category -> colour map, which also gives the colour
+- 'column' with 'values': the tip's value is one of these
+- 'years': a year, or an inclusive (first, last) range, of the 'year' column
+
+Its style keys are 'colour', 'size', 'alpha', 'edgecolor', 'linewidth',
+'zorder' and 'rasterized'. Rules are tried in order and the first match
+wins, as in an if/elif chain; tips no rule matches get the `default` style.
+"""
+import numpy as np
+import pandas as pd
+import matplotlib.colors as mcolors
+
+STYLE_DEFAULTS = {
+    'colour': '#BBBBBB',
+    'size': 40,
+    'alpha': None,
+    'edgecolor': 'none',
+    'linewidth': 0.0,
+    'zorder': 20001,
+    'rasterized': False,
+}
+
+
+def join_tips(names, metadata, key='strain', columns=None):
+    """Align `metadata` rows to tip `names` with a single indexed lookup.
+
+    Returns a dict with 'names' (object array), 'row' (the metadata row of
+    every tip, -1 when it has none), 'matched' (bool), 'unmatched' (the tip
+    names with no metadata row) and 'unused' (the number of metadata rows
+    whose strain is not a tip), plus one tip-aligned object array per column
+    in `columns` (default: every column but `key`), None where unmatched.
+    Repeated strains use their last row, as `dict(zip(...))` does.
+    """
+    names = np.asarray(names, dtype=object)
+    metadata = metadata.drop_duplicates(subset=key, keep='last')
+    index = pd.Index(metadata[key])
+    row = index.get_indexer(names)
+    matched = row >= 0
+
+    if columns is None:
+        columns = [column for column in metadata.columns if column != key]
+    table = {
+        'names': names,
+        'row': row,
+        'matched': matched,
+        'unmatched': names[~matched].tolist(),
+        'unused': int(len(index) - len(np.unique(row[matched]))),
+    }
+    for column in columns:
+        values = metadata[column].to_numpy(dtype=object)
+        # Row -1 picks the trailing None
+        table[column] = np.append(values, None)[row]
+    return table
+
+
+def _isin(values, allowed):
+    return pd.Series(values, dtype=object).isin(list(allowed)).to_numpy()
+
+
+def rule_mask(table, rule):
+    """Boolean mask of the tips in `table` that match `rule`'s conditions."""
+    mask = np.ones(len(table['names']), dtype=bool)
+    if 'members' in rule:
+        mask &= _isin(table['names'], rule['members'])
+    if 'colours' in rule:
+        mask &= _isin(table[rule['column']], rule['colours'])
+    if 'values' in rule:
+        mask &= _isin(table[rule['column']], rule['values'])
+    if 'years' in rule:
+        years = table['year'].astype(float)
+        first, last = rule['years'] if np.ndim(rule['years']) else (rule['years'], rule['years'])
+        mask &= (years >= first) & (years <= last)
+    return mask
+
+
+def _rgba(colour, alpha):
+    rgba = np.array(mcolors.to_rgba(colour))
+    # 'none' stays fully transparent whatever alpha is requested
+    if alpha is not None and rgba[3] > 0:
+        rgba[3] = alpha
+    return rgba
+
+
+def style_tips(table, rules, default=None):
+    """Evaluate `rules` over a `join_tips` table into per-tip drawing arrays.
+
+    Returns a dict with 'rgba' and 'edge_rgba' ((n, 4) float arrays),
+    'size', 'linewidth' and 'zorder' (float), 'rasterized' (bool), 'rule'
+    (index of the matching rule, -1 for the default) and 'counts' (tips per
+    rule, keyed by each rule's 'name' or index, plus 'default').
+    """
+    style = dict(STYLE_DEFAULTS, **(default or {}))
+    n = len(table['names'])
+    out = {
+        'rgba': np.tile(_rgba(style['colour'], style['alpha']), (n, 1)),
+        'edge_rgba': np.tile(_rgba(style['edgecolor'], style['alpha']), (n, 1)),
+        'size': np.full(n, style['size'], dtype=float),
+        'linewidth': np.full(n, style['linewidth'], dtype=float),
+        'zorder': np.full(n, style['zorder'], dtype=float),
+        'rasterized': np.full(n, style['rasterized'], dtype=bool),
+        'rule': np.full(n, -1, dtype=np.int32),
+    }
+    free = np.ones(n, dtype=bool)
+    counts = {}
+    for i, rule in enumerate(rules):
+        mask = free & rule_mask(table, rule)
+        free &= ~mask
+        counts[rule.get('name', i)] = int(mask.sum())
+        if not mask.any():
+            continue
+        rule_style = dict(STYLE_DEFAULTS,
+                          **{key: value for key, value in rule.items() if key in STYLE_DEFAULTS})
+        if 'colours' in rule:
+            # Category -> colour lookup: one RGBA row per category, indexed by code
+            categories = list(rule['colours'])
+            palette = np.array([_rgba(rule['colours'][category], rule_style['alpha'])
+                                for category in categories])
+            out['rgba'][mask] = palette[pd.Index(categories).get_indexer(table[rule['column']][mask])]
+        else:
+            out['rgba'][mask] = _rgba(rule_style['colour'], rule_style['alpha'])
+        out['edge_rgba'][mask] = _rgba(rule_style['edgecolor'], rule_style['alpha'])
+        for key in ('size', 'linewidth', 'zorder', 'rasterized'):
+            out[key][mask] = rule_style[key]
+        out['rule'][mask] = i
+    counts['default'] = int(free.sum())
+    out['counts'] = counts
+    return out
+
+
+def annotate_tips(names, metadata, rules, default=None, key='strain', verbose=False):
+    """Join `metadata` to tip `names` and style them with `rules` in one call.
+
+    Returns the `style_tips` arrays plus 'table', the `join_tips` result;
+    with `verbose` the number (and first few) of unmatched strains is printed.
+    """
+    table = join_tips(names, metadata, key=key)
+    styles = style_tips(table, rules, default)
+    styles['table'] = table
+    if verbose and table['unmatched']:
+        shown = ', '.join(map(str, table['unmatched'][:5]))
+        more = '...' if len(table['unmatched']) > 5 else ''
+        print(f"{len(table['unmatched'])} of {len(names)} tips have no metadata row: {shown}{more}")
+    return styles
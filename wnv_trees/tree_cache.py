@@ -0,0 +1,278 @@
+"""Content-addressed on-disk cache for parsed Newick trees.
+
+`bt.loadNewick` parses the Newick text character by character and then lays
+the tree out with `drawTree`, which together dominate start-up time on large
+trees. `load_tree` keys a cache entry on the SHA-256 of the file's contents
+and stores the parsed tree (topology, branch lengths, names, node traits and
+the baltic layout) as flat numpy arrays in an .npz file. A later load of the
+same bytes rebuilds the baltic objects straight from those arrays.
+
+The cache directory is bounded in size; the least recently used entries are
+evicted first.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+
+import baltic as bt
+import numpy as np
+
+# Bump when the on-disk layout changes so stale entries are ignored
+CACHE_VERSION = 3
+DEFAULT_CACHE_DIR = os.environ.get('WNV_TREES_CACHE',
+                                   os.path.join(os.path.expanduser('~'), '.cache', 'wnv_trees'))
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of the file at `path`."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def pack_strings(strings):
+    """Pack a list of strings into one NUL-separated UTF-8 byte buffer.
+
+    Joining and splitting whole buffers keeps packing and unpacking at C speed
+    even for millions of strings.
+    """
+    strings = list(strings)
+    joined = '\x00'.join(strings)
+    if joined.count('\x00') != max(len(strings) - 1, 0):
+        raise ValueError('Cannot pack strings that contain NUL characters')
+    return np.frombuffer(joined.encode('utf-8'), dtype=np.uint8)
+
+
+def unpack_strings(buffer, count):
+    """Inverse of `pack_strings`; `count` is the number of packed strings."""
+    if count == 0:
+        return []
+    return buffer.tobytes().decode('utf-8').split('\x00')
+
+
+def cache_subdir(cache_dir, kind):
+    """Directory holding cache entries of one `kind` ('trees', 'metadata')."""
+    return os.path.join(cache_dir or DEFAULT_CACHE_DIR, kind)
+
+
+def _entry_path(cache_dir, digest):
+    return os.path.join(cache_subdir(cache_dir, 'trees'), f'{digest}-v{CACHE_VERSION}.npz')
+
+
+def _none_to_nan(value):
+    return np.nan if value is None else value
+
+
+def _nan_to_none(value):
+    return None if np.isnan(value) else float(value)
+
+
+def tree_to_arrays(tree):
+    """Flatten a loaded baltic tree into a dict of numpy arrays.
+
+    Objects are stored in pre-order following each node's (sorted) children,
+    so rebuilding in array order restores the same child order. 'objects'
+    holds the pre-order position of each entry of `tree.Objects`, so the
+    rebuilt tree keeps loadNewick's parse order there too.
+    """
+    order = []
+    stack = [tree.root]
+    while stack:
+        k = stack.pop()
+        order.append(k)
+        if k.branchType != 'leaf':
+            stack.extend(reversed(k.children))
+    position = {id(k): i for i, k in enumerate(order)}
+
+    n = len(order)
+    is_leaf = np.array([k.branchType == 'leaf' for k in order], dtype=bool)
+    parent = np.array([position.get(id(k.parent), -1) for k in order], dtype=np.int32)
+    y_range = np.full((n, 2), np.nan)
+    for i, k in enumerate(order):
+        if hasattr(k, 'yRange'):
+            y_range[i] = k.yRange
+    names = pack_strings([k.name if is_leaf[i] else '' for i, k in enumerate(order)])
+    with_traits = [i for i, k in enumerate(order) if k.traits]
+    traits = pack_strings([json.dumps(order[i].traits) for i in with_traits])
+
+    return {
+        'parent': parent,
+        'is_leaf': is_leaf,
+        'index': np.array([k.index for k in order], dtype=np.int64),
+        'objects': np.array([position[id(k)] for k in tree.Objects], dtype=np.int64),
+        'length': np.array([_none_to_nan(k.length) for k in order], dtype=float),
+        'height': np.array([_none_to_nan(k.height) for k in order], dtype=float),
+        'x': np.array([_none_to_nan(k.x) for k in order], dtype=float),
+        'y': np.array([_none_to_nan(k.y) for k in order], dtype=float),
+        'y_range': y_range,
+        'names': names,
+        'trait_nodes': np.array(with_traits, dtype=np.int64),
+        'traits': traits,
+        'tree_height': np.array(tree.treeHeight, dtype=float),
+        'y_span': np.array(tree.ySpan, dtype=float),
+    }
+
+
+def arrays_to_tree(arrays):
+    """Rebuild a baltic tree, including its drawTree layout, from `tree_to_arrays` output.
+
+    Without an 'objects' entry `tree.Objects` is left in pre-order.
+    """
+    tree = bt.tree()
+    parent = arrays['parent']
+    names = unpack_strings(arrays['names'], len(parent))
+    is_leaf = arrays['is_leaf']
+    index, length, height = arrays['index'], arrays['length'], arrays['height']
+    x, y, y_range = arrays['x'], arrays['y'], arrays['y_range']
+
+    objects = []
+    for i in range(len(parent)):
+        if is_leaf[i]:
+            k = bt.leaf()
+            k.name = names[i]
+        else:
+            k = bt.node()
+            if not np.isnan(y_range[i, 0]):
+                k.yRange = [float(y_range[i, 0]), float(y_range[i, 1])]
+        k.index = int(index[i])
+        k.length = _nan_to_none(length[i])
+        k.height = _nan_to_none(height[i])
+        k.x = _nan_to_none(x[i])
+        k.y = _nan_to_none(y[i])
+        if parent[i] >= 0:
+            k.parent = objects[parent[i]]
+            k.parent.children.append(k)
+        objects.append(k)
+
+    for i, encoded in zip(arrays['trait_nodes'], unpack_strings(arrays['traits'], len(arrays['trait_nodes']))):
+        objects[i].traits = json.loads(encoded)
+
+    # Descendant tip sets and youngest descendant height, as traverse_tree sets them
+    for k in reversed(objects):
+        if k.branchType == 'leaf':
+            continue
+        leaves = set()
+        child_height = None
+        for child in k.children:
+            if child.branchType == 'leaf':
+                leaves.add(child.name)
+                child_max = child.height
+            else:
+                leaves.update(child.leaves)
+                child_max = child.childHeight
+            if child_max is not None and (child_height is None or child_max > child_height):
+                child_height = child_max
+        k.leaves = leaves
+        k.childHeight = child_height
+
+    # loadNewick leaves the root hanging off the tree's placeholder 'Root' node
+    tree.root = objects[0]
+    tree.root.parent = tree.cur_node
+    tree.cur_node.children.append(tree.root)
+    if tree.root.branchType != 'leaf':
+        tree.cur_node.leaves = set(tree.root.leaves)
+    tree.cur_node = tree.root
+    tree.Objects = [objects[i] for i in arrays['objects']] if 'objects' in arrays else objects
+    tree.treeHeight = float(arrays['tree_height'])
+    tree.ySpan = float(arrays['y_span'])
+    return tree
+
+
+def save_arrays(path, arrays):
+    """Atomically write a dict of arrays to an .npz file at `path`."""
+    # Write to a temporary file first so a crash never leaves a truncated entry
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    handle, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as out:
+            np.savez(out, **arrays)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def cache_entries(cache_dir=None, kind='trees'):
+    """Return (path, size, last_used) for every cache entry, least recently used first."""
+    entry_dir = cache_subdir(cache_dir, kind)
+    if not os.path.isdir(entry_dir):
+        return []
+    entries = []
+    for name in os.listdir(entry_dir):
+        if name.endswith('.npz'):
+            path = os.path.join(entry_dir, name)
+            stat = os.stat(path)
+            entries.append((path, stat.st_size, stat.st_mtime))
+    return sorted(entries, key=lambda entry: entry[2])
+
+
+def evict(cache_dir=None, max_bytes=DEFAULT_MAX_BYTES, kind='trees'):
+    """Delete least recently used entries until the cache fits in `max_bytes`.
+
+    Returns the list of removed paths.
+    """
+    entries = cache_entries(cache_dir, kind)
+    total = sum(size for _, size, _ in entries)
+    removed = []
+    for path, size, _ in entries:
+        if total <= max_bytes:
+            break
+        os.remove(path)
+        total -= size
+        removed.append(path)
+    return removed
+
+
+def invalidate(tree_path=None, cache_dir=None):
+    """Remove the cache entry for `tree_path`, or every entry if it is None.
+
+    Returns the number of entries removed.
+    """
+    if tree_path is None:
+        paths = [path for path, _, _ in cache_entries(cache_dir)]
+    else:
+        paths = [_entry_path(cache_dir, file_digest(tree_path))]
+    removed = 0
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+def load_tree(tree_path, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES, use_cache=True, verbose=False):
+    """Load a Newick tree with `bt.loadNewick`, going through the on-disk cache.
+
+    The result is equivalent to `bt.loadNewick(tree_path)`: branches sorted
+    and `drawTree` coordinates assigned. Pass `use_cache=False` to bypass the
+    cache entirely.
+    """
+    if not use_cache:
+        return bt.loadNewick(tree_path)
+
+    digest = file_digest(tree_path)
+    path = _entry_path(cache_dir, digest)
+    if os.path.exists(path):
+        try:
+            with np.load(path) as data:
+                tree = arrays_to_tree({name: data[name] for name in data.files})
+            os.utime(path)  # mark as recently used for eviction
+            if verbose:
+                print(f"Loaded {tree_path} from tree cache ({digest[:12]})")
+            return tree
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            # Unreadable entry: drop it and fall through to a fresh parse
+            os.remove(path)
+
+    tree = bt.loadNewick(tree_path)
+    save_arrays(path, tree_to_arrays(tree))
+    evict(cache_dir, max_bytes)
+    if verbose:
+        print(f"Parsed {tree_path} and cached it ({digest[:12]})")
+    return tree